@@ -0,0 +1,455 @@
+"""
+Benchmarks for fretty's hot paths, compared against tracked baselines.
+
+    python -m benchmarks.bench --save-baseline   # record this machine's numbers as its baseline
+    python -m benchmarks.bench                   # run everything, compare with the baseline
+    python -m benchmarks.bench -k state          # only benchmarks whose name contains "state"
+
+Each benchmark's setup runs before every repeat and is not timed. Results
+are written as JSON; a benchmark whose best time is more than its threshold
+times the baseline's best time counts as a regression and the run exits
+with 1. The best time is compared because it is the least noisy.
+
+Baselines live in benchmarks/baselines/ and are committed. Each machine
+records its own (named after platform.node()) and is compared against it
+with the per-benchmark thresholds. A machine without one is compared
+against reference.json, with timings allowed CROSS_MACHINE_THRESHOLD of
+slack, so a fresh checkout still catches gross slowdowns. Refresh the
+reference with --save-baseline --baseline benchmarks/baselines/reference.json.
+Detection benchmarks also report accuracy on a synthetic corpus (see
+fretty.synth). Accuracy doesn't depend on the machine, and losing more
+than ACCURACY_TOLERANCE of it is a regression against any baseline.
+"""
+import os
+import re
+import sys
+import json
+import glob
+import time
+import itertools
+import shutil
+import argparse
+import platform
+import statistics
+import tempfile
+from array import array
+from datetime import date, timedelta
+
+import numpy as np
+
+REPO_DIRPATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINES_DIRPATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines")
+REFERENCE_FILEPATH = os.path.join(BASELINES_DIRPATH, "reference.json")
+SAMPLES_GLOB = os.path.join(REPO_DIRPATH, "samples", "*.wav")
+
+REPEAT = 5
+THRESHOLD = 1.25
+CROSS_MACHINE_THRESHOLD = 4.0   # timing slack against a baseline recorded on another machine
+HISTORY_SIZES = [10**2, 10**4, 10**6]
+CALENDAR_SIZE = 2000
+SYNTH_VARIATIONS = 4
+ACCURACY_TOLERANCE = 0.02
+
+BENCHMARKS = {}     # name -> (setup, repeat, threshold)
+
+_tmp_dirpath = None
+_tmp_counter = itertools.count()
+
+
+def benchmark(name, repeat=REPEAT, threshold=THRESHOLD):
+    """Registers `setup`, which prepares one repeat and returns the callable to time."""
+    def register(setup):
+        BENCHMARKS[name] = (setup, repeat, threshold)
+        return setup
+    return register
+
+
+def get_tmp_dirpath():
+    global _tmp_dirpath
+    if _tmp_dirpath is None:
+        _tmp_dirpath = tempfile.mkdtemp(prefix="fretty-bench-")
+    return _tmp_dirpath
+
+
+def get_tmp_filepath(name):
+    return os.path.join(get_tmp_dirpath(), f"{name}_{next(_tmp_counter)}")
+
+
+# ---------------------------------------------------------------- audio
+
+
+def make_peak_sets(n=200, seed=0):
+    """Harmonic series with slight inharmonicity, plus a few spurious peaks."""
+    rng = np.random.default_rng(seed)
+    peak_sets = []
+    for _ in range(n):
+        f0 = rng.uniform(80, 1000)
+        harmonics = f0 * np.arange(1, int(2000 // f0) + 1) * rng.normal(1, 0.002)
+        spurious = rng.uniform(70, 2000, rng.integers(0, 4))
+        peaks = np.concatenate([harmonics, spurious])
+        peak_sets.append((peaks, rng.uniform(0.1, 1.0, len(peaks))))
+    return peak_sets
+
+
+def read_sample_windows(duration=0.5, offset=0.1):
+    from scipy.io import wavfile
+
+    windows = []
+    for filepath in sorted(glob.glob(SAMPLES_GLOB)):
+        sample_rate, data = wavfile.read(filepath)
+        if data.ndim > 1:
+            data = data[:, 0]
+        data = data.astype(np.float32) / np.iinfo(data.dtype).max
+        start = int(offset * sample_rate)
+        windows.append((data[start:start + int(duration * sample_rate)], sample_rate))
+    return windows
+
+
+@benchmark("estimate_fundamental[200 peak sets]")
+def setup_estimate_fundamental():
+    from fretty.audio import estimate_fundamental
+
+    peak_sets = make_peak_sets()
+    def run():
+        for peaks, power in peak_sets:
+            estimate_fundamental(peaks, power)
+    return run
+
+
+@benchmark("classify_note[1000 freqs]")
+def setup_classify_note():
+    from fretty.audio import classify_note
+
+    freqs = np.random.default_rng(0).uniform(70, 1000, 1000).tolist()
+    def run():
+        for freq in freqs:
+            classify_note(freq)
+    return run
+
+
+@benchmark("listen_analysis[samples/*.wav]")
+def setup_listen_analysis():
+    from fretty.audio import analyse_segment
+
+    windows = read_sample_windows()
+    def run():
+        for segment, sample_rate in windows:
+            analyse_segment(segment, sample_rate)
+    return run
+
+
+@benchmark("listen_analysis[samples/*.wav, batch]")
+def setup_listen_analysis_batch():
+    from fretty.audio import analyse_segments
+
+    windows = read_sample_windows()
+    stacks = {}
+    for segment, sample_rate in windows:
+        stacks.setdefault((sample_rate, len(segment)), []).append(segment)
+    stacks = [(np.stack(segments), sample_rate) for (sample_rate, _), segments in stacks.items()]
+    def run():
+        for segments, sample_rate in stacks:
+            analyse_segments(segments, sample_rate)
+    return run
+
+
+_corpora = {}
+
+
+def get_corpus(instrument):
+    """Synthetic clips of every spot on the neck, rendered once per run."""
+    if instrument not in _corpora:
+        from fretty.synth import generate_corpus
+
+        _corpora[instrument] = generate_corpus(instrument, SYNTH_VARIATIONS, seed=0)
+    return _corpora[instrument]
+
+
+for instrument in ["guitar", "bass"]:
+    @benchmark(f"detect_synthetic[{instrument}, whole neck]", repeat=5, threshold=1.5)
+    def setup_detect_synthetic(instrument=instrument):
+        from fretty.synth import evaluate, summarise
+
+        clips, labels = get_corpus(instrument)
+        def run():
+            detected, _ = evaluate(clips, labels, instrument)
+            return {"accuracy": summarise(labels, detected)[0], "clips": len(labels)}
+        return run
+
+    @benchmark(f"detect_synthetic[{instrument}, whole neck, template]", repeat=5, threshold=1.5)
+    def setup_detect_synthetic_template(instrument=instrument):
+        from fretty.synth import evaluate, summarise
+
+        clips, labels = get_corpus(instrument)
+        evaluate(clips[:1], labels[:1], instrument, detector="template")  # builds the template matrix
+        def run():
+            detected, _ = evaluate(clips, labels, instrument, detector="template")
+            return {"accuracy": summarise(labels, detected)[0], "clips": len(labels)}
+        return run
+
+
+# ---------------------------------------------------------------- state
+
+
+def make_fretboard(history_rows=0, seed=0):
+    from fretty.fretboard import Fretboard
+    from fretty.history import COLUMNS, RATINGS, STATUSES
+
+    fretboard = Fretboard()
+    rng = np.random.default_rng(seed)
+    values = {
+        "spot": rng.integers(0, len(fretboard.spots) * len(fretboard.spots[0]), history_rows),
+        "timestamp": 1.7e9 + np.arange(history_rows, dtype=np.float64),
+        "reaction_time": rng.uniform(0.5, 5.0, history_rows),
+        "rating": rng.integers(0, len(RATINGS), history_rows),
+        "status": rng.integers(0, len(STATUSES), history_rows),
+    }
+    for name, code in COLUMNS.items():
+        fretboard.history.columns[name] = array(code, values[name].astype(np.dtype(code)).tobytes())
+    return fretboard
+
+
+for n in HISTORY_SIZES:
+    # fsync bound, so noisier than the rest
+    @benchmark(f"write_state[{n} history rows]", threshold=1.5)
+    def setup_write_state(n=n):
+        fretboard = make_fretboard(n)
+        state_filepath = get_tmp_filepath("write_state") + ".json"
+        return lambda: fretboard.write_state(state_filepath)
+
+    @benchmark(f"read_state[{n} history rows]", threshold=1.5)
+    def setup_read_state(n=n):
+        from fretty.fretboard import Fretboard
+
+        state_filepath = os.path.join(get_tmp_dirpath(), f"read_state_{n}.json")
+        if not os.path.exists(state_filepath):
+            make_fretboard(n).write_state(state_filepath)
+        def run():
+            fretboard = Fretboard(state_filepath=state_filepath)
+            fretboard.history.load()
+        return run
+
+
+# ---------------------------------------------------------------- scheduling
+
+
+def make_calendar_spots(fretboard, n):
+    """Extra spots (on strings past the real ones) so the calendar can be made large."""
+    from fretty.fretboard import FretboardSpot
+    from fretty.globals import NUM_STRINGS, NUM_FRETS
+
+    return [FretboardSpot(fretboard, NUM_STRINGS + i // NUM_FRETS, i % NUM_FRETS + 1, "E2") for i in range(n)]
+
+
+def fill_calendar(fretboard, spots, start):
+    from fretty.globals import MAX_DAILY_REVIEWS
+
+    for i, spot in enumerate(spots):
+        review_date = start + timedelta(days=i // MAX_DAILY_REVIEWS)
+        fretboard.review_date_to_spots.setdefault(review_date, []).append(spot)
+        fretboard.spot_to_review_date[spot] = review_date
+
+
+@benchmark(f"add_review[{CALENDAR_SIZE} spots]")
+def setup_add_review():
+    fretboard = make_fretboard()
+    spots = make_calendar_spots(fretboard, CALENDAR_SIZE)
+    def run():
+        for spot in spots:
+            fretboard.add_review(spot, 1)
+    return run
+
+
+@benchmark(f"push_back_reviews[{CALENDAR_SIZE} spots]", repeat=20)
+def setup_push_back_reviews():
+    fretboard = make_fretboard()
+    fill_calendar(fretboard, make_calendar_spots(fretboard, CALENDAR_SIZE), date.today() - timedelta(days=30))
+    return fretboard.push_back_reviews
+
+
+_lesson_page = None
+
+
+def get_lesson_page():
+    """One headless NoteToFret page, reused so only create_lesson itself is timed."""
+    global _lesson_page
+    if _lesson_page is None:
+        from fretty.headless import HeadlessScreen, headless_curses
+        from fretty.pages.loop import EventLoop
+        from fretty.pages.note_to_fret import NoteToFret
+
+        screen = HeadlessScreen()
+        with headless_curses():
+            _lesson_page = NoteToFret(screen, make_fretboard(), loop=EventLoop(screen, input_fd=screen.fileno()))
+    return _lesson_page
+
+
+@benchmark(f"create_lesson[{CALENDAR_SIZE} spot calendar]", repeat=20)
+def setup_create_lesson():
+    fretboard = make_fretboard()
+    fill_calendar(fretboard, make_calendar_spots(fretboard, CALENDAR_SIZE), date.today() - timedelta(days=30))
+    page = get_lesson_page()
+    page.fretboard = fretboard
+    return page.create_lesson
+
+
+# ---------------------------------------------------------------- ui
+
+
+@benchmark("headless_lesson", repeat=3, threshold=1.5)
+def setup_headless_lesson():
+    from fretty.headless import ReplayAudioSource, run_headless_lesson
+
+    fretboard = make_fretboard()
+    fretboard.state_filepath = get_tmp_filepath("lesson") + ".json"
+    silence = ReplayAudioSource(np.zeros(1, dtype=np.float32), 44100)
+
+    def answers(page):
+        # the first letter of a natural note is the key that answers it
+        return [(0.05, lambda: page.curr_spot.get_note()[0])] * 500
+
+    return lambda: run_headless_lesson(fretboard, answers, audio_source=silence, auto_advance=True, time_limit=60)
+
+
+# ---------------------------------------------------------------- runner
+
+
+def run_benchmark(name, repeat=None):
+    setup, default_repeat, _ = BENCHMARKS[name]
+    times = []
+    for _ in range(repeat or default_repeat):
+        run = setup()
+        start = time.perf_counter()
+        metrics = run()
+        times.append(time.perf_counter() - start)
+    result = {
+        "median": statistics.median(times),
+        "min": min(times),
+        "repeat": len(times),
+    }
+    if isinstance(metrics, dict):
+        result.update(metrics)
+    return result
+
+
+def get_machine():
+    return re.sub(r"[^\w.-]", "_", platform.node()) or "unknown"
+
+
+def get_machine_baseline_filepath():
+    return os.path.join(BASELINES_DIRPATH, f"{get_machine()}.json")
+
+
+def compare(results, baseline, cross_machine=False):
+    """Adds the baseline ratio to each result. Returns the names that regressed."""
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get("results", {}).get(name, None)
+        if base is None or "min" not in result:
+            continue
+        threshold = BENCHMARKS[name][2]
+        if cross_machine:
+            threshold = max(threshold, CROSS_MACHINE_THRESHOLD)
+        result["baseline_min"] = base["min"]
+        result["ratio"] = result["min"] / base["min"]
+        result["threshold"] = threshold
+        if result["ratio"] > threshold:
+            regressions.append(name)
+        elif "accuracy" in base and result["accuracy"] < base["accuracy"] - ACCURACY_TOLERANCE:
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="benchmarks.bench")
+    parser.add_argument("-k", dest="pattern", default=None, help="only run benchmarks whose name contains this")
+    parser.add_argument("--repeat", type=int, default=None, help="override every benchmark's repeat count")
+    parser.add_argument("--output", default=None, help="write results as JSON to this file")
+    parser.add_argument("--baseline", default=None,
+                        help="baseline file (default: this machine's, or reference.json to compare with)")
+    parser.add_argument("--save-baseline", action="store_true", help="store these results as the new baseline")
+    args = parser.parse_args()
+
+    names = [name for name in BENCHMARKS if args.pattern is None or args.pattern in name]
+    results = {}
+    try:
+        for name in names:
+            try:
+                results[name] = run_benchmark(name, args.repeat)
+            except ImportError as e:
+                results[name] = {"skipped": str(e)}
+            print(f"{name:<48} {format_result(results[name])}", flush=True)
+    finally:
+        if _tmp_dirpath is not None:
+            shutil.rmtree(_tmp_dirpath, ignore_errors=True)
+
+    report = {
+        "meta": {
+            "date": date.today().isoformat(),
+            "machine": get_machine(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "numpy": np.__version__,
+        },
+        "results": results,
+    }
+
+    regressions = []
+    status = 0
+    if args.save_baseline:
+        baseline_filepath = args.baseline or get_machine_baseline_filepath()
+        baseline = {"meta": report["meta"], "results": {}}
+        if os.path.exists(baseline_filepath):
+            with open(baseline_filepath, 'r') as file:
+                baseline = json.load(file)
+        baseline["meta"] = report["meta"]
+        baseline["results"].update({name: result for name, result in results.items() if "median" in result})
+        os.makedirs(os.path.dirname(os.path.abspath(baseline_filepath)), exist_ok=True)
+        with open(baseline_filepath, 'w') as file:
+            json.dump(baseline, file, indent=2, sort_keys=True)
+            file.write("\n")
+        print(f"baseline written to {baseline_filepath}")
+    else:
+        baseline_filepath = args.baseline
+        if baseline_filepath is None:
+            baseline_filepath = get_machine_baseline_filepath()
+            if not os.path.exists(baseline_filepath):
+                baseline_filepath = REFERENCE_FILEPATH
+        baseline = None
+        if os.path.exists(baseline_filepath):
+            with open(baseline_filepath, 'r') as file:
+                baseline = json.load(file)
+        if baseline is None:
+            print(f"no baseline at {baseline_filepath}; record one with --save-baseline before comparing")
+            status = 2
+        else:
+            cross_machine = (os.path.abspath(baseline_filepath) == REFERENCE_FILEPATH
+                             or baseline["meta"].get("machine") != report["meta"]["machine"])
+            if cross_machine:
+                print(f"comparing with {baseline_filepath} across machines: "
+                      f"timings may be up to {CROSS_MACHINE_THRESHOLD:g}x slower")
+            regressions = compare(results, baseline, cross_machine)
+            for name in names:
+                if "ratio" in results[name]:
+                    flag = "REGRESSION" if name in regressions else "ok"
+                    print(f"{name:<48} {results[name]['ratio']:.2f}x baseline ({flag})")
+
+    if args.output is not None:
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=2, sort_keys=True)
+            file.write("\n")
+
+    return 1 if regressions else status
+
+
+def format_result(result):
+    if "skipped" in result:
+        return f"skipped ({result['skipped']})"
+    line = f"median {1000 * result['median']:10.3f}ms  min {1000 * result['min']:10.3f}ms"
+    if "accuracy" in result:
+        line += f"  accuracy {100 * result['accuracy']:5.1f}% of {result['clips']}"
+    return line
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,31 +1,36 @@
 import numpy as np
-import matplotlib.pyplot as plt
 from scipy.io import wavfile
 from scipy.signal import find_peaks
 import os
 import sys
-import sounddevice as sd
-import pyaudio
+import time
+import bisect
+import queue
+import itertools
+import threading
 from datetime import datetime
 
 from fretty.notes import note_to_frequency, spot_to_note
 
-# config
+# config (the detector band suits a standard guitar; instrument profiles pass their own)
 lowest_freq = 70
 highest_freq = 2000
 fluctuation_tolerance = 2.0
 
-device_info = sd.query_devices(kind='input')
-input_device_index = device_info['index']
-SAMPLE_RATE = int(device_info['default_samplerate'])
 CHANNELS = 1
-FORMAT = pyaudio.paInt16
 CHUNK = 1024
 
-def estimate_fundamental(peaks, power_values):
+# pitch detectors, by name: "gcd" works from the spacing of spectral peaks,
+# "template" scores every note's harmonic comb at once (see fretty.templates)
+DEFAULT_DETECTOR = "gcd"
+
+NOTES = list(note_to_frequency)
+NOTE_FREQUENCIES = [note_to_frequency[note] for note in NOTES]
+
+def estimate_fundamental(peaks, power_values, lowest_freq=lowest_freq, highest_freq=highest_freq):
     """Finds the approximate fundamental frequency from detected peaks using an approximate GCD method.
     
-    Removes peaks that are too close together (< 68 Hz), keeping the stronger peak. 
+    Removes peaks that are too close together (< lowest_freq), keeping the stronger peak. 
     After estimating the fundamental frequency, checks whether all remaining peaks are integer multiples of it.
     """
     filter_threshold = 0.4
@@ -39,7 +44,7 @@ def estimate_fundamental(peaks, power_values):
     removed_peaks = []  # Store removed peaks for plotting
     removed_power = []
 
-    # Iteratively remove peaks that are too close (< 68 Hz)
+    # Iteratively remove peaks that are too close (< lowest_freq)
     while True:
         if len(peaks_sorted) < 2:
             break
@@ -118,8 +123,10 @@ def classify_note(frequency):
     if frequency is None:
         return None
     
-    # Find the closest note
-    closest_note = min(note_to_frequency, key=lambda note: abs(note_to_frequency[note] - frequency))
+    # Find the closest note among the two neighbouring the frequency
+    idx = bisect.bisect_left(NOTE_FREQUENCIES, frequency)
+    candidates = NOTES[max(0, idx - 1):idx + 1]
+    closest_note = min(candidates, key=lambda note: abs(note_to_frequency[note] - frequency))
 
     # Map to the correct fretboard position(s)
     return closest_note
@@ -154,26 +161,38 @@ def log_message(message):
     
 #     return audio_data
 
-import pyaudio
-import numpy as np
+_input_device = None
+
+def get_input_device():
+    """(index, sample rate) of the default input device, queried on first use so importing needs no audio hardware."""
+    global _input_device
+    if _input_device is None:
+        import sounddevice as sd
+
+        device_info = sd.query_devices(kind='input')
+        _input_device = (device_info['index'], int(device_info['default_samplerate']))
+    return _input_device
 
 def record_audio(duration):
     """Records audio from the microphone using pyaudio with error handling."""
+    import pyaudio
+
+    input_device_index, sample_rate = get_input_device()
     p = pyaudio.PyAudio()
     stream = None
     frames = []
 
     try:
         # Attempt to open stream
-        stream = p.open(format=FORMAT,
+        stream = p.open(format=pyaudio.paInt16,
                         channels=CHANNELS,
-                        rate=SAMPLE_RATE,
+                        rate=sample_rate,
                         input=True,
                         input_device_index=input_device_index,
                         frames_per_buffer=CHUNK)
 
         # Read data in chunks
-        for _ in range(int(SAMPLE_RATE / CHUNK * duration)):
+        for _ in range(int(sample_rate / CHUNK * duration)):
             try:
                 data = stream.read(CHUNK, exception_on_overflow=False)
                 frames.append(data)
@@ -209,14 +228,31 @@ def record_audio(duration):
         return np.array([])
 
 
-def listen(duration):
-    """Listens to microphone for a given duration, reports any notes detected"""
-    
-    segment = record_audio(duration)
+def record(duration, source=None):
+    """Records `duration` seconds from the microphone (or `source`). Returns the segment and its sample rate."""
+    if source is None:
+        return record_audio(duration), get_input_device()[1]
+    return source.read(duration), source.sample_rate
+
+
+def listen(duration, source=None, instrument=None, detector=DEFAULT_DETECTOR):
+    """Listens to microphone (or `source`, anything with read(duration) and sample_rate) for a given duration, reports any notes detected.
+
+    `instrument` narrows the detector band to the instrument's range, `detector` names one of DETECTORS.
+    """
+    segment, sample_rate = record(duration, source)
+    analyse = DETECTORS[detector]
+    if instrument is None:
+        return analyse(segment, sample_rate)
+    return analyse(segment, sample_rate, instrument.lowest_freq, instrument.highest_freq)
+
+
+def analyse_segment(segment, sample_rate, lowest_freq=lowest_freq, highest_freq=highest_freq):
+    """Detects the note played in one recorded segment, or None"""
     
     # compute fft
     fft_result = np.fft.fft(segment)
-    freqs = np.fft.fftfreq(len(segment), 1 / SAMPLE_RATE)
+    freqs = np.fft.fftfreq(len(segment), 1 / sample_rate)
     
     # get power spectrum (fft magnitude squared)
     power_spectrum = np.abs(fft_result) ** 2
@@ -234,7 +270,9 @@ def listen(duration):
     # Estimate fundamental frequency
     # _, estimated_fundamental, _, _ = estimate_fundamental(peak_frequencies, power_values)
 
-    true_peaks, estimated_fundamental, removed_peaks, removed_power = estimate_fundamental(peak_frequencies, power_values)
+    true_peaks, estimated_fundamental, removed_peaks, removed_power = estimate_fundamental(
+        peak_frequencies, power_values, lowest_freq, highest_freq
+    )
 
     # # Plot power spectrum
     # plt.figure(figsize=(8, 4))
@@ -267,4 +305,129 @@ def listen(duration):
     if detected_note:
         return detected_note
     
-    return None
\ No newline at end of file
+    return None
+
+
+def analyse_segments(segments, sample_rate, lowest_freq=lowest_freq, highest_freq=highest_freq):
+    """Detects the note played in each row of a (windows, samples) stack, as analyse_segment does one by one
+
+    One rfft covers every row, and the peaks of every row are picked at once; only the
+    fundamental estimate still runs per row, on that row's handful of peaks.
+    """
+    segments = np.atleast_2d(segments)
+    power_spectra = np.abs(np.fft.rfft(segments, axis=1)) ** 2
+    freqs = np.fft.rfftfreq(segments.shape[1], 1 / sample_rate)
+
+    mask = (freqs >= lowest_freq) & (freqs <= highest_freq)
+    freqs = freqs[mask]
+    power_spectra = power_spectra[:, mask]
+
+    # local maxima of at least 10% of their row's maximum, like find_peaks(height=...)
+    middle = power_spectra[:, 1:-1]
+    is_peak = (
+        (middle > power_spectra[:, :-2]) & (middle > power_spectra[:, 2:])
+        & (middle >= 0.1 * power_spectra.max(axis=1, keepdims=True))
+    )
+    rows, peak_indices = np.nonzero(is_peak)
+    peak_indices += 1
+    row_starts = np.searchsorted(rows, np.arange(len(segments) + 1))
+
+    detected_notes = []
+    for i in range(len(segments)):
+        row_peaks = peak_indices[row_starts[i]:row_starts[i + 1]]
+        _, estimated_fundamental, _, _ = estimate_fundamental(
+            freqs[row_peaks], power_spectra[i, row_peaks], lowest_freq, highest_freq
+        )
+        detected_notes.append(classify_note(estimated_fundamental))
+    return detected_notes
+
+
+def match_templates(segment, sample_rate, lowest_freq=lowest_freq, highest_freq=highest_freq):
+    """Detects the note played in one recorded segment by template matching, or None"""
+    from fretty.templates import classify_segment
+
+    return classify_segment(segment, sample_rate, lowest_freq, highest_freq)
+
+
+def match_templates_batch(segments, sample_rate, lowest_freq=lowest_freq, highest_freq=highest_freq):
+    from fretty.templates import get_classifier
+
+    segments = np.atleast_2d(segments)
+    classifier = get_classifier(sample_rate, segments.shape[1], lowest_freq, highest_freq)
+    return classifier.classify_batch(segments)[0]
+
+
+DETECTORS = {"gcd": analyse_segment, "template": match_templates}
+BATCH_DETECTORS = {"gcd": analyse_segments, "template": match_templates_batch}
+
+
+def analyse_batch(segments, sample_rate, instrument=None, detector=DEFAULT_DETECTOR):
+    """The detected note (or None) for each row of a (windows, samples) stack."""
+    analyse = BATCH_DETECTORS[detector]
+    if instrument is None:
+        return analyse(segments, sample_rate)
+    return analyse(segments, sample_rate, instrument.lowest_freq, instrument.highest_freq)
+
+
+_STOP = object()
+
+
+class BatchAnalyser:
+    """
+    One analysis thread for many listener threads.
+
+    Listeners record their segment and submit() it rather than analysing
+    it themselves. Whenever the analysis thread wakes it takes every segment
+    waiting: usually one, but several after a GIL stall or when overlapping
+    listeners finish together. It runs them through analyse_batch as one
+    stack and calls each segment's callback with its note, in submission
+    order. If analysing a stack fails, its segments are reported as None
+    (no note heard) and the error is kept in `error`.
+    """
+    def __init__(self, instrument=None, detector=DEFAULT_DETECTOR):
+        self.instrument = instrument
+        self.detector = detector
+        self.queue = queue.Queue()
+        self.largest_batch = 0
+        self.analysis_times = []    # seconds per segment, for each batch
+        self.error = None
+        self.thread = threading.Thread(target=self.run, name="analyser", daemon=True)
+        self.thread.start()
+
+    def submit(self, segment, sample_rate, callback, *args):
+        self.queue.put((segment, sample_rate, callback, args))
+
+    def run(self):
+        while True:
+            pending = [self.queue.get()]
+            while True:
+                try:
+                    pending.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = any(item is _STOP for item in pending)
+            pending = [item for item in pending if item is not _STOP]
+            self.largest_batch = max(self.largest_batch, len(pending))
+
+            # segments only stack with others of the same length and rate
+            for (length, sample_rate), group in itertools.groupby(pending, key=lambda item: (len(item[0]), item[1])):
+                group = list(group)
+                if length == 0:
+                    notes = [None] * len(group)  # recording failed
+                else:
+                    start = time.perf_counter()
+                    try:
+                        notes = analyse_batch(np.stack([item[0] for item in group]), sample_rate, self.instrument,
+                                              self.detector)
+                    except Exception as e:
+                        self.error = e  # the listeners are still waiting on their callbacks
+                        notes = [None] * len(group)
+                    self.analysis_times.append((time.perf_counter() - start) / len(group))
+                for (_, _, callback, args), note in zip(group, notes):
+                    callback(note, *args)
+            if stop:
+                return
+
+    def close(self):
+        """Stops the thread once the segments already submitted are analysed."""
+        self.queue.put(_STOP)
@@ -0,0 +1,136 @@
+import time
+import queue
+import threading
+
+# take a snapshot after this many recorded changes, or this many seconds
+# after the first change since the last one
+CHECKPOINT_RECORDS = 20
+CHECKPOINT_INTERVAL = 30.0
+FLUSH_TIMEOUT = 5.0     # longest close() waits for the writer at exit
+
+_STOP = object()
+
+
+class Checkpointer:
+    """
+    Moves a store's disk work (a Journal or SQLiteStore) onto a writer thread.
+
+    It stands in for the store as fretboard.journal. append() numbers the
+    record and queues it, so recording an attempt never waits on disk. Every
+    CHECKPOINT_RECORDS changes, or CHECKPOINT_INTERVAL seconds after an
+    unsaved change, the fretboard's spot states are captured along with a
+    history marker (see AttemptHistory.get_marker), and the writer thread
+    snapshots the history up to that marker and saves both. The interval is
+    a timer on `loop`, so an idle session is saved too; without a loop it is
+    only checked as records arrive.
+
+    close() waits up to FLUSH_TIMEOUT for everything queued to be written.
+    Write errors don't stop the writer; the last one is kept in `error`
+    for the caller to report once the terminal is its own again, and so
+    is what a close that timed out left unsaved.
+    """
+    def __init__(self, store, loop=None, every_records=CHECKPOINT_RECORDS, every_seconds=CHECKPOINT_INTERVAL):
+        self.store = store
+        self.loop = loop
+        self.every_records = every_records
+        self.every_seconds = every_seconds
+        self.fretboard = None
+        self.seq = 0
+        self.lock = threading.Lock()
+        self.queue = queue.Queue()
+        self.thread = None
+        self.unsaved = 0
+        self.first_unsaved_time = None
+        self.timer = None
+        self.error = None
+        self.written_seq = 0        # last record the store has
+        self.checkpoint_seq = 0     # last record covered by a written snapshot
+
+    def replay(self, fretboard):
+        self.store.replay(fretboard)
+        self.seq = self.store.seq
+        self.written_seq = self.checkpoint_seq = self.seq
+        self.fretboard = fretboard
+        fretboard.journal = self
+        self.thread = threading.Thread(target=self.run, name="checkpointer", daemon=True)
+        self.thread.start()
+
+    def run(self):
+        while True:
+            item = self.queue.get()
+            try:
+                if item is _STOP:
+                    return
+                kind, args = item
+                if kind == "record":
+                    self.store.append(*args)
+                    self.written_seq = args[0]["seq"]
+                else:
+                    state, history, marker = args
+                    self.store.checkpoint(state, history.snapshot(marker), history)
+                    self.checkpoint_seq = state["journal_seq"]
+            except Exception as e:
+                self.error = e  # keep draining; the journal on disk is still consistent up to here
+            finally:
+                self.queue.task_done()
+
+    def append(self, record):
+        with self.lock:
+            self.seq += 1
+            record["seq"] = self.seq
+            self.queue.put(("record", (record,)))
+
+        self.unsaved += 1
+        if self.first_unsaved_time is None:
+            self.first_unsaved_time = time.monotonic()
+            if self.loop is not None:
+                self.timer = self.loop.call_later(self.every_seconds, self.on_timer)
+        if (self.unsaved >= self.every_records
+                or time.monotonic() - self.first_unsaved_time >= self.every_seconds):
+            self.compact(self.fretboard)
+
+    def on_timer(self):
+        self.timer = None
+        if self.unsaved:
+            self.compact(self.fretboard)
+
+    def compact(self, fretboard):
+        """Captures the fretboard's state now and snapshots it on the writer thread."""
+        state = fretboard.get_state()
+        marker = fretboard.history.get_marker()
+        self.queue.put(("checkpoint", (state, fretboard.history, marker)))
+        self.unsaved = 0
+        self.first_unsaved_time = None
+        if self.timer is not None:
+            self.loop.cancel(self.timer)
+            self.timer = None
+
+    def wait(self):
+        self.queue.join()
+
+    def close(self, timeout=FLUSH_TIMEOUT):
+        """
+        Writes out what is queued and closes the store, giving up after
+        `timeout` seconds. A writer still busy then (a slow or hung disk) is
+        left to the daemon thread, and what it hadn't saved goes in `error`.
+        """
+        if self.timer is not None:
+            self.loop.cancel(self.timer)
+            self.timer = None
+        if self.thread is not None:
+            self.queue.put(_STOP)
+            self.thread.join(timeout)
+            if self.thread.is_alive():
+                self.error = TimeoutError(self.describe_unsaved(timeout))
+                return  # the writer still holds the store
+        self.store.close()
+
+    def describe_unsaved(self, timeout):
+        journaled = self.written_seq - self.checkpoint_seq
+        unwritten = self.seq - self.written_seq
+        message = f"gave up after {timeout:g}s"
+        if journaled:
+            message += f"; {journaled} changes were logged but not snapshotted, and are restored on the next start"
+        if unwritten:
+            message += f"; {unwritten} changes were not written"
+        return message
@@ -1,13 +1,24 @@
+import argparse
 import curses
 import os
-import textwrap
 from datetime import date
-import sounddevice as sd
 
 from fretty.fretboard import Fretboard, FretboardSpot
-from fretty.pages.page import Page
+from fretty.journal import Journal
+from fretty.checkpoint import Checkpointer
+from fretty.sqlite_store import SQLiteStore, is_sqlite_filepath
+from fretty.pages.page import Page, BACK_KEYS
+from fretty.pages.loop import EventLoop
+from fretty.pages.render import FrameBuffer
 from fretty.pages.note_to_fret import NoteToFret
 from fretty.pages.progress import Progress
+from fretty.pages.tuner import Tuner
+from fretty.pages.overlay import Popup, DebugOverlay
+from fretty.profiling import SessionProfiler
+from fretty.instruments import INSTRUMENTS, DEFAULT_INSTRUMENT
+from fretty.recorder import SessionRecorder, get_session_dirpath
+from fretty.audio import DETECTORS
+from fretty.warmup import Warmup, StartupTimeline, log_startup
 
 # Define screens
 NAVIGATION = {
@@ -22,6 +33,8 @@ NAVIGATION = {
     "Fretboard View": [],
 }
 
+STATE_FILEPATH = "state.json"
+
 PAGES = {
     "Note -> Fretboard": None,
     "Fretboard -> Note": None,
@@ -49,73 +62,29 @@ def init_colors():
     curses.init_pair(15, 248, curses.COLOR_BLACK) # grey
     curses.init_pair(16, curses.COLOR_BLACK, 248) # grey
 
+def display_popup(stdscr, loop, message):
+    popup = Popup(stdscr, message)
+    popup.show()
+    loop.wait_for_key()
+    popup.hide()
 
-def display_popup(stdscr, message):
-    # Get the size of the screen
-    height, width = stdscr.getmaxyx()
-
-    # Wrap message to fit within the popup width
-    max_msg_width = 40
-    lines = textwrap.wrap(message, max_msg_width)
-    box_width = max(len(line) for line in lines) + 4
-    box_height = len(lines) + 4
-
-    # Calculate position to center the popup
-    start_y = (height - box_height) // 2
-    start_x = (width - box_width) // 2
-
-    # Save the underlying content
-    backup = []
-    for y in range(start_y, start_y + box_height):
-        row = []
-        for x in range(start_x, start_x + box_width):
-            try:
-                row.append((stdscr.inch(y, x)))
-            except curses.error:
-                row.append(ord(' '))  # Fallback in case we go out of bounds
-        backup.append(row)
-
-    # Draw popup box
-    stdscr.attron(curses.A_REVERSE)
-    for y in range(start_y, start_y + box_height):
-        for x in range(start_x, start_x + box_width):
-            stdscr.addch(y, x, ' ')
-    stdscr.attroff(curses.A_REVERSE)
-
-    # Write message
-    for idx, line in enumerate(lines):
-        stdscr.addstr(start_y + 1 + idx, start_x + 2, line, curses.A_REVERSE)
-
-    # Write OK button
-    ok_msg = "[ OK ]"
-    ok_x = start_x + (box_width - len(ok_msg)) // 2
-    stdscr.attron(curses.A_STANDOUT)
-    stdscr.addstr(start_y + box_height - 2, ok_x, ok_msg, curses.A_NORMAL)
-    stdscr.attroff(curses.A_STANDOUT)
-
-    stdscr.refresh()
-    stdscr.getch()
-
-    # Restore underlying content
-    for dy, row in enumerate(backup):
-        for dx, ch in enumerate(row):
-            stdscr.addch(start_y + dy, start_x + dx, ch)
-
-    stdscr.refresh()
-
-def draw_menu(stdscr, current_screen):
+def draw_menu(screen, loop, current_screen):
+    """
+    Draws a menu screen and waits on the event loop for a choice. `screen`
+    is the menu's FrameBuffer, so it flushes under any overlays.
+    """
     curses.curs_set(0)  # Hide cursor
-    stdscr.clear()
-    stdscr.refresh()
+    loop.screen = screen
+    screen.clear()  # a page may have drawn since the menu was last shown
     
     options = NAVIGATION[current_screen]
     selected = 0
     
     while True:
-        stdscr.clear()
-        height, width = stdscr.getmaxyx()
+        screen.erase()
+        height, width = screen.getmaxyx()
         if current_screen != "Main":
-            stdscr.addstr(1, 5, "<-- Backspace / Esc", curses.A_BOLD)
+            screen.addstr(1, 5, "<-- Backspace / Esc", curses.A_BOLD)
 
         if current_screen not in PAGES:
             for i, option in enumerate(options):
@@ -123,13 +92,14 @@ def draw_menu(stdscr, current_screen):
                 y = height // 2 - len(options) // 2 + i
                 
                 if i == selected:
-                    stdscr.attron(curses.A_REVERSE)
-                    stdscr.addstr(y, x, f"{i+1}. {option}")
-                    stdscr.attroff(curses.A_REVERSE)
+                    screen.attron(curses.A_REVERSE)
+                    screen.addstr(y, x, f"{i+1}. {option}")
+                    screen.attroff(curses.A_REVERSE)
                 else:
-                    stdscr.addstr(y, x, f"{i+1}. {option}")
+                    screen.addstr(y, x, f"{i+1}. {option}")
+            screen.refresh()
         
-            key = stdscr.getch()
+            key = loop.wait_for_key()
             
             if key == curses.KEY_UP and selected > 0:
                 selected -= 1
@@ -139,30 +109,76 @@ def draw_menu(stdscr, current_screen):
                 return options[selected]
             elif key in [ord(str(i + 1)) for i in range(len(options))]:
                 return options[int(chr(key)) - 1]
-            elif current_screen != "Main" and key in [27, 127, curses.KEY_BACKSPACE, curses.KEY_DC]:
+            elif current_screen != "Main" and key in BACK_KEYS:
                 return "Back"
         else:
-            key = stdscr.getch()
-            if current_screen != "Main" and key in [27, 127, curses.KEY_BACKSPACE, curses.KEY_DC]:
+            screen.refresh()
+            key = loop.wait_for_key()
+            if current_screen != "Main" and key in BACK_KEYS:
                 return "Back"
         
         
 
-def main(stdscr):
+def main(stdscr, state_filepath=STATE_FILEPATH, learner=None, auto_advance=False, debug_overlay=False,
+         instrument=None, record_dirpath=None, detector=None):
     curses.start_color()  # Initialize curses color mode
     init_colors()
+    log_startup("curses started")
 
-    current_screen = "Main"
-    screen_stack = []
+    # a SQLite database is read and then written through the same connection
+    sqlite_store = None
+    if is_sqlite_filepath(state_filepath):
+        sqlite_store = SQLiteStore(state_filepath, profile=learner or "default", instrument=instrument)
 
-    if os.path.exists("state.json"):
-        fretboard = Fretboard(state_filepath="state.json")
+    if os.path.exists(state_filepath):
+        fretboard = Fretboard(state_filepath=state_filepath, profile=learner, instrument=instrument,
+                              store=sqlite_store)
         # fretboard.curr_date = date(2025, 3, 31)
     else:
-        fretboard = Fretboard()
+        fretboard = Fretboard(profile=learner, instrument=instrument)
+    log_startup("state read")
+
+    # audio and analysis get ready while the menu is up
+    warmup = Warmup(fretboard, detector)
+    warmup.start()
+
+    loop = EventLoop(stdscr)
+
+    # recover attempts made since the last snapshot
+    store = sqlite_store if sqlite_store is not None else Journal(state_filepath)
+    journal = Checkpointer(store, loop)
+    journal.replay(fretboard)
+    log_startup("journal replayed")
+
+    if debug_overlay:
+        DebugOverlay(stdscr, loop).show()
+    try:
+        log_startup("menu shown")
+        run_menu(stdscr, fretboard, loop, auto_advance, record_dirpath, detector, warmup)
+    finally:
+        loop.close()
+        warmup.close()
+        journal.close()
+    return journal.error  # reported by run_cli once curses has given the terminal back
+
+def run_menu(stdscr, fretboard, loop, auto_advance=False, record_dirpath=None, detector=None,
+             warmup=None, audio_source=None):
+    """
+    Runs the menus and the pages they open until the user exits. Pages
+    listen to `audio_source` if given (see fretty.headless), otherwise to
+    the stream the warm-up holds open, otherwise they open their own.
+    """
+    current_screen = "Main"
+    screen_stack = []
+    screen = FrameBuffer(stdscr)
+
+    def get_stream():
+        if audio_source is not None:
+            return audio_source
+        return warmup.get_stream() if warmup is not None else None
     
     while True:
-        selected_option = draw_menu(stdscr, current_screen)
+        selected_option = draw_menu(screen, loop, current_screen)
         
         if selected_option == "Back":
             if screen_stack:
@@ -173,23 +189,87 @@ def main(stdscr):
             break  # exit program
         elif selected_option == "Note -> Fretboard":
             if fretboard.done_for_day():
-                display_popup(stdscr, "You have finished your practice for today.")
+                display_popup(stdscr, loop, "You have finished your practice for today.")
+            elif record_dirpath is not None:
+                # the detector actually used, so a replay hears the session the same way
+                page_kwargs = {"auto_advance": auto_advance, "detector": detector or fretboard.instrument.detector}
+                recorder = SessionRecorder(get_session_dirpath(record_dirpath))
+                try:
+                    recorder.start(fretboard, page_kwargs, stream=get_stream())
+                except Exception as e:
+                    display_popup(stdscr, loop, f"Couldn't start recording: {e}")
+                    continue
+                try:
+                    page = NoteToFret(stdscr, fretboard, loop=loop, audio_source=recorder,
+                                      events=recorder.events, **page_kwargs)
+                    page.load()
+                finally:
+                    recorder.close()
             else:
-                page = NoteToFret(stdscr, fretboard)
+                page = NoteToFret(stdscr, fretboard, loop=loop, auto_advance=auto_advance, detector=detector,
+                                  audio_source=get_stream())
                 page.load()
         elif selected_option == "Progress":
-            page = Progress(stdscr, fretboard)
+            page = Progress(stdscr, fretboard, loop=loop)
+            page.load()
+        elif selected_option == "Tuning":
+            page = Tuner(stdscr, fretboard, loop=loop, stream=get_stream())
             page.load()
         elif selected_option in NAVIGATION:
             screen_stack.append(current_screen)
             current_screen = selected_option
         else:
-            stdscr.clear()
-            stdscr.addstr(5, 5, f"(Placeholder) {selected_option} Screen. Press any key to go back.")
-            stdscr.getch()
+            screen.clear()
+            screen.addstr(5, 5, f"(Placeholder) {selected_option} Screen. Press any key to go back.")
+            screen.refresh()
+            loop.wait_for_key()
 
 def run_cli():
-    curses.wrapper(main)
+    parser = argparse.ArgumentParser(prog="fretty")
+    parser.add_argument("--state", default=STATE_FILEPATH,
+                        help="state file, or a .db file to use the multi-learner SQLite store")
+    parser.add_argument("--learner", default=None,
+                        help="learner profile to use with a SQLite state store")
+    parser.add_argument("--instrument", choices=list(INSTRUMENTS), default=None,
+                        help="neck layout and tuning; with a SQLite store each learner keeps a profile per "
+                             f"instrument (default: the one last practised, or {DEFAULT_INSTRUMENT})")
+    parser.add_argument("--auto-advance", action="store_true",
+                        help="move to the next prompt without waiting for a key press")
+    parser.add_argument("--detector", choices=list(DETECTORS), default=None,
+                        help="pitch detector: gcd (peak spacing) or template (harmonic comb matching); "
+                             "by default the instrument's")
+    parser.add_argument("--record", metavar="DIR", default=None,
+                        help="record each lesson's audio and events to a session directory in DIR")
+    parser.add_argument("--startup-log", metavar="PATH", default=None,
+                        help="write a timeline of startup and warm-up steps, and of each lesson's detections, to PATH")
+    parser.add_argument("--debug-overlay", action="store_true",
+                        help="show frame and event loop latency on top of the pages")
+    parser.add_argument("--profile", metavar="PATH", default=None,
+                        help="profile the session and write the results to PATH (plus a PATH.txt summary)")
+    parser.add_argument("--profiler", choices=["cprofile", "sample"], default="cprofile",
+                        help="cprofile writes a pstats file, sample writes collapsed stacks")
+    parser.add_argument("--trace-malloc", action="store_true",
+                        help="with --profile, compare heap snapshots taken at lesson start and end")
+    args = parser.parse_args()
+
+    timeline = StartupTimeline(args.startup_log) if args.startup_log is not None else None
+    profiler = None
+    if args.profile is not None:
+        profiler = SessionProfiler(args.profile, mode=args.profiler, trace_malloc=args.trace_malloc)
+        profiler.start()
+    try:
+        save_error = curses.wrapper(main, args.state, args.learner, args.auto_advance, args.debug_overlay,
+                                    args.instrument, args.record, args.detector)
+        if save_error is not None:
+            print(f"Error saving progress: {save_error}")
+    finally:
+        # written once curses has given the terminal back
+        if profiler is not None:
+            profiler.stop()
+            profiler.write()
+            print(f"profile written to {args.profile} ({args.profile}.txt)")
+        if timeline is not None:
+            timeline.write()
 
 if __name__ == "__main__":
     run_cli()
\ No newline at end of file
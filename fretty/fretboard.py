@@ -2,10 +2,17 @@ from enum import Enum
 import re
 import curses
 import json
-import ast
+import time
+import heapq
 from datetime import date, timedelta
 
 from fretty.notes import note_to_frequency, spot_to_note
+from fretty.instruments import DEFAULT_INSTRUMENT, get_instrument
+from fretty.history import AttemptHistory, remove_stale_history_dirpaths
+from fretty.stats import SpotStats
+from fretty.migrations import STATE_VERSION, migrate_state
+from fretty.sqlite_store import SQLiteStore, is_sqlite_filepath, read_attempts
+from fretty.utils import atomic_write_json
 from fretty.globals import *
 
 UNICODE_COLOURS = {
@@ -33,36 +40,52 @@ def get_unicode_colour(status):
     return UNICODE_COLOURS["reset"]
 
 class Fretboard:
-    def __init__(self, tuning=None, state_filepath=None, learn_sharps=False):
+    def __init__(self, tuning=None, state_filepath=None, learn_sharps=False, profile=None, instrument=None,
+                 store=None):
+        self.journal = None
+        self.store = store  # a SQLiteStore answers the status and review queries, see get_store
+        self.set_instrument(get_instrument(instrument))
+        self.journal_seq = 0
+        self.profile = profile
+        self.learn_sharps = learn_sharps
+        self.state_filepath = state_filepath
         if state_filepath is None:
-            self.view = "first_person"
-            self.learn_sharps = learn_sharps
-            
-            if tuning is None:
-                self.tuning = ["E2", "A2", "D3", "G3", "B3", "E4"]
-            else:
-                self.tuning = tuning
-            
-            self.spots = None
-            self.init_spots()
-
-            self.review_date_to_spots = {}
-            self.spot_to_review_date = {}
+            self.init_state(tuning)
+        else:
+            self.read_state(state_filepath, store, instrument)
+        
+        self.curr_date = date.today()
 
-            self.last_review_date = None
+    def set_instrument(self, instrument):
+        self.instrument = instrument
+        self.num_strings = instrument.num_strings
+        self.num_frets = instrument.num_frets
 
-            self.new = True
+    def init_state(self, tuning=None):
+        self.view = "first_person"
+        
+        if tuning is None:
+            self.tuning = list(self.instrument.tuning)
         else:
-            self.read_state(state_filepath)
+            self.tuning = tuning
         
-        self.curr_date = date.today()
+        self.spots = None
+        self.history = AttemptHistory()
+        self.init_spots()
+
+        self.review_date_to_spots = {}
+        self.spot_to_review_date = {}
+
+        self.last_review_date = None
+
+        self.new = True
 
 
     def init_spots(self):
         self.spots = []
-        for s in range(NUM_STRINGS):
+        for s in range(self.num_strings):
             string = []
-            for f in range(1, NUM_FRETS + 1):
+            for f in range(1, self.num_frets + 1):
                 note = spot_to_note((s, f), self.tuning)
                 learnable = self.learn_sharps or ('#' not in note)
                 spot = FretboardSpot(self, s, f, note, learnable=learnable)
@@ -72,6 +95,13 @@ class Fretboard:
     def get_spot(self, pos):
         s, f = pos
         return self.spots[s][f-1]
+
+    def get_spot_idx(self, pos):
+        s, f = pos
+        return s * self.num_frets + (f - 1)
+
+    def get_spot_by_idx(self, idx):
+        return self.spots[idx // self.num_frets][idx % self.num_frets]
     
     def set_spots(self, spots_state):
         pass
@@ -82,7 +112,16 @@ class Fretboard:
     def get_last_review_date(self):
         return self.last_review_date
     
+    def get_store(self):
+        """The attached SQLiteStore, once every change recorded so far has reached it, or None."""
+        if self.store is not None and self.journal is not None:
+            self.journal.wait()
+        return self.store
+
     def get_reviews_today(self):
+        store = self.get_store()
+        if store is not None:
+            return [self.get_spot_by_idx(idx) for idx in store.get_reviews_due(self.curr_date)]
         if self.curr_date in self.review_date_to_spots:
             return self.review_date_to_spots[self.curr_date]
         else:
@@ -98,13 +137,18 @@ class Fretboard:
         shift = (self.curr_date - earliest_review).days
         
         if shift > 0:
-            new_review_date_to_spots = {}
-            for old_date, spots in self.review_date_to_spots.items():
-                new_date = old_date + timedelta(days=shift)
-                new_review_date_to_spots[new_date] = spots
-                for spot in spots:
-                    self.spot_to_review_date[spot] = new_date
-            self.review_date_to_spots = new_review_date_to_spots
+            self.shift_reviews(shift)
+            if self.journal is not None:
+                self.journal.append({"type": "shift", "days": shift})
+
+    def shift_reviews(self, shift):
+        new_review_date_to_spots = {}
+        for old_date, spots in self.review_date_to_spots.items():
+            new_date = old_date + timedelta(days=shift)
+            new_review_date_to_spots[new_date] = spots
+            for spot in spots:
+                self.spot_to_review_date[spot] = new_date
+        self.review_date_to_spots = new_review_date_to_spots
             
     
     def add_review(self, spot, days):
@@ -131,91 +175,189 @@ class Fretboard:
             if len(self.review_date_to_spots[review_date]) == 0:
                 del self.review_date_to_spots[review_date]
 
+    def get_slowest_spots(self, n=10):
+        """Spots with the slowest recent reaction times, slowest first."""
+        seen = [spot for string in self.spots for spot in string if spot.stats.count > 0]
+        return heapq.nlargest(n, seen, key=lambda spot: spot.stats.ewma)
+
     def get_spots(self, status=None):
         if status is None:
             return self.spots
-        else:
-            spots = []
-            for s in range(NUM_STRINGS):
-                state_spots = [spot for spot in self.spots[s] if spot.get_status() == status]
-                spots += state_spots
-            return spots
+        store = self.get_store()
+        if store is not None:
+            return [self.get_spot_by_idx(idx) for idx in store.get_spots_by_status(status)]
+        spots = []
+        for s in range(self.num_strings):
+            state_spots = [spot for spot in self.spots[s] if spot.get_status() == status]
+            spots += state_spots
+        return spots
             
-    def read_state(self, state_filepath):
+    def read_state(self, state_filepath, store=None, instrument=None):
+        """
+        Reads a state file, or a SQLite profile. `store` is a SQLiteStore
+        already open on that database, which then also backs the lazily
+        loaded history; without one, a connection is opened just for reading.
+        In a database, the learner's profile for `instrument` is read (by
+        default the instrument they practised last). A state file holds a
+        single instrument, and asking it for another is an error.
+        """
+        start = time.perf_counter()
+        self.history = AttemptHistory()
         try:
-            with open(state_filepath, 'r') as file:
-                state = json.load(file)
-                self.new = state.get("new", False)
-                self.view = state.get("view", "first_person")
-                self.tuning = state.get("tuning", ["E2", "A2", "D3", "G3", "B3", "E4"])
-                last_review_date_str = state.get("last_review_date", None)
-                if last_review_date_str is not None:
-                    self.last_review_date = date.fromisoformat(state["last_review_date"])
-                else:
-                    self.last_review_date = None
-
-                file_spots = state.get("spots", None)
-                
-                self.spots = []
-                for s in range(NUM_STRINGS):
-                    string = []
-                    for f in range(1, NUM_FRETS + 1):
-                        note = spot_to_note((s, f), self.tuning)
-                        spot = FretboardSpot(self, s, f, note, spot_state=file_spots[s][f-1])
-                        spot.good_attempts = 0
-                        string.append(spot)
-                    self.spots.append(string)
-
-                self.review_date_to_spots = {
-                    date.fromisoformat(k): [self.get_spot(ast.literal_eval(pos)) for pos in v] for k, v in state.get("review_date_to_spots", {}).items()
-                }
-                self.spot_to_review_date = {
-                    self.get_spot(ast.literal_eval(k)): date.fromisoformat(v) for k, v in state.get("spot_to_review_date", {}).items()
-                }
-
-
-
-        except (FileNotFoundError, json.JSONDecodeError) as e:
+            if is_sqlite_filepath(state_filepath):
+                profile = self.profile or "default"
+                reader = store if store is not None else SQLiteStore(state_filepath, profile, instrument)
+                try:
+                    if reader.has_profile():
+                        self.set_state(reader.read_state())
+                        if store is not None:
+                            loader = store.read_attempts
+                        else:
+                            loader = lambda: read_attempts(state_filepath, profile, reader.instrument)
+                        self.history.set_source(reader.count_attempts(), loader)
+                    else:
+                        # first session for this learner on this instrument
+                        self.set_instrument(get_instrument(reader.instrument))
+                        self.init_state()
+                finally:
+                    if reader is not store:
+                        reader.close()
+            else:
+                with open(state_filepath, 'r') as file:
+                    state = json.load(file)
+                stored_instrument = state.get("instrument", DEFAULT_INSTRUMENT)
+                if instrument is not None and instrument != stored_instrument:
+                    raise ValueError(f"it holds a {stored_instrument} profile, not {instrument}; "
+                                     f"use a .db state to keep several instruments")
+                self.set_state(state, state_filepath)
+                remove_stale_history_dirpaths(state_filepath, self.history.generation)
+        except (FileNotFoundError, KeyError, json.JSONDecodeError) as e:
             print(f"Error reading state file: {e}")
-            self.init_spots()  # fallback to default initialization
+            self.init_state()  # fallback to default initialization
+        except ValueError as e:
+            # e.g. an instrument this version doesn't know; starting over
+            # would overwrite the learner's progress on the next save
+            raise ValueError(f"Can't read {state_filepath}: {e}") from e
+        self.load_time = time.perf_counter() - start
+
+    def set_state(self, state, state_filepath=None):
+        state = migrate_state(state)
+        self.new = state.get("new", False)
+        self.view = state.get("view", "first_person")
+        self.set_instrument(get_instrument(state.get("instrument", None)))
+        self.tuning = state.get("tuning", list(self.instrument.tuning))
+        self.journal_seq = state.get("journal_seq", 0)
+        last_review_date_str = state.get("last_review_date", None)
+        if last_review_date_str is not None:
+            self.last_review_date = date.fromisoformat(state["last_review_date"])
+        else:
+            self.last_review_date = None
 
-    def write_state(self, state_filepath):
-        review_date_to_spots_serialized = {
-            d.isoformat(): [str(spot.get_pos()) for spot in v] for d, v in self.review_date_to_spots.items()
-        }
+        history_state = state.get("history", None)
+        if history_state is not None:
+            self.history.set_state(history_state, state_filepath)
 
-        spot_to_review_date_serialized = {
-            str(k.get_pos()): v.isoformat() for k, v in self.spot_to_review_date.items()
-        }
+        file_spots = state["spots"]
         
+        self.spots = []
+        for s in range(self.num_strings):
+            string = []
+            for f in range(1, self.num_frets + 1):
+                note = spot_to_note((s, f), self.tuning)
+                learnable = self.learn_sharps or ('#' not in note)
+                spot_state = file_spots[self.get_spot_idx((s, f))]
+                spot = FretboardSpot(self, s, f, note, learnable=learnable, spot_state=spot_state)
+                string.append(spot)
+            self.spots.append(string)
+
+        self.review_date_to_spots = {}
+        self.spot_to_review_date = {}
+        for review_date_str, spot_idxs in state.get("reviews", {}).items():
+            review_date = date.fromisoformat(review_date_str)
+            self.review_date_to_spots[review_date] = [self.get_spot_by_idx(idx) for idx in spot_idxs]
+            for spot in self.review_date_to_spots[review_date]:
+                self.spot_to_review_date[spot] = review_date
+
+    def get_state(self):
         state = {
+            "version": STATE_VERSION,
             "new": self.new,
             "view": self.view,
-            "tuning": self.tuning,
+            "instrument": self.instrument.name,
+            "tuning": list(self.tuning),
             "last_review_date": self.curr_date.isoformat(),
-            "review_date_to_spots": review_date_to_spots_serialized,
-            "spot_to_review_date": spot_to_review_date_serialized,
-            "spots": [[spot.get_state() for spot in string] for string in self.spots]
+            "journal_seq": self.journal.seq if self.journal is not None else self.journal_seq,
+            "reviews": {
+                d.isoformat(): [spot.get_idx() for spot in v] for d, v in self.review_date_to_spots.items()
+            },
+            "spots": [spot.get_state() for string in self.spots for spot in string],
         }
+
+        return state
+
+    def write_state(self, state_filepath):
+        if is_sqlite_filepath(state_filepath):
+            store = SQLiteStore(state_filepath, self.profile or "default", self.instrument.name)
+            store.write_state(self)
+            store.close()
+            return
+
         try:
-            with open(state_filepath, 'w') as file:
-                json.dump(state, file, indent=4)
+            state = self.get_state()
+            state["history"] = self.history.write(self.history.get_dirpath(state_filepath))
+            atomic_write_json(state_filepath, state)
         except IOError as e:
             print(f"Error writing state file: {e}")
 
+    def save(self, state_filepath=None):
+        """Persists progress, compacting the journal in the background if one is attached."""
+        if self.journal is not None:
+            self.journal.compact(self)
+        else:
+            self.write_state(state_filepath or self.state_filepath or "state.json")
+
+    def record_spot(self, spot, attempt=None):
+        if self.journal is None:
+            return
+        review_date = self.spot_to_review_date.get(spot, None)
+        record = {
+            "type": "spot",
+            "date": self.curr_date.isoformat(),
+            "spot": spot.get_idx(),
+            "state": spot.get_state(),
+            "review_date": review_date.isoformat() if review_date is not None else None,
+        }
+        if attempt is not None:
+            record["attempt"] = attempt
+        self.journal.append(record)
+
+    def apply_journal_record(self, record):
+        if record["type"] == "shift":
+            self.shift_reviews(record["days"])
+            return
+
+        spot = self.get_spot_by_idx(record["spot"])
+        spot.set_state(record["state"])
+        self.remove_review(spot)
+        if record["review_date"] is not None:
+            review_date = date.fromisoformat(record["review_date"])
+            self.review_date_to_spots.setdefault(review_date, []).append(spot)
+            self.spot_to_review_date[spot] = review_date
+        if "attempt" in record:
+            timestamp, attempt_time, rating, status = record["attempt"]
+            self.history.append(spot.get_idx(), timestamp, attempt_time, rating, status)
+
+        self.new = False
+        self.last_review_date = date.fromisoformat(record["date"])
+
     def done_for_day(self):
         if self.new:
             return False
 
         if len(self.get_reviews_today()) > 0 or self.last_review_date != self.curr_date:
             return False
-        
-        for string in self.spots:
-            for spot in string:
-                if spot.status in {"new", "learning"}:
-                    return False
 
-        return True
+        return not self.get_spots(status="new") and not self.get_spots(status="learning")
     
     def get_spot(self, pos):
         string, fret = pos
@@ -223,15 +365,28 @@ class Fretboard:
 
 
     def adjust_tuning(self, adjustments):
+        """
+        Moves each string's open note by adjustments[string] semitones,
+        renaming the notes of its spots. A spot whose new note is a sharp
+        becomes unlearnable (unless learn_sharps) and leaves the review
+        calendar; one that stops being a sharp starts again as unseen.
+        """
+        note_list = list(note_to_frequency.keys())
         for i in range(len(self.tuning)):
             note = self.tuning[i]
             adjustment = adjustments[i]
-            note_list = list(note_to_frequency.keys())
             note_idx = note_list.index(note)
-            new_note_idx = max(0, min(len(note_list), note_idx + adjustment))
-            self.tuning[i] = note_list[new_note_idx]     
+            # the highest fret has to stay inside the note table too
+            new_note_idx = max(0, min(len(note_list) - 1 - self.num_frets, note_idx + adjustment))
+            self.tuning[i] = note_list[new_note_idx]
+            if new_note_idx != note_idx:
+                for spot in self.spots[i]:
+                    spot.note = spot_to_note(spot.get_pos(), self.tuning)
+                    spot.set_learnable(self.learn_sharps or ('#' not in spot.note))
 
     def display(self, stdscr):
+        from fretty.pages.fretboard_widget import FretboardWidget  # the model itself doesn't depend on the UI
+
         stdscr.clear()
 
         STATUS_COLOR_MAPPING = {
@@ -241,46 +396,22 @@ class Fretboard:
             "unlearnable": curses.A_NORMAL,
         }
 
-        strings = list(enumerate([re.sub(r'\d+', '', s) for s in self.tuning]))
-        if self.view == "first_person":
-            strings.reverse()
-
-        frets = range(1, NUM_FRETS + 1)
-        if self.view == "third_person":
-            frets.reverse()
-
-        line_y = 1
-        for s, string in strings:
-            open_spot = self.get_spot((s, 0))
-            open_status = open_spot.get_status()
-            open_color_pair = STATUS_COLOR_MAPPING.get(open_status, curses.color_pair(4))
-            stdscr.addstr(line_y, 0, f" {string} ", open_color_pair)
-            stdscr.addstr(line_y, 3, "║")
-
-            for f in frets:
-                print(print(f"f: {f}"))
-                spot = self.get_spot((s, f))
-                note = spot.get_note()
-                print(print(f"note: {note}"))
-                spot_status = spot.get_status()
-                
-                color_pair = STATUS_COLOR_MAPPING.get(spot_status, curses.color_pair(4))
-
-                if f in {3, 5, 7, 9} and string == "G":
-                    stdscr.addstr(line_y, 0 + f * 4, " ● ", color_pair)
-                elif f == 12 and string in ["D", "B"]:
-                    stdscr.addstr(line_y, 0 + f * 4, " ● ", color_pair)
-                else:
-                    stdscr.addstr(line_y, 0 + f * 4, "   ", color_pair)
-
-                stdscr.addstr(line_y, 0 + f * 4 + 3, "│")  # Fret divider
-            
-            line_y += 1
+        widget = FretboardWidget(stdscr, self, top_y=1, left_x=0)
+        widget.draw()
+        widget.set_overlay("status", {
+            spot.get_pos(): STATUS_COLOR_MAPPING.get(spot.get_status(), curses.color_pair(4))
+            for string in self.spots for spot in string
+        })
 
         stdscr.refresh()
         stdscr.getch()
         
 class FretboardSpot:
+    __slots__ = (
+        "fretboard", "string", "fret", "note", "learnable",
+        "status", "interval", "ease_factor", "good_attempts", "stats",
+    )
+
     def __init__(self, fretboard, string, fret, note, learnable=True, spot_state=None):
         self.fretboard = fretboard
         self.string = string
@@ -294,9 +425,9 @@ class FretboardSpot:
             else:
                 self.status = "unlearnable"
             self.interval = 1
-            self.history = []
             self.ease_factor = BASE_EASE_FACTOR
             self.good_attempts = 0
+            self.stats = SpotStats()
         else:
             self.set_state(spot_state)
     
@@ -312,17 +443,25 @@ class FretboardSpot:
     def set_state(self, spot_state):
         self.status = spot_state['status']
         self.interval = spot_state['interval']
-        self.history = spot_state['history']
         self.ease_factor = spot_state['ease_factor']
         self.good_attempts = spot_state['good_attempts']
+        self.stats = SpotStats(spot_state.get('stats', None))
+
+        # pre-column-store states keep a (time, rating, status) list per spot
+        if spot_state.get('history'):
+            spot_idx = self.get_idx()
+            for attempt_time, rating, status in spot_state['history']:
+                self.fretboard.history.append(spot_idx, float('nan'), attempt_time, rating, status)
+                if 'stats' not in spot_state:
+                    self.stats.update(attempt_time, rating, None)
         
     def get_state(self):
         spot_state = {}
         spot_state['status'] = self.status
         spot_state['interval'] = self.interval
-        spot_state['history'] = self.history
         spot_state['ease_factor'] = self.ease_factor
         spot_state['good_attempts'] = self.good_attempts
+        spot_state['stats'] = self.stats.get_state()
 
         return spot_state
     
@@ -335,13 +474,29 @@ class FretboardSpot:
     def get_pos(self):
         return self.string, self.fret
 
+    def get_idx(self):
+        return self.fretboard.get_spot_idx(self.get_pos())
+
+    @property
+    def history(self):
+        return self.fretboard.history.get_spot_history(self.get_idx())
+
     def reset(self):
         self.interval = 1
         self.ease_factor = BASE_EASE_FACTOR
         self.good_attempts = 0
         self.status = "unseen"
+
+    def set_learnable(self, learnable):
+        self.learnable = learnable
+        if not learnable:
+            if self.status != "unlearnable":
+                self.fretboard.remove_review(self)
+                self.status = "unlearnable"
+        elif self.status == "unlearnable":
+            self.reset()
     
-    def add_attempt(self, time):
+    def add_attempt(self, attempt_time):
         """
         Records an attempt for this spot and updates
         learning status / revision interval accordingly. 
@@ -349,13 +504,13 @@ class FretboardSpot:
         if not self.learnable:
             return None
 
-        if time is None or time > FAIL_TIME:
+        if attempt_time is None or attempt_time > FAIL_TIME:
             rating = "fail"
-        elif time <= EASY_TIME:
+        elif attempt_time <= EASY_TIME:
             rating = "easy"
-        elif time <= GOOD_TIME:
+        elif attempt_time <= GOOD_TIME:
             rating = "good"
-        elif time < FAIL_TIME:
+        elif attempt_time < FAIL_TIME:
             rating = "hard"
         else:
             rating = "fail"
@@ -408,6 +563,10 @@ class FretboardSpot:
                 self.interval = self.interval * self.ease_factor
                 self.fretboard.add_review(self, self.interval)
 
-        self.history.append((time, rating, self.status))
+        self.stats.update(attempt_time, rating, self.fretboard.curr_date.isoformat())
+
+        attempt = (time.time(), attempt_time, rating, self.status)
+        self.fretboard.history.append(self.get_idx(), *attempt)
+        self.fretboard.record_spot(self, attempt)
 
 
@@ -1,3 +1,4 @@
+# standard 6-string, 12-fret guitar; other layouts come from fretty.instruments
 NUM_FRETS = 12
 NUM_STRINGS = 6
 FRETBOARD_CHAR_HEIGHT = 6
@@ -12,6 +13,7 @@ GOOD_TIME = 3
 FAIL_TIME = 5
 
 MAX_DAILY_REVIEWS = 5
+RANDOM_POP_LEN = 2
 
 NEW_GOOD_ATTEMPTS = 2
 LEARNING_GOOD_ATTEMPTS = 2
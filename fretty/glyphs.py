@@ -0,0 +1,71 @@
+import json
+import os
+import threading
+
+PITCH_CLASSES = ["C", "C#", "D", "D#", "E", "F", "F#", "G", "G#", "A", "A#", "B"]
+FONTS = ["tarty1"]
+DEFAULT_FONT = "tarty1"
+
+# pre-rendered glyphs, rebuilt with `python -m fretty.glyphs`
+GLYPHS_FILEPATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "glyphs.json")
+
+_glyphs = None
+_glyphs_lock = threading.Lock()   # the warm-up thread and the first page may both load
+
+
+def render_glyph(note, font):
+    from art import text2art  # only needed when the asset is missing a glyph
+
+    lines = text2art(note, font=font).split("\n")
+    while lines and not lines[-1].strip():
+        lines.pop()
+    return lines
+
+
+def build_glyphs(fonts=FONTS):
+    return {font: {note: render_glyph(note, font) for note in PITCH_CLASSES} for font in fonts}
+
+
+def load_glyphs(filepath=GLYPHS_FILEPATH):
+    """
+    Loads every note glyph, once, and returns them. Glyphs missing from the
+    asset are rendered with `art`. The cache is only published when it is
+    complete, so readers never see it half filled.
+    """
+    global _glyphs
+
+    with _glyphs_lock:
+        if _glyphs is not None:
+            return _glyphs
+        try:
+            with open(filepath, 'r') as file:
+                glyphs = json.load(file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            glyphs = {}
+
+        for font in FONTS:
+            font_glyphs = glyphs.setdefault(font, {})
+            for note in PITCH_CLASSES:
+                if note not in font_glyphs:
+                    font_glyphs[note] = render_glyph(note, font)
+
+        _glyphs = glyphs
+        return glyphs
+
+
+def get_glyph(note, font=DEFAULT_FONT):
+    """Returns the pre-rendered art for a pitch class as a list of lines."""
+    glyphs = _glyphs if _glyphs is not None else load_glyphs()
+    font_glyphs = glyphs.setdefault(font, {})
+    if note not in font_glyphs:
+        font_glyphs[note] = render_glyph(note, font)
+    return font_glyphs[note]
+
+
+def get_max_glyph_width(font=DEFAULT_FONT):
+    return max(len(line) for note in PITCH_CLASSES for line in get_glyph(note, font))
+
+
+if __name__ == "__main__":
+    with open(GLYPHS_FILEPATH, 'w') as file:
+        json.dump(build_glyphs(), file, ensure_ascii=False, indent=1)
@@ -0,0 +1,315 @@
+import os
+import time
+import curses
+import curses.panel
+import select
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+import numpy as np
+from scipy.io import wavfile
+
+from fretty.pages.loop import Clock
+
+ESCAPE_KEY = 27
+
+
+class ScriptEnded(Exception):
+    """Raised by HeadlessScreen.getch once the key script is used up, when it has no end_key."""
+
+
+class HeadlessScreen:
+    """
+    Stand-in for the subset of the curses stdscr API the pages use.
+
+    Keeps the cell grid in memory, counts write and refresh calls, and feeds
+    scripted keystrokes through a pipe so the event loop's selector wakes on
+    them like it does on stdin. A script (given here or to play()) holds key
+    codes, characters or (delay_seconds, key) pairs; a key can also be a
+    callable returning one, evaluated when it is typed. Once the script runs
+    out the screen behaves as if `end_key` is held down, so a lesson always
+    reaches its exit. With no end_key, getch raises ScriptEnded instead,
+    which unwinds whatever is running (the main menu ignores Esc).
+    """
+    def __init__(self, height=40, width=120, keys=None, end_key=ESCAPE_KEY):
+        self.height = height
+        self.width = width
+        self.cells = [[(" ", curses.A_NORMAL)] * width for _ in range(height)]
+        self.attrs = curses.A_NORMAL
+        self.is_nodelay = False
+
+        self.write_calls = 0
+        self.cells_written = 0
+        self.refresh_calls = 0
+        self.refresh_times = []
+
+        self.input_fd, self.feed_fd = os.pipe()
+        os.set_blocking(self.input_fd, False)
+        self.pending = deque()
+        self.end_key = end_key
+        self.script_done = False
+        self.closed = False
+        self.feeder = None
+        if keys is not None:
+            self.play(keys)
+
+    def play(self, keys):
+        """Starts typing a key script in the background."""
+        self.feeder = threading.Thread(target=self.feed_keys, args=(list(keys),), daemon=True)
+        self.feeder.start()
+
+    def feed_keys(self, keys):
+        try:
+            for item in keys:
+                delay, key = item if isinstance(item, tuple) else (0, item)
+                if delay:
+                    time.sleep(delay)
+                if self.closed:
+                    return
+                self.type_key(key)
+            self.script_done = True
+            os.write(self.feed_fd, b"\0")  # left unread, so the selector keeps seeing end_key
+        except OSError:
+            pass  # the screen was closed while keys were still scripted
+
+    def type_key(self, key):
+        if callable(key):
+            key = key()
+        if isinstance(key, str):
+            key = ord(key)
+        self.pending.append(key)
+        os.write(self.feed_fd, b"\0")
+
+    def fileno(self):
+        return self.input_fd
+
+    def getmaxyx(self):
+        return self.height, self.width
+
+    def nodelay(self, flag):
+        self.is_nodelay = flag
+
+    def keypad(self, flag):
+        pass
+
+    def getch(self):
+        while True:
+            if self.pending:
+                os.read(self.input_fd, 1)
+                return self.pending.popleft()
+            if self.script_done:
+                if self.end_key is None:
+                    raise ScriptEnded()
+                return self.end_key
+            if self.is_nodelay:
+                return -1
+            select.select([self.input_fd], [], [])
+
+    def attron(self, attrs):
+        self.attrs |= attrs
+
+    def attroff(self, attrs):
+        self.attrs &= ~attrs
+
+    def bkgd(self, char, attr=curses.A_NORMAL):
+        pass
+
+    def addstr(self, y, x, text, attr=None):
+        if attr is None:
+            attr = self.attrs
+        self.write_calls += 1
+        if not 0 <= y < self.height:
+            raise curses.error("addstr() returned ERR")
+        row = self.cells[y]
+        for i, char in enumerate(text):
+            if 0 <= x + i < self.width:
+                row[x + i] = (char, attr)
+                self.cells_written += 1
+
+    def addch(self, y, x, char, attr=None):
+        if isinstance(char, int):
+            char = chr(char & curses.A_CHARTEXT)
+        self.addstr(y, x, char, attr)
+
+    def chgat(self, y, x, num, attr):
+        self.write_calls += 1
+        row = self.cells[y]
+        for i in range(x, min(x + num, self.width)):
+            row[i] = (row[i][0], attr)
+            self.cells_written += 1
+
+    def inch(self, y, x):
+        char, attr = self.cells[y][x]
+        return ord(char) | attr
+
+    def instr(self, y, x, n=None):
+        row = self.cells[y][x:] if n is None else self.cells[y][x:x + n]
+        return "".join(char for char, _ in row).encode()
+
+    def erase(self):
+        self.cells = [[(" ", curses.A_NORMAL)] * self.width for _ in range(self.height)]
+
+    def clear(self):
+        self.erase()
+
+    def refresh(self):
+        self.refresh_calls += 1
+        self.refresh_times.append(time.perf_counter())
+
+    def noutrefresh(self):
+        self.refresh()
+
+    def get_text(self):
+        return "\n".join("".join(char for char, _ in row).rstrip() for row in self.cells)
+
+    def get_stats(self):
+        return {
+            "write_calls": self.write_calls,
+            "cells_written": self.cells_written,
+            "refresh_calls": self.refresh_calls,
+        }
+
+    def close(self):
+        self.closed = True
+        os.close(self.input_fd)
+        os.close(self.feed_fd)
+
+
+@contextmanager
+def headless_curses():
+    """Lets curses helpers that need initscr() run against a HeadlessScreen."""
+    patched = {
+        (curses, "color_pair"): lambda n: n << 8,
+        (curses, "curs_set"): lambda visibility: 1,
+        (curses, "doupdate"): lambda: None,
+        (curses.panel, "update_panels"): lambda: None,
+    }
+    saved = {target: getattr(*target) for target in patched}
+    for (module, name), func in patched.items():
+        setattr(module, name, func)
+    try:
+        yield
+    finally:
+        for (module, name), func in saved.items():
+            setattr(module, name, func)
+
+
+class ReplayAudioSource:
+    """
+    Plays prerecorded audio to the listener in place of the microphone.
+
+    The clip runs on `clock` (the wall clock by default) from start(), and
+    read(duration) waits `duration` seconds then returns the last `duration`
+    seconds of the clip, like recording from a live input would. Past the
+    end it returns silence. latest(n) returns the last n samples without
+    waiting, for continuous readers such as the tuner.
+    """
+    def __init__(self, samples, sample_rate, realtime=True, clock=None):
+        self.samples = np.asarray(samples, dtype=np.float32)
+        self.sample_rate = sample_rate
+        self.realtime = realtime
+        self.clock = Clock() if clock is None else clock
+        self.start_time = None
+
+    @classmethod
+    def from_wavs(cls, filepaths, gap=0.0, **kwargs):
+        """Joins wav files (mono or first channel) with `gap` seconds of silence between them."""
+        clips = []
+        sample_rate = None
+        for filepath in filepaths:
+            rate, data = wavfile.read(filepath)
+            if sample_rate is None:
+                sample_rate = rate
+            elif rate != sample_rate:
+                raise ValueError(f"{filepath} is {rate} Hz, expected {sample_rate} Hz")
+            if data.ndim > 1:
+                data = data[:, 0]
+            if np.issubdtype(data.dtype, np.integer):
+                data = data.astype(np.float32) / np.iinfo(data.dtype).max
+            clips.append(data.astype(np.float32))
+            clips.append(np.zeros(int(gap * rate), dtype=np.float32))
+        return cls(np.concatenate(clips), sample_rate, **kwargs)
+
+    def start(self):
+        self.start_time = self.clock()
+
+    def read(self, duration):
+        if self.start_time is None:
+            self.start()
+        if self.realtime:
+            self.clock.sleep(duration)
+        return self.latest(int(duration * self.sample_rate))
+
+    def latest(self, n):
+        """The last n samples played, like AudioStream.latest."""
+        if self.start_time is None:
+            self.start()
+        end = int((self.clock() - self.start_time) * self.sample_rate)
+        segment = self.samples[max(0, end - n):end]
+        if len(segment) < n:
+            segment = np.concatenate([np.zeros(n - len(segment), dtype=np.float32), segment])
+        return segment
+
+
+def run_headless_lesson(fretboard, keys=(), audio_source=None, height=40, width=120, clock=None, **page_kwargs):
+    """
+    Drives one NoteToFret lesson end to end without a terminal and reports its cost.
+
+    `keys` is a key script, or a callable taking the page and returning one
+    (so scripted answers can look at page.curr_spot). The page runs on
+    `clock`; key delays are always wall seconds.
+    """
+    from fretty.pages.loop import EventLoop
+    from fretty.pages.note_to_fret import NoteToFret
+
+    screen = HeadlessScreen(height, width)
+    with headless_curses():
+        loop = EventLoop(screen, input_fd=screen.fileno(), clock=clock)
+        try:
+            page = NoteToFret(screen, fretboard, loop=loop, audio_source=audio_source, **page_kwargs)
+            screen.play(keys(page) if callable(keys) else keys)
+            start = time.perf_counter()
+            page.load()
+            wall_time = time.perf_counter() - start
+        finally:
+            loop.close()
+            screen.close()
+
+    report = {"wall_time": wall_time}
+    report.update({f"screen_{key}": value for key, value in screen.get_stats().items()})
+    report.update({f"buffer_{key}": value for key, value in page.stdscr.get_stats().items()})
+    return report
+
+
+def run_headless_menu(fretboard, keys=(), audio_source=None, height=40, width=120, clock=None, **menu_kwargs):
+    """
+    Drives cli.run_menu from the main menu without a terminal and reports its cost.
+
+    `keys` scripts the whole visit, e.g. into Progress, a lesson or the
+    tuner and back. The run ends when the script exits from the main menu,
+    or when the script runs out, wherever it is.
+    """
+    from fretty.cli import run_menu
+    from fretty.pages.loop import EventLoop
+
+    screen = HeadlessScreen(height, width, end_key=None)
+    exited = False
+    with headless_curses():
+        loop = EventLoop(screen, input_fd=screen.fileno(), clock=clock)
+        try:
+            screen.play(keys)
+            start = time.perf_counter()
+            try:
+                run_menu(screen, fretboard, loop, audio_source=audio_source, **menu_kwargs)
+                exited = True
+            except ScriptEnded:
+                pass
+            wall_time = time.perf_counter() - start
+        finally:
+            loop.close()
+            screen.close()
+
+    report = {"wall_time": wall_time, "exited": exited}
+    report.update({f"screen_{key}": value for key, value in screen.get_stats().items()})
+    return report
@@ -0,0 +1,377 @@
+import os
+import sys
+import glob
+import json
+import math
+import shutil
+import threading
+from array import array
+
+from fretty.globals import FAIL_TIME
+from fretty.stats import SKETCH_BINS, get_bin, get_sketch_quantile
+from fretty.utils import atomic_write_json
+
+RATINGS = ["fail", "hard", "good", "easy"]
+STATUSES = ["unlearnable", "unseen", "new", "learning", "review"]
+
+RATING_CODES = {rating: i for i, rating in enumerate(RATINGS)}
+STATUS_CODES = {status: i for i, status in enumerate(STATUSES)}
+
+# column name -> array typecode
+COLUMNS = {
+    "spot": "H",
+    "timestamp": "d",
+    "reaction_time": "f",
+    "rating": "b",
+    "status": "b",
+}
+
+
+# retention: raw attempts for RETAIN_DAYS, then per-week summaries for
+# SUMMARY_WEEKS, then one all-time summary per spot (week None)
+RETAIN_DAYS = 28
+SUMMARY_WEEKS = 52
+WEEK_SECONDS = 7 * 24 * 60 * 60
+COMPACT_MIN_ROWS = 512      # don't rewrite the columns for fewer expired rows than this
+
+SUMMARIES_FILENAME = "summaries.json"
+
+
+def get_history_dirpath(state_filepath, generation=0):
+    dirpath = f"{state_filepath}.history"
+    if generation:
+        dirpath += f".{generation}"  # compacted histories are rewritten into a fresh directory
+    return dirpath
+
+
+def remove_stale_history_dirpaths(state_filepath, generation):
+    """
+    Deletes the column directories of every generation but `generation`.
+    A process that dies between writing a compacted snapshot and removing
+    the old columns (or halfway through writing the new ones) leaves one
+    behind. Only safe while no snapshot is being written.
+    """
+    prefix = get_history_dirpath(state_filepath)
+    for dirpath in glob.glob(glob.escape(prefix) + "*"):
+        suffix = dirpath[len(prefix):]
+        if suffix and not (suffix.startswith(".") and suffix[1:].isdigit()):
+            continue
+        if dirpath != get_history_dirpath(state_filepath, generation) and os.path.isdir(dirpath):
+            shutil.rmtree(dirpath, ignore_errors=True)
+
+
+def get_compaction_cutoff(now):
+    """Timestamp before which rows are summarised: a week boundary at least RETAIN_DAYS ago."""
+    return (now - RETAIN_DAYS * 24 * 60 * 60) // WEEK_SECONDS * WEEK_SECONDS
+
+
+def read_column_files(dirpath, length, byteorder):
+    columns = {}
+    for name, code in COLUMNS.items():
+        column = array(code)
+        with open(os.path.join(dirpath, name), 'rb') as file:
+            column.fromfile(file, length)
+        if byteorder != sys.byteorder:
+            column.byteswap()
+        columns[name] = column
+    return columns
+
+
+def read_summaries_file(filepath):
+    with open(filepath, 'r') as file:
+        summaries_state = json.load(file)
+    return {(summary["spot"], summary["week"]): AttemptSummary(summary) for summary in summaries_state}
+
+
+class AttemptSummary:
+    """Counts, total and reaction time sketch for the attempts rolled up from one spot and week."""
+    __slots__ = ("count", "fails", "total_time", "sketch")
+
+    def __init__(self, summary_state=None):
+        if summary_state is None:
+            self.count = 0
+            self.fails = 0
+            self.total_time = 0.0
+            self.sketch = [0] * SKETCH_BINS
+        else:
+            self.count = summary_state["count"]
+            self.fails = summary_state["fails"]
+            self.total_time = summary_state["total_time"]
+            self.sketch = list(summary_state["sketch"])
+
+    def add(self, reaction_time, rating):
+        # misses count as FAIL_TIME, as in SpotStats
+        if math.isnan(reaction_time):
+            reaction_time = FAIL_TIME
+        self.count += 1
+        self.fails += rating == RATING_CODES["fail"]
+        self.total_time += reaction_time
+        self.sketch[get_bin(reaction_time)] += 1
+
+    def merge(self, other):
+        self.count += other.count
+        self.fails += other.fails
+        self.total_time += other.total_time
+        self.sketch = [a + b for a, b in zip(self.sketch, other.sketch)]
+
+    def get_mean(self):
+        return self.total_time / self.count if self.count else None
+
+    def get_quantile(self, q):
+        return get_sketch_quantile(self.sketch, q)
+
+    def get_state(self):
+        return {
+            "count": self.count,
+            "fails": self.fails,
+            "total_time": self.total_time,
+            "sketch": list(self.sketch),
+        }
+
+
+class AttemptHistory:
+    """
+    Column store holding every attempt made on a fretboard.
+
+    Each attempt is one row spread across typed arrays, so a row costs
+    16 bytes instead of a tuple of python objects per spot. Missed notes
+    are stored with a NaN reaction time.
+
+    On disk every column is its own raw file in a directory next to the
+    state file. Columns are only read when rows are first accessed; until
+    then new attempts are held in memory after the `base` rows on disk,
+    and saving appends just the rows written since the last save.
+
+    Rows older than the retention window are rolled up by compact() into
+    AttemptSummary objects keyed by (spot, week), kept in a json file next to
+    the columns, so the raw columns stay bounded.
+    """
+    def __init__(self):
+        self.columns = {name: array(code) for name, code in COLUMNS.items()}
+        self.base = 0               # rows on disk that are not loaded yet
+        self.loader = None          # returns the first `base` rows as columns
+        self.byteorder = sys.byteorder
+        self.saved_dirpath = None
+        self.saved_length = 0
+        self.generation = 0         # bumped each time compaction rewrites the columns
+        self.dropped = 0            # rows compaction has removed since startup
+        self.summaries = {}         # (spot, week) -> AttemptSummary
+        self.summaries_loader = None
+        self.summaries_dirty = False
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        with self.lock:
+            return self.base + len(self.columns["spot"])
+
+    def append(self, spot_idx, timestamp, reaction_time, rating, status):
+        if reaction_time is None:
+            reaction_time = math.nan
+        with self.lock:
+            self.columns["spot"].append(spot_idx)
+            self.columns["timestamp"].append(timestamp)
+            self.columns["reaction_time"].append(reaction_time)
+            self.columns["rating"].append(RATING_CODES[rating])
+            self.columns["status"].append(STATUS_CODES[status])
+
+    def load(self):
+        """Reads the on-disk rows in front of any attempts appended since startup."""
+        with self.lock:
+            if self.base == 0:
+                return
+            columns = self.loader()
+            for name, column in columns.items():
+                column.extend(self.columns[name])
+            self.columns = columns
+            self.base = 0
+        self.loader = None
+        self.byteorder = sys.byteorder
+
+    def get_marker(self):
+        """Rows appended so far, counting compacted ones, so it still marks the same point after a compaction."""
+        with self.lock:
+            return self.dropped + self.base + len(self.columns["spot"])
+
+    def snapshot(self, marker=None):
+        """
+        A copy of the rows up to `marker` (by default, all of them) for a
+        writer thread to compact and save. Only rows since the last save are
+        copied; if the copy needs the earlier ones it reads them back from
+        this history then.
+        """
+        history = AttemptHistory()
+        with self.lock:
+            length = self.base + len(self.columns["spot"])
+            if marker is not None:
+                length = marker - self.dropped
+            start = max(self.base, min(self.saved_length, length))
+            history.columns = {name: column[start - self.base:length - self.base] for name, column in self.columns.items()}
+            history.base = start
+            history.loader = (lambda: self.read_columns(start)) if start > 0 else None
+            history.byteorder = self.byteorder
+            history.saved_dirpath = self.saved_dirpath
+            history.saved_length = self.saved_length
+            history.generation = self.generation
+            history.summaries = self.summaries
+            history.summaries_loader = self.summaries_loader
+            history.summaries_dirty = self.summaries_dirty
+        return history
+
+    def read_columns(self, length):
+        """Copies of the columns' first `length` rows."""
+        self.load()
+        with self.lock:
+            return {name: column[:length] for name, column in self.columns.items()}
+
+    def get_dirpath(self, state_filepath):
+        return get_history_dirpath(state_filepath, self.generation)
+
+    def get_summaries(self):
+        """Returns the (spot, week) -> AttemptSummary roll-ups of compacted rows."""
+        if self.summaries_loader is not None:
+            self.summaries = self.summaries_loader()
+            self.summaries_loader = None
+        return self.summaries
+
+    def compact(self, cutoff, min_rows=COMPACT_MIN_ROWS):
+        """
+        Rolls rows from before `cutoff` into summaries and drops them.
+
+        Rows are in time order (undated legacy rows first), so the expired rows
+        are a prefix. Returns how many were dropped, or 0 if fewer than
+        `min_rows` have expired. Works on its own summary objects, so it can
+        run on a snapshot() while the original is still in use.
+        """
+        self.load()
+        timestamps = self.columns["timestamp"]
+        n = 0
+        while n < len(timestamps) and (math.isnan(timestamps[n]) or timestamps[n] < cutoff):
+            n += 1
+        if n == 0 or n < min_rows:
+            return 0
+
+        summaries = {key: AttemptSummary(summary.get_state()) for key, summary in self.get_summaries().items()}
+        spots = self.columns["spot"]
+        reaction_times = self.columns["reaction_time"]
+        ratings = self.columns["rating"]
+        for i in range(n):
+            week = None if math.isnan(timestamps[i]) else int(timestamps[i] // WEEK_SECONDS)
+            key = (spots[i], week)
+            if key not in summaries:
+                summaries[key] = AttemptSummary()
+            summaries[key].add(reaction_times[i], ratings[i])
+
+        oldest_week = int(cutoff // WEEK_SECONDS) - SUMMARY_WEEKS
+        for (spot, week) in list(summaries):
+            if week is not None and week < oldest_week:
+                summary = summaries.pop((spot, week))
+                summaries.setdefault((spot, None), AttemptSummary()).merge(summary)
+
+        for column in self.columns.values():
+            del column[:n]
+        self.summaries = summaries
+        self.summaries_dirty = True
+        self.generation += 1
+        return n
+
+    def apply_compaction(self, compacted, n):
+        """Catches up with a compact() done on a snapshot whose columns are now saved."""
+        with self.lock:
+            from_base = min(n, self.base)
+            self.base -= from_base
+            for column in self.columns.values():
+                del column[:n - from_base]
+            self.dropped += n
+            if self.base > 0:
+                dirpath, length, byteorder = compacted.saved_dirpath, self.base, sys.byteorder
+                self.loader = lambda: read_column_files(dirpath, length, byteorder)
+                self.byteorder = byteorder
+            else:
+                self.loader = None
+            self.generation = compacted.generation
+            self.summaries = compacted.summaries
+            self.summaries_loader = None
+            self.summaries_dirty = False
+
+    def get_rows(self, spot_idx=None):
+        """Returns (timestamp, reaction_time, rating, status) rows, optionally for one spot."""
+        self.load()
+        rows = []
+        # the writer thread may drop compacted rows meanwhile, so read under the lock
+        with self.lock:
+            spots = self.columns["spot"]
+            timestamps = self.columns["timestamp"]
+            reaction_times = self.columns["reaction_time"]
+            ratings = self.columns["rating"]
+            statuses = self.columns["status"]
+            for i in range(len(spots)):
+                if spot_idx is not None and spots[i] != spot_idx:
+                    continue
+                reaction_time = reaction_times[i]
+                if math.isnan(reaction_time):
+                    reaction_time = None
+                rows.append((timestamps[i], reaction_time, RATINGS[ratings[i]], STATUSES[statuses[i]]))
+        return rows
+
+    def get_spot_history(self, spot_idx):
+        """Returns the legacy (time, rating, status) view of one spot's attempts."""
+        return [(t, rating, status) for _, t, rating, status in self.get_rows(spot_idx)]
+
+    def write(self, dirpath):
+        """Writes unsaved rows to the column files in `dirpath` and returns the history state."""
+        new_dirpath = dirpath != self.saved_dirpath
+        if new_dirpath or self.byteorder != sys.byteorder:
+            self.load()
+            start = 0
+        else:
+            start = self.saved_length
+
+        with self.lock:
+            length = self.base + len(self.columns["spot"])
+            tails = {name: column[start - self.base:] for name, column in self.columns.items()}
+
+        os.makedirs(dirpath, exist_ok=True)
+        for name, tail in tails.items():
+            filepath = os.path.join(dirpath, name)
+            mode = 'r+b' if os.path.exists(filepath) else 'wb'
+            with open(filepath, mode) as file:
+                file.seek(start * tail.itemsize)
+                file.truncate()
+                tail.tofile(file)
+                file.flush()
+                os.fsync(file.fileno())
+
+        if new_dirpath or self.summaries_dirty:
+            summaries_state = [
+                {"spot": spot, "week": week, **summary.get_state()}
+                for (spot, week), summary in self.get_summaries().items()
+            ]
+            atomic_write_json(os.path.join(dirpath, SUMMARIES_FILENAME), summaries_state)
+            self.summaries_dirty = False
+
+        self.mark_saved(dirpath, length)
+        return {"byteorder": sys.byteorder, "length": length, "generation": self.generation}
+
+    def mark_saved(self, dirpath, length):
+        self.saved_dirpath = dirpath
+        self.saved_length = length
+
+    def set_state(self, history_state, state_filepath):
+        self.generation = history_state.get("generation", 0)
+        dirpath = get_history_dirpath(state_filepath, self.generation)
+        summaries_filepath = os.path.join(dirpath, SUMMARIES_FILENAME)
+        if os.path.exists(summaries_filepath):
+            self.summaries_loader = lambda: read_summaries_file(summaries_filepath)
+
+        byteorder = history_state.get("byteorder", sys.byteorder)
+        self.set_source(
+            history_state["length"],
+            lambda: read_column_files(dirpath, history_state["length"], byteorder),
+        )
+        self.byteorder = byteorder
+        self.mark_saved(dirpath, self.base)
+
+    def set_source(self, length, loader):
+        """Backs the first `length` rows with `loader`, which is only called on first access."""
+        self.base = length
+        self.loader = loader if length > 0 else None
@@ -0,0 +1,79 @@
+from fretty.notes import note_to_frequency, spot_to_note
+
+DEFAULT_INSTRUMENT = "guitar"
+
+# listen windows are at least this long, and long enough that the FFT bins
+# are SEMITONE_BINS to a semitone at the instrument's lowest note
+BASE_SEGMENT_DURATION = 0.5
+SEMITONE_BINS = 2
+SEMITONE_RATIO = 2 ** (1 / 12)
+
+# the detector band starts this far below the lowest open string
+BAND_MARGIN = 0.85
+
+SINGLE_INLAY_FRETS = (3, 5, 7, 9, 15, 17, 19, 21)
+DOUBLE_INLAY_FRETS = (12, 24)
+
+
+def get_inlays(num_strings, num_frets):
+    """(string, fret) positions that carry an inlay dot: singles on the middle string, doubles either side of it."""
+    middle = num_strings // 2
+    inlays = set()
+    for f in range(1, num_frets + 1):
+        if f in SINGLE_INLAY_FRETS:
+            inlays.add((middle, f))
+        elif f in DOUBLE_INLAY_FRETS:
+            inlays.update({(middle - 1, f), (middle + 1, f)})
+    return inlays
+
+
+class Instrument:
+    """
+    A neck layout (strings, frets, standard tuning), the band the pitch
+    detector listens in and the detector used unless another is asked for
+    (a name from fretty.audio.DETECTORS). The tuning runs from the lowest
+    string up.
+    """
+    def __init__(self, name, tuning, num_frets=12, lowest_freq=None, highest_freq=2000, detector="gcd"):
+        self.name = name
+        self.tuning = list(tuning)
+        self.num_strings = len(tuning)
+        self.num_frets = num_frets
+        self.lowest_note = tuning[0]
+        self.highest_note = spot_to_note((self.num_strings - 1, num_frets), tuning)
+        if lowest_freq is None:
+            lowest_freq = round(BAND_MARGIN * note_to_frequency[self.lowest_note])
+        self.lowest_freq = lowest_freq
+        self.highest_freq = highest_freq
+        self.detector = detector
+        self.inlays = get_inlays(self.num_strings, num_frets)
+
+    def get_segment_duration(self, tuning=None):
+        """Length of one listen window, in seconds, for `tuning` (the standard one by default)."""
+        lowest_note = min(tuning or self.tuning, key=note_to_frequency.get)
+        semitone = note_to_frequency[lowest_note] * (SEMITONE_RATIO - 1)
+        return max(BASE_SEGMENT_DURATION, SEMITONE_BINS / semitone)
+
+
+# gcd's peak spacing breaks down below E2, where harmonics crowd together
+# (synthetic whole-neck accuracy: bass 63%, guitar-7 83%, against 96% on
+# guitar), so the extended-range profiles default to template matching,
+# which gets 99% or better on all of them
+INSTRUMENTS = {
+    instrument.name: instrument for instrument in [
+        Instrument("guitar", ["E2", "A2", "D3", "G3", "B3", "E4"]),
+        Instrument("guitar-24", ["E2", "A2", "D3", "G3", "B3", "E4"], num_frets=24),
+        Instrument("guitar-7", ["B1", "E2", "A2", "D3", "G3", "B3", "E4"], num_frets=24, detector="template"),
+        Instrument("guitar-8", ["F#1", "B1", "E2", "A2", "D3", "G3", "B3", "E4"], num_frets=24, detector="template"),
+        Instrument("bass", ["E1", "A1", "D2", "G2"], num_frets=20, highest_freq=1000, detector="template"),
+        Instrument("bass-5", ["B0", "E1", "A1", "D2", "G2"], num_frets=24, highest_freq=1000, detector="template"),
+    ]
+}
+
+
+def get_instrument(name=None):
+    if name is None:
+        name = DEFAULT_INSTRUMENT
+    if name not in INSTRUMENTS:
+        raise ValueError(f"No instrument named {name!r}, expected one of {', '.join(INSTRUMENTS)}")
+    return INSTRUMENTS[name]
@@ -0,0 +1,143 @@
+import os
+import glob
+import json
+import time
+import shutil
+import threading
+
+from fretty.history import get_compaction_cutoff
+from fretty.utils import atomic_write_json
+
+
+class Journal:
+    """
+    Append-only log of spot changes kept next to a state snapshot.
+
+    Each attempt is appended and fsynced as it happens, so saving costs
+    O(new attempts). compact() rotates the log and rewrites the snapshot in
+    a background thread; rotated logs are only deleted once the new snapshot
+    has been renamed into place, so a crash at any point loses nothing. The
+    same thread rolls expired history rows into summaries, writing the
+    remaining columns into a fresh directory before the old one is removed.
+    """
+    def __init__(self, state_filepath):
+        self.state_filepath = state_filepath
+        self.journal_filepath = f"{state_filepath}.journal"
+        self.seq = 0
+        self.file = None
+        self.lock = threading.Lock()
+        self.compact_thread = None
+
+    def get_rotated_filepaths(self):
+        """Returns rotated journals (suffixed with their last seq) in order."""
+        rotated = []
+        for filepath in glob.glob(glob.escape(self.journal_filepath) + ".*"):
+            suffix = filepath[len(self.journal_filepath) + 1:]
+            if suffix.isdigit():
+                rotated.append((int(suffix), filepath))
+        return sorted(rotated)
+
+    def read_records(self):
+        filepaths = [filepath for _, filepath in self.get_rotated_filepaths()]
+        filepaths.append(self.journal_filepath)
+        for filepath in filepaths:
+            if not os.path.exists(filepath):
+                continue
+            with open(filepath, 'r') as file:
+                for line in file:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        break  # torn write at the tail of a crashed session
+                    yield record
+
+    def repair(self):
+        """Drops a partially written last line so new records start on a fresh line."""
+        if not os.path.exists(self.journal_filepath):
+            return
+        with open(self.journal_filepath, 'rb+') as file:
+            data = file.read()
+            if data and not data.endswith(b"\n"):
+                file.truncate(data.rfind(b"\n") + 1)
+
+    def replay(self, fretboard):
+        """Applies records newer than the fretboard's snapshot and attaches the journal to it."""
+        self.seq = fretboard.journal_seq
+        for record in self.read_records():
+            if record["seq"] <= fretboard.journal_seq:
+                continue
+            fretboard.apply_journal_record(record)
+            self.seq = max(self.seq, record["seq"])
+
+        self.repair()
+        self.file = open(self.journal_filepath, 'a')
+        fretboard.journal = self
+
+    def append(self, record):
+        with self.lock:
+            if "seq" in record:
+                self.seq = record["seq"]  # numbered by a Checkpointer when it was queued
+            else:
+                self.seq += 1
+                record["seq"] = self.seq
+            self.file.write(json.dumps(record) + "\n")
+            self.file.flush()
+            os.fsync(self.file.fileno())
+
+    def compact(self, fretboard):
+        """Rotates the journal and writes a fresh snapshot in the background."""
+        self.wait()
+        state = fretboard.get_state()
+        history = fretboard.history.snapshot()
+        self.rotate()
+
+        self.compact_thread = threading.Thread(
+            target=self.run_snapshot,
+            args=(state, history, fretboard.history),
+        )
+        self.compact_thread.start()
+
+    def run_snapshot(self, state, history, live_history):
+        try:
+            self.write_snapshot(state, history, live_history)
+        except IOError as e:
+            print(f"Error writing state file: {e}")
+
+    def checkpoint(self, state, history, live_history):
+        """compact() for a state captured elsewhere, run on the calling thread. Raises on write errors."""
+        self.rotate()
+        self.write_snapshot(state, history, live_history)
+
+    def rotate(self):
+        with self.lock:
+            self.file.close()
+            if os.path.getsize(self.journal_filepath) > 0:
+                os.replace(self.journal_filepath, f"{self.journal_filepath}.{self.seq}")
+            self.file = open(self.journal_filepath, 'a')
+
+    def write_snapshot(self, state, history, live_history):
+        old_dirpath = history.get_dirpath(self.state_filepath)
+        compacted = history.compact(get_compaction_cutoff(time.time()))
+        history_dirpath = history.get_dirpath(self.state_filepath)
+        state["history"] = history.write(history_dirpath)
+        atomic_write_json(self.state_filepath, state)
+        if compacted:
+            # the snapshot now points at the rewritten columns, so the old ones can go
+            live_history.apply_compaction(history, compacted)
+            shutil.rmtree(old_dirpath, ignore_errors=True)
+        live_history.mark_saved(history_dirpath, state["history"]["length"])
+
+        for seq, filepath in self.get_rotated_filepaths():
+            if seq <= state["journal_seq"]:
+                os.remove(filepath)
+
+    def wait(self):
+        if self.compact_thread is not None:
+            self.compact_thread.join()
+            self.compact_thread = None
+
+    def close(self):
+        self.wait()
+        if self.file is not None:
+            self.file.close()
+            self.file = None
@@ -0,0 +1,59 @@
+import ast
+
+from fretty.globals import *
+
+STATE_VERSION = 2
+
+
+def get_state_version(state):
+    if "version" in state:
+        return state["version"]
+    # init_state.json still stores the open string as the first spot
+    if len(state["spots"][0]) == NUM_FRETS + 1:
+        return 0
+    return 1
+
+
+def migrate_v0(state):
+    """init_state.json layout -> state.json layout."""
+    state = dict(state)
+    spots = []
+    for string in state["spots"]:
+        string_spots = []
+        for spot_state in string[1:]:
+            spot_state = dict(spot_state)
+            spot_state.pop("note_REMOVE", None)
+            if spot_state["interval"] is None:
+                spot_state["interval"] = 1
+            string_spots.append(spot_state)
+        spots.append(string_spots)
+    state["spots"] = spots
+    return state
+
+
+def migrate_v1(state):
+    """state.json layout -> flat spot list with integer position keys."""
+    def pos_to_idx(pos):
+        s, f = ast.literal_eval(pos)
+        return s * NUM_FRETS + (f - 1)
+
+    state = dict(state)
+    state["spots"] = [spot_state for string in state["spots"] for spot_state in string]
+    state["reviews"] = {
+        review_date: [pos_to_idx(pos) for pos in positions]
+        for review_date, positions in state.pop("review_date_to_spots", {}).items()
+    }
+    state.pop("spot_to_review_date", None)
+    return state
+
+
+MIGRATIONS = [migrate_v0, migrate_v1]
+
+
+def migrate_state(state):
+    version = get_state_version(state)
+    while version < STATE_VERSION:
+        state = MIGRATIONS[version](state)
+        version += 1
+    state["version"] = STATE_VERSION
+    return state
@@ -1,53 +1,23 @@
+NOTE_NAMES = ["C", "C#", "D", "D#", "E", "F", "F#", "G", "G#", "A", "A#", "B"]
+
+# equal temperament from B0 (5-string bass) to E6 (24th fret of a guitar's high E)
+LOWEST_MIDI = 23
+HIGHEST_MIDI = 88
+
+
+def midi_to_note(midi):
+    return f"{NOTE_NAMES[midi % 12]}{midi // 12 - 1}"
+
+
+def midi_to_frequency(midi):
+    return round(440 * 2 ** ((midi - 69) / 12), 2)
+
+
 note_to_frequency = {
-    "D2": 73.42,
-    "D#2": 77.78,
-    "E2": 82.41,
-    "F2": 87.31,
-    "F#2": 92.50,
-    "G2": 98.00,
-    "G#2": 103.83,
-    "A2": 110.00,
-    "A#2": 116.54,
-    "B2": 123.47,
-    "C3": 130.81,
-    "C#3": 138.59,
-    "D3": 146.83,
-    "D#3": 155.56,
-    "E3": 164.81,
-    "F3": 174.61,
-    "F#3": 185.00,
-    "G3": 196.00,
-    "G#3": 207.65,
-    "A3": 220.00,
-    "A#3": 233.08,
-    "B3": 246.94,
-    "C4": 261.63,
-    "C#4": 277.18,
-    "D4": 293.66,
-    "D#4": 311.13,
-    "E4": 329.63,
-    "F4": 349.23,
-    "F#4": 369.99,
-    "G4": 392.00,
-    "G#4": 415.30,
-    "A4": 440.00,
-    "A#4": 466.16,
-    "B4": 493.88,
-    "C5": 523.25,
-    "C#5": 554.37,
-    "D5": 587.33,
-    "D#5": 622.25,
-    "E5": 659.25,
-    "F5": 698.46,
-    "F#5": 739.99,
-    "G5": 783.99,
-    "G#5": 830.61,
-    "A5": 880.00,
-    "A#5": 932.33,
-    "B5": 987.77,
+    midi_to_note(midi): midi_to_frequency(midi) for midi in range(LOWEST_MIDI, HIGHEST_MIDI + 1)
 }
 
-def note_to_spots(note, tuning):
+def note_to_spots(note, tuning, num_frets=12):
     spots = []
     
     notes = list(note_to_frequency.keys())
@@ -55,7 +25,7 @@ def note_to_spots(note, tuning):
     for string, open_note, in enumerate(tuning):
         open_note_idx = notes.index(open_note)
         fret = note_idx - open_note_idx
-        if fret >= 0 and fret <= 12:
+        if fret >= 0 and fret <= num_frets:
             spots.append((string, fret))
 
     return spots
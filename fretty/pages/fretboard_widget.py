@@ -0,0 +1,112 @@
+import re
+import curses
+
+from fretty.globals import *
+
+CELL_WIDTH = 3
+
+# (instrument, tuning, view) -> rendered grid lines, shared by every widget
+_static_layers = {}
+
+
+def render_static_layer(instrument, tuning, view):
+    """Renders the grid, inlays and string labels once as one line per string."""
+    key = (instrument.name, tuple(tuning), view)
+    lines = _static_layers.get(key, None)
+    if lines is not None:
+        return lines
+
+    lines = []
+    for s in get_string_order(view, len(tuning)):
+        string = re.sub(r'\d+', '', tuning[s])
+        line = string.center(CELL_WIDTH) + "║"
+        for f in range(1, instrument.num_frets + 1):
+            line += " ● " if (s, f) in instrument.inlays else "   "
+            line += "│"
+        lines.append(line)
+
+    _static_layers[key] = lines
+    return lines
+
+
+def get_fretboard_size(fretboard):
+    """(height, width) of the grid in cells: a row per string, a label column and a column per fret."""
+    return fretboard.num_strings, (CELL_WIDTH + 1) * (fretboard.num_frets + 1)
+
+
+def get_string_order(view, num_strings=NUM_STRINGS):
+    strings = list(range(num_strings))
+    if view == "first_person":
+        strings.reverse()
+    return strings
+
+
+class FretboardWidget:
+    """
+    The fretboard grid drawn by every page.
+
+    The static layer (grid, inlays, string labels) is rendered once and
+    blitted as one write per string. Status colours, highlights and markers
+    live in named overlay layers on top, each a {(string, fret): attr} map,
+    and changing an overlay only redraws the cells it touches.
+    """
+    def __init__(self, screen, fretboard, top_y, left_x):
+        self.screen = screen
+        self.fretboard = fretboard
+        self.top_y = top_y
+        self.left_x = left_x
+        self.layers = {}    # name -> {pos: attr}, drawn in insertion order
+
+    def get_static_layer(self):
+        return render_static_layer(self.fretboard.instrument, self.fretboard.tuning, self.fretboard.view)
+
+    def get_pos_coords(self, pos):
+        string, fret = pos
+        screen_x = self.left_x + (4 * fret)
+        if self.fretboard.view == "first_person":
+            screen_y = self.top_y + (self.fretboard.num_strings - string) - 1
+        else:
+            screen_y = self.top_y + string
+
+        return screen_x, screen_y
+
+    def get_spot_coords(self, spot):
+        return self.get_pos_coords(spot.get_pos())
+
+    def draw(self):
+        for i, line in enumerate(self.get_static_layer()):
+            self.screen.addstr(self.top_y + i, self.left_x, line)
+        for cells in self.layers.values():
+            for pos, attr in cells.items():
+                self.draw_cell(pos, attr)
+
+    def draw_cell(self, pos, attr=None):
+        if attr is None:
+            attr = self.get_cell_attr(pos)
+        x, y = self.get_pos_coords(pos)
+        self.screen.chgat(y, x, CELL_WIDTH, attr)
+
+    def get_cell_attr(self, pos):
+        attr = curses.A_NORMAL
+        for cells in self.layers.values():
+            attr = cells.get(pos, attr)
+        return attr
+
+    def set_overlay(self, name, cells):
+        """Replaces an overlay layer, redrawing only the cells that changed."""
+        old_cells = self.layers.get(name, {})
+        self.layers[name] = dict(cells)
+        for pos in set(old_cells) | set(cells):
+            if old_cells.get(pos, None) != cells.get(pos, None):
+                self.draw_cell(pos)
+
+    def set_cell(self, name, pos, attr):
+        self.layers.setdefault(name, {})[pos] = attr
+        self.draw_cell(pos)
+
+    def clear_cell(self, name, pos):
+        if self.layers.get(name, {}).pop(pos, None) is not None:
+            self.draw_cell(pos)
+
+    def clear_overlay(self, name):
+        self.set_overlay(name, {})
@@ -0,0 +1,200 @@
+import os
+import sys
+import time
+import heapq
+import itertools
+import selectors
+import threading
+from collections import deque
+
+
+class Clock:
+    """
+    Monotonic time in seconds, running `speed` times faster than the wall
+    clock. Replays use a fast clock to get through a session sooner; the
+    default runs at wall speed.
+    """
+    def __init__(self, speed=1.0):
+        self.speed = speed
+        self.origin = time.monotonic()
+
+    def __call__(self):
+        return self.origin + (time.monotonic() - self.origin) * self.speed
+
+    def sleep(self, seconds):
+        time.sleep(seconds / self.speed)
+
+
+class EventLoop:
+    """
+    Selector-based loop shared by the pages.
+
+    Wakes on stdin readability (keys), on callbacks posted from other
+    threads (through a self-pipe) and on timers, instead of sleeping and
+    polling. Drawing is batched: handlers call request_render() and the
+    screen is refreshed once after each batch of events. Timers and pages
+    read the time from `clock`.
+    """
+    def __init__(self, screen, input_fd=None, clock=None):
+        self.screen = screen
+        self.clock = Clock() if clock is None else clock
+        self.selector = selectors.DefaultSelector()
+        self.input_fd = sys.stdin.fileno() if input_fd is None else input_fd
+        self.selector.register(self.input_fd, selectors.EVENT_READ, "input")
+
+        self.wake_r, self.wake_w = os.pipe()
+        os.set_blocking(self.wake_r, False)
+        os.set_blocking(self.wake_w, False)
+        self.selector.register(self.wake_r, selectors.EVENT_READ, "wake")
+        self.posted = deque()
+        self.closed = False
+        self.post_lock = threading.Lock()   # so a post never writes to a pipe close() has shut
+
+        self.timers = []
+        self.counter = itertools.count()
+        self.render_requested = False
+        self.running = False
+        self.on_key = None
+        self.lag = 0.0          # how late the last timer ran
+        self.max_lag = 0.0
+
+    def post(self, callback, *args):
+        """Schedules `callback` on the loop thread. Safe to call from any thread."""
+        with self.post_lock:
+            if self.closed:
+                return  # e.g. a listener thread finishing after its page has gone
+            self.posted.append((callback, args))
+            try:
+                os.write(self.wake_w, b"\0")
+            except BlockingIOError:
+                pass  # the pipe is full, so the loop is already due to wake
+
+    def call_later(self, delay, callback, *args):
+        timer = [self.clock() + delay, next(self.counter), None, callback, args]
+        heapq.heappush(self.timers, timer)
+        return timer
+
+    def call_every(self, interval, callback, *args):
+        timer = [self.clock(), next(self.counter), interval, callback, args]
+        heapq.heappush(self.timers, timer)
+        return timer
+
+    def cancel(self, timer):
+        timer[3] = None
+
+    def request_render(self):
+        self.render_requested = True
+
+    def stop(self):
+        self.running = False
+
+    def run_timers(self):
+        now = self.clock()
+        while self.timers and self.timers[0][0] <= now:
+            timer = heapq.heappop(self.timers)
+            deadline, _, interval, callback, args = timer
+            if callback is None:
+                continue
+            self.lag = now - deadline
+            self.max_lag = max(self.max_lag, self.lag)
+            if interval is not None:
+                # keep the original cadence, skipping ticks we are too late for
+                timer[0] = max(deadline + interval, now)
+                timer[1] = next(self.counter)
+                heapq.heappush(self.timers, timer)
+            callback(*args)
+
+    def get_timeout(self):
+        while self.timers and self.timers[0][3] is None:
+            heapq.heappop(self.timers)
+        if not self.timers:
+            return None
+        return max(0, (self.timers[0][0] - self.clock()) / self.clock.speed)
+
+    def read_keys(self):
+        while self.running:
+            key = self.screen.getch()
+            if key == -1:
+                break
+            if self.on_key is not None:
+                self.on_key(key)
+
+    def run_posted(self):
+        try:
+            os.read(self.wake_r, 4096)
+        except BlockingIOError:
+            pass
+        while self.posted and self.running:
+            callback, args = self.posted.popleft()
+            callback(*args)
+
+    def run(self, on_key=None):
+        """Dispatches events until stop() is called."""
+        self.on_key = on_key
+        self.running = True
+        self.screen.nodelay(True)
+        try:
+            self.read_keys()  # keys curses already buffered won't wake the selector
+            while self.running:
+                for key, _ in self.selector.select(self.get_timeout()):
+                    if key.data == "input":
+                        self.read_keys()
+                    else:
+                        self.run_posted()
+                if self.running:
+                    self.run_timers()
+                if self.render_requested:
+                    self.render_requested = False
+                    self.screen.refresh()
+        finally:
+            self.screen.nodelay(False)
+            self.on_key = None
+
+    def wait_for_key(self):
+        """Runs the loop until a key is pressed and returns it."""
+        pressed = []
+
+        def on_key(key):
+            pressed.append(key)
+            self.stop()
+
+        self.run(on_key)
+        return pressed[0]
+
+    def close(self):
+        with self.post_lock:
+            self.closed = True
+            self.selector.close()
+            os.close(self.wake_r)
+            os.close(self.wake_w)
+
+
+class Timeline:
+    """
+    A short animation played on an event loop.
+
+    `frames` is a list of (offset_seconds, draw_callback). Each frame is a
+    loop timer, so the animation runs while the page keeps listening,
+    drawing or waiting for keys.
+    """
+    def __init__(self, loop, frames):
+        self.loop = loop
+        self.frames = frames
+        self.timers = [loop.call_later(offset, self.run_frame, i) for i, (offset, _) in enumerate(frames)]
+        self.next_frame = 0
+
+    def run_frame(self, i):
+        self.next_frame = i + 1
+        self.frames[i][1]()
+        self.loop.request_render()
+
+    def is_done(self):
+        return self.next_frame >= len(self.frames)
+
+    def cancel(self, finish=True):
+        """Stops the animation, drawing its last frame unless `finish` is False."""
+        for timer in self.timers:
+            self.loop.cancel(timer)
+        if finish and not self.is_done():
+            self.run_frame(len(self.frames) - 1)
+        self.next_frame = len(self.frames)
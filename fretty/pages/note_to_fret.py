@@ -1,96 +1,105 @@
 import re
 import curses
-from art import text2art
-import time
+import statistics
 import threading
-import time
-import queue
-import random
 
-from fretty.pages.page import Page
+from fretty.pages.page import Page, BACK_KEYS
+from fretty.pages.loop import Timeline
+from fretty.pages.fretboard_widget import FretboardWidget, get_fretboard_size
 from fretty.globals import *
 from fretty.fretboard import EASY_TIME, GOOD_TIME, FAIL_TIME, MAX_DAILY_REVIEWS
-from fretty.audio import listen
-from fretty.utils import restyle_region
+from fretty.audio import record, BatchAnalyser
+from fretty.planner import LessonPlanner
+from fretty import profiling
+from fretty.warmup import log_startup
+from fretty.glyphs import get_glyph, get_max_glyph_width
 
 LISTEN_INTERVAL = 0.1   # How often to start a new thread
-SEGMENT_DURATION = 0.5
+TIMER_INTERVAL = 1 / 30  # Timer bar redraw rate
 
-RANDOM_POP_LEN = 2
+ORDINAL_SUFFIXES = {1: "ST", 2: "ND", 3: "RD"}
 
-STRING_MESSAGES = ["1ST STRING", "2ND STRING", "3RD STRING", "4TH STRING", "5TH STRING", "6TH STRING"]
+
+def get_string_message(string):
+    n = string + 1
+    return f"{n}{ORDINAL_SUFFIXES.get(n, 'TH')} STRING"
 
 class NoteToFret(Page):
-    def __init__(self, stdscr, fretboard, time_limit=None):
-        super().__init__(stdscr)
+    def __init__(self, stdscr, fretboard, time_limit=None, loop=None, auto_advance=False, audio_source=None,
+                 events=None, detector=None):
+        super().__init__(stdscr, loop)
         self.display = None
         self.fretboard = fretboard
         self.name = "Note -> Fretboard"
         self.state = {}
         self.key = None
         self.height, self.width = self.stdscr.getmaxyx()
-        self.top_y = (self.height - FRETBOARD_CHAR_HEIGHT) // 2
-        self.left_x = (self.width - FRETBOARD_CHAR_WIDTH) // 2
+        self.board_height, self.board_width = get_fretboard_size(fretboard)
+        self.glyph_width = get_max_glyph_width()
+        self.top_y = (self.height - self.board_height) // 2
+        # wide necks shift right to leave room for the note glyph
+        self.left_x = max((self.width - self.board_width) // 2, self.glyph_width + 7)
+        self.widget = FretboardWidget(self.stdscr, fretboard, self.top_y, self.left_x)
         self.timer = None
-        self.lesson = []
+        self.lesson = None
+        self.curr_spot = None
         self.time_limit = time_limit
+        self.listen_id = 0
+        self.on_heard = None
+        self.feedback = None
+        self.auto_advance = auto_advance
+        self.audio_source = audio_source  # None listens to the microphone
+        self.events = events    # EventLog recording prompts, keys, detections and attempts
+        self.detector = detector if detector is not None else fretboard.instrument.detector
+        self.analyser = None    # BatchAnalyser for the listeners, while a lesson runs
+        self.heard_any = False
+        self.prompt_frames = {}     # spot -> prerendered prompt draw calls
+        self.segment_duration = fretboard.instrument.get_segment_duration(fretboard.tuning)
         
 
     def load(self):
         self.stdscr.clear()
         self.stdscr.addstr(1, 5, "<-- Backspace / Esc", curses.A_BOLD)
 
-        strings = list(enumerate([s[:-1] for s in self.fretboard.tuning]))
-        if self.fretboard.view == "first_person":
-            strings.reverse()
-
-        frets = range(1, NUM_FRETS + 1)
-        if self.fretboard.view == "third_person":
-            frets.reverse()
-
-        line_y = self.top_y
-        for s, string in strings:
-            self.stdscr.addstr(line_y, self.left_x + 0, f" {string} ")
-            self.stdscr.addstr(line_y, self.left_x + 3, "║")
-
-            for f in frets:
-                if f in {3, 5, 7, 9} and string == "G":
-                    self.stdscr.addstr(line_y, self.left_x + 0 + f * 4, " ● ")
-                elif f == 12 and string in ["D", "B"]:
-                    self.stdscr.addstr(line_y, self.left_x + 0 + f * 4, " ● ")
-                else:
-                    self.stdscr.addstr(line_y, self.left_x + 0 + f * 4, "   ")
-
-                self.stdscr.addstr(line_y, self.left_x + 0 + f * 4 + 3, "│")
-            
-            line_y += 1
+        self.widget.draw()
 
         self.stdscr.refresh()
         self.start()
 
     def create_lesson(self):
         self.fretboard.push_back_reviews()
-        reviews = self.fretboard.get_reviews_today()
-        self.lesson += reviews
+        lesson = list(self.fretboard.get_reviews_today())
 
-        learning_space = MAX_DAILY_REVIEWS - len(self.lesson)
+        learning_space = MAX_DAILY_REVIEWS - len(lesson)
         learning_spots = self.fretboard.get_spots(status="learning")[:learning_space]
-        self.lesson += learning_spots
+        lesson += learning_spots
         
-        learning_space = MAX_DAILY_REVIEWS - len(self.lesson)
+        learning_space = MAX_DAILY_REVIEWS - len(lesson)
         new_spots = self.fretboard.get_spots(status="new")[:learning_space]
-        self.lesson += new_spots
+        lesson += new_spots
 
-        learning_space = MAX_DAILY_REVIEWS - len(self.lesson)
+        learning_space = MAX_DAILY_REVIEWS - len(lesson)
         unseen_spots = self.fretboard.get_spots(status="unseen")[:learning_space]
-        self.lesson += unseen_spots
+        lesson += unseen_spots
 
         if unseen_spots:
             for unseen_spot in unseen_spots:
                 unseen_spot.status = "new"
+                self.fretboard.record_spot(unseen_spot)
+
+        self.lesson = LessonPlanner(self.fretboard, lesson)
 
     def end_lesson(self):
-        self.fretboard.write_state("state.json")
+        if self.feedback is not None:
+            self.feedback.cancel(finish=False)
+        self.analyser.close()
+        times = self.analyser.analysis_times
+        if times:
+            log_startup(f"lesson ended: first detection took {1000 * times[0]:.2f}ms, "
+                        f"median {1000 * statistics.median(times):.2f}ms over {len(times)}")
+        self.fretboard.save()
+        self.log_event("lesson_end")
+        profiling.mark("lesson_end")
 
         # save progress
 
@@ -117,48 +126,74 @@ class NoteToFret(Page):
             msg = "HARD"
             style = curses.color_pair(2)
 
-        screen_x, screen_y = self.get_spot_coords(spot)
+        pos = spot.get_pos()
 
         msg = ' ' + msg + ' '
         msg_x = (self.width - len(msg)) // 2
-        self.stdscr.addstr(self.top_y + 8, msg_x, msg, style)
-        restyle_region(self.stdscr, screen_x, screen_y, 3, style)
-        self.stdscr.refresh()
-        time.sleep(0.4)
-        restyle_region(self.stdscr, screen_x, screen_y, 3, curses.color_pair(9))
-        self.stdscr.refresh()
-        time.sleep(0.3)
-        restyle_region(self.stdscr, screen_x, screen_y, 3, style)
-        self.stdscr.refresh()
-        time.sleep(0.4)
-        self.stdscr.addstr(self.top_y + 8, 0, " " * self.width)
-        restyle_region(self.stdscr, screen_x, screen_y, 3, curses.color_pair(9))
-        self.stdscr.refresh()
+
+        def flash_on():
+            self.widget.set_cell("feedback", pos, style)
+
+        def flash_off():
+            self.widget.clear_cell("feedback", pos)
+
+        def show():
+            self.stdscr.addstr(self.top_y + 8, msg_x, msg, style)
+            flash_on()
+
+        def hide():
+            self.stdscr.addstr(self.top_y + 8, 0, " " * self.width)
+            flash_off()
+
+        if self.feedback is not None:
+            self.feedback.cancel()
+        self.feedback = Timeline(self.loop, [
+            (0, show),
+            (0.4, flash_off),
+            (0.7, flash_on),
+            (1.1, hide),
+        ])
     
-    def draw_spot_practice(self, spot):
-        note = spot.get_note()[:-1]
-        note_art = text2art(note, font="tarty1")
-        lines = note_art.split("\n")
-        note_art_width = max([len(line) for line in lines])
-        self.stdscr.addstr(self.top_y + 8, 0, " " * self.width)
+    def get_prompt_frame(self, spot):
+        """Builds (or fetches) the draw calls for a spot's prompt: note art, string arrows and message."""
+        frame = self.prompt_frames.get(spot, None)
+        if frame is not None:
+            return frame
 
+        lines = get_glyph(spot.get_note()[:-1])
+        note_art_width = max([len(line) for line in lines])
 
+        # right-align into the widest glyph's area so the previous prompt is overwritten
+        area_x = self.left_x - (self.glyph_width + 7)
         note_x = self.left_x - (note_art_width + 7)
+        frame = []
         for i, line in enumerate(lines):
-            self.stdscr.addstr(i + self.top_y - 1, note_x, line)
-        
+            frame.append((i + self.top_y - 1, area_x, line.ljust(note_art_width).rjust(self.glyph_width), curses.A_NORMAL))
+
         _, string_y = self.get_spot_coords(spot)
-        for y in range(self.top_y, self.top_y + NUM_STRINGS + 1):
+        right_x = self.left_x + self.board_width + 1
+        has_right_arrow = right_x + 3 <= self.width
+        for y in range(self.top_y, self.top_y + self.board_height + 1):
             if y == string_y:
-                self.stdscr.addstr(y, self.left_x - 4, "-->", curses.A_BOLD)
-                self.stdscr.addstr(y, self.left_x + FRETBOARD_CHAR_WIDTH + 1, "<--", curses.A_BOLD)
+                frame.append((y, self.left_x - 4, "-->", curses.A_BOLD))
+                if has_right_arrow:
+                    frame.append((y, right_x, "<--", curses.A_BOLD))
             else:
-                self.stdscr.addstr(y, self.left_x - 4, "   ")
-                self.stdscr.addstr(y, self.left_x + FRETBOARD_CHAR_WIDTH + 1, "   ")
+                frame.append((y, self.left_x - 4, "   ", curses.A_NORMAL))
+                if has_right_arrow:
+                    frame.append((y, right_x, "   ", curses.A_NORMAL))
 
-        string_message = ' ' + STRING_MESSAGES[spot.string] + ' '
+        string_message = ' ' + get_string_message(spot.string) + ' '
         string_message_x = note_x + (note_art_width // 2) - (len(string_message) // 2)
-        self.stdscr.addstr(self.top_y - 2, string_message_x, string_message, curses.A_BOLD)
+        frame.append((self.top_y - 2, area_x, " " * self.glyph_width, curses.A_NORMAL))
+        frame.append((self.top_y - 2, string_message_x, string_message, curses.A_BOLD))
+
+        self.prompt_frames[spot] = frame
+        return frame
+
+    def draw_spot_practice(self, spot):
+        for y, x, text, attr in self.get_prompt_frame(spot):
+            self.stdscr.addstr(y, x, text, attr)
 
         self.stdscr.refresh()
 
@@ -259,33 +294,43 @@ class NoteToFret(Page):
         self.stdscr.refresh()
     
     def start(self):
+        log_startup("lesson started")
+        self.analyser = BatchAnalyser(self.fretboard.instrument, self.detector)
         self.fretboard.new = False
         self.create_lesson()
-        start = time.time()
-        now = time.time()
+        profiling.mark("lesson_start")
+        start = self.loop.clock()
+        now = start
         while self.lesson:
             if (self.time_limit is not None) and ((now - start) >= self.time_limit):
                 break
-            pop_i = random.randint(0, min(RANDOM_POP_LEN - 1, len(self.lesson) - 1))
-            curr_spot = self.lesson.pop(pop_i)
+            curr_spot = self.lesson.pop()
+            self.curr_spot = curr_spot
             curr_note = curr_spot.get_note()
             self.draw_spot_practice(curr_spot)
             self.draw_spot_progress(curr_spot)
+            self.log_event("prompt", spot=curr_spot.get_idx(), note=curr_note)
             attempt_time = self.listen_for_note(curr_note)
+            if self.auto_advance and self.key in BACK_KEYS:
+                break
             curr_spot.add_attempt(attempt_time)
+            self.log_event("attempt", spot=curr_spot.get_idx(), time=attempt_time, status=curr_spot.get_status())
             self.draw_time_msg(attempt_time, curr_spot)
             self.draw_spot_progress(curr_spot, after_practice=True)
 
             if curr_spot.get_status() != "review":
-                self.lesson.append(curr_spot)
+                self.lesson.push(curr_spot)
 
             self.stdscr.refresh()
-            
-            self.key = self.stdscr.getch()
-            if self.key in [27, 127, curses.KEY_BACKSPACE, curses.KEY_DC]:
-                break
 
-            now = time.time()
+            # feedback keeps playing on the loop while we wait for a key or move on
+            if not self.auto_advance:
+                self.key = self.loop.wait_for_key()
+                self.log_event("key", key=self.key)
+                if self.key in BACK_KEYS:
+                    break
+
+            now = self.loop.clock()
         
         self.end_lesson()
 
@@ -294,8 +339,8 @@ class NoteToFret(Page):
             easy_frac = EASY_TIME / FAIL_TIME
             good_frac =  GOOD_TIME / FAIL_TIME
             timer_frac = self.timer / FAIL_TIME
-            for i in range(FRETBOARD_CHAR_WIDTH):
-                frac = (i + 1) / FRETBOARD_CHAR_WIDTH
+            for i in range(self.board_width):
+                frac = (i + 1) / self.board_width
                 if frac <= easy_frac:
                     colour = curses.color_pair(5)
                 elif frac <= good_frac:
@@ -308,93 +353,98 @@ class NoteToFret(Page):
                 else:
                     symbol = "▱"
                 
-                self.stdscr.addstr(self.top_y + FRETBOARD_CHAR_HEIGHT, self.left_x + i, symbol, colour)
+                self.stdscr.addstr(self.top_y + self.board_height, self.left_x + i, symbol, colour)
         else:
-            for i in range(FRETBOARD_CHAR_WIDTH):
-                self.stdscr.addstr(self.top_y + FRETBOARD_CHAR_HEIGHT, self.left_x + i, "▰", curses.color_pair(10))
+            for i in range(self.board_width):
+                self.stdscr.addstr(self.top_y + self.board_height, self.left_x + i, "▰", curses.color_pair(10))
         
-        self.stdscr.refresh()
+        self.loop.request_render()
     
     def get_spot_coords(self, spot):
-        string, fret = spot.get_pos()
-        screen_x = self.left_x + (4 * fret)
-        if self.fretboard.view == "first_person":
-            screen_y = self.top_y + (NUM_STRINGS - string) - 1
-        else:
-            screen_y = self.top_y + string
+        return self.widget.get_spot_coords(spot)
 
-        return screen_x, screen_y
+    def log_event(self, kind, **fields):
+        if self.events is not None:
+            self.events.log(kind, **fields)
 
     def listen_for_note(self, target_note):
-        start = time.monotonic()
-        result_queue = queue.Queue()
-        active_threads = []
-        stop_event = threading.Event()
+        start = self.loop.clock()
+        self.key = None
+        self.listen_id += 1
+        listen_id = self.listen_id
+        attempt = {"time": None}
         line = 2
-        last_thread_start = start - LISTEN_INTERVAL
 
-        self.stdscr.nodelay(True)
-
-        while True:
-            now = time.monotonic()
-            self.timer = now - start
+        def finish(attempt_time):
+            attempt["time"] = attempt_time
+            for timer in timers:
+                self.loop.cancel(timer)
+            self.loop.stop()
+
+        def spawn_listener():
+            # listeners still recording for an old prompt report into a stale listen_id
+            t = threading.Thread(
+                target=self.threaded_listen,
+                args=(self.segment_duration, listen_id),
+                daemon=True
+            )
+            t.start()
+
+        def on_tick():
+            self.timer = self.loop.clock() - start
             if self.timer > FAIL_TIME:
-                break
-
-            # Start a new thread every interval
-            if now - last_thread_start >= LISTEN_INTERVAL:
-                t = threading.Thread(
-                    target=self.threaded_listen,
-                    args=(SEGMENT_DURATION, result_queue),
-                    daemon=True
-                )
-                t.start()
-                active_threads.append(t)
-                last_thread_start = now
-
-            key = self.stdscr.getch()
-            if key in [27, 127, curses.KEY_BACKSPACE, curses.KEY_DC]:
-                break
-            elif key != -1:
-                heard_note = chr(key)
-                if heard_note == target_note[:-1]:
-                    for t in active_threads:
-                        t.join()
-                    self.stdscr.nodelay(False)
-                    return self.timer
-            
-            # Process any new notes
-            while not result_queue.empty():
-                ts, heard_note = result_queue.get()
-                self.stdscr.addstr(line, self.width - 30, f"{ts - start:.2f}s: {heard_note}   ")
-                # line += 1
-                if (heard_note is not None) and (heard_note[:-1] == target_note[:-1]):
-                    for t in active_threads:
-                        t.join()
-                    self.stdscr.nodelay(False)
-                    return self.timer
-
+                finish(None)
+                return
             self.draw_timer()
-            self.stdscr.refresh()
-
-            time.sleep(0.03)
 
-        self.timer = None
-        self.draw_timer()
-        
-        # cleanup
-        for t in active_threads:
-            t.join()
-
-        self.stdscr.nodelay(False)
+        def on_key(key):
+            self.key = key
+            self.log_event("key", key=key)
+            if key in BACK_KEYS:
+                finish(None)
+            elif 0 <= key < 256 and chr(key) == target_note[:-1]:
+                finish(self.loop.clock() - start)
+
+        def on_heard(ts, heard_id, heard_note):
+            if heard_id != listen_id:
+                return
+            self.stdscr.addstr(line, self.width - 30, f"{ts - start:.2f}s: {heard_note}   ")
+            self.loop.request_render()
+            if (heard_note is not None) and (heard_note[:-1] == target_note[:-1]):
+                finish(ts - start)
+
+        self.on_heard = on_heard
+        timers = [
+            self.loop.call_every(LISTEN_INTERVAL, spawn_listener),
+            self.loop.call_every(TIMER_INTERVAL, on_tick),
+        ]
+        self.loop.run(on_key)
+        self.on_heard = None
+
+        if attempt["time"] is None:
+            self.timer = None
+            self.draw_timer()
+        else:
+            self.timer = attempt["time"]
 
-        return None
+        return attempt["time"]
     
-    def threaded_listen(self, segment_duration, result_queue):
-        """Runs in thread. Stops after `segment_duration` or if past deadline."""
-        heard_note = listen(segment_duration)
-        result_queue.put((time.monotonic(), heard_note))
-        return  # Stop after first result
+    def threaded_listen(self, segment_duration, listen_id):
+        """Runs in thread. Records one segment and hands it to the analyser."""
+        segment, sample_rate = record(segment_duration, self.audio_source)
+        self.analyser.submit(segment, sample_rate, self.post_heard, listen_id)
+
+    def post_heard(self, heard_note, listen_id):
+        """Runs on the analysis thread. Posts the result to the event loop."""
+        self.loop.post(self.report_heard, self.loop.clock(), listen_id, heard_note)
+
+    def report_heard(self, ts, listen_id, heard_note):
+        if not self.heard_any:
+            self.heard_any = True
+            log_startup("first detection")
+        self.log_event("heard", note=heard_note, stale=listen_id != self.listen_id)
+        if self.on_heard is not None:
+            self.on_heard(ts, listen_id, heard_note)
 
     
     def _get_pos_coord(self, pos):
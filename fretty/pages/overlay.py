@@ -0,0 +1,111 @@
+import curses
+import curses.panel
+import textwrap
+
+DEBUG_INTERVAL = 0.5
+
+
+def refresh_panels():
+    """Pushes the panel stack to the terminal, restoring whatever a hidden panel covered."""
+    curses.panel.update_panels()
+    curses.doupdate()
+
+
+class Overlay:
+    """
+    A window on the curses panel stack.
+
+    Popups, dialogs and debug readouts draw into their own window, so showing
+    or dismissing one never touches the cells of the page underneath.
+    """
+    def __init__(self, height, width, y, x):
+        self.window = curses.newwin(height, width, y, x)
+        self.window.keypad(True)
+        self.panel = curses.panel.new_panel(self.window)
+        self.panel.hide()
+
+    def is_shown(self):
+        return not self.panel.hidden()
+
+    def draw(self):
+        pass
+
+    def show(self):
+        self.draw()
+        self.panel.show()
+        self.panel.top()
+        refresh_panels()
+
+    def hide(self):
+        self.panel.hide()
+        refresh_panels()
+
+    def getch(self):
+        return self.window.getch()
+
+
+class Popup(Overlay):
+    def __init__(self, stdscr, message, max_msg_width=40):
+        height, width = stdscr.getmaxyx()
+        self.lines = textwrap.wrap(message, max_msg_width)
+        box_width = max(len(line) for line in self.lines) + 4
+        box_height = len(self.lines) + 4
+        super().__init__(box_height, box_width, (height - box_height) // 2, (width - box_width) // 2)
+
+    def draw(self):
+        box_height, box_width = self.window.getmaxyx()
+        self.window.bkgd(' ', curses.A_REVERSE)
+        for idx, line in enumerate(self.lines):
+            self.window.addstr(1 + idx, 2, line, curses.A_REVERSE)
+
+        ok_msg = "[ OK ]"
+        self.window.addstr(box_height - 2, (box_width - len(ok_msg)) // 2, ok_msg, curses.A_NORMAL)
+
+
+class DebugOverlay(Overlay):
+    """
+    Frame and event loop latency readout that stays on top of the menu and
+    the pages. It redraws on a loop timer, which runs whenever any screen is
+    waiting on the loop, and reports on whichever FrameBuffer the loop is
+    currently rendering.
+    """
+    def __init__(self, stdscr, loop, width=30):
+        _, screen_width = stdscr.getmaxyx()
+        super().__init__(3, width, 0, screen_width - width)
+        self.window.bkgd(' ', curses.A_REVERSE)
+        self.loop = loop
+        self.timer = None
+
+    def draw(self):
+        stats = self.loop.screen.get_stats() if hasattr(self.loop.screen, "get_stats") else {}
+        lines = [
+            f"fps {stats.get('fps', 0.0):5.1f}  frame {stats.get('ms_per_frame', 0.0):5.2f}ms",
+            f"loop lag {1000 * self.loop.lag:5.1f}ms max {1000 * self.loop.max_lag:5.1f}ms",
+            f"writes {stats.get('write_calls', 0)}",
+        ]
+        _, width = self.window.getmaxyx()
+        self.window.erase()
+        for i, line in enumerate(lines):
+            self.window.addstr(i, 1, line[:width - 2], curses.A_REVERSE)
+
+    def update(self):
+        # only this window changed, so push it without waiting for the page to render
+        self.draw()
+        refresh_panels()
+
+    def show(self):
+        super().show()
+        if self.timer is None:
+            self.timer = self.loop.call_every(DEBUG_INTERVAL, self.update)
+
+    def hide(self):
+        if self.timer is not None:
+            self.loop.cancel(self.timer)
+            self.timer = None
+        super().hide()
+
+    def toggle(self):
+        if self.is_shown():
+            self.hide()
+        else:
+            self.show()
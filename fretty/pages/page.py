@@ -1,3 +1,13 @@
+import curses
+
+from fretty.pages.render import FrameBuffer
+from fretty.pages.loop import EventLoop
+
+BACK_KEYS = [27, 127, curses.KEY_BACKSPACE, curses.KEY_DC]    # Esc, Backspace and Delete leave a page
+
+
 class Page:
-    def __init__(self, stdscr):
-        self.stdscr = stdscr
\ No newline at end of file
+    def __init__(self, stdscr, loop=None):
+        self.stdscr = FrameBuffer(stdscr)
+        self.loop = loop if loop is not None else EventLoop(self.stdscr)
+        self.loop.screen = self.stdscr
@@ -1,73 +1,45 @@
 import curses
 import re
-from fretty.utils import restyle_region
 
-from fretty.pages.page import Page
+from fretty.pages.page import Page, BACK_KEYS
+from fretty.pages.fretboard_widget import FretboardWidget, get_fretboard_size
 from fretty.globals import *
 
 class Progress(Page):
-    def __init__(self, stdscr, fretboard):
-        super().__init__(stdscr)
+    def __init__(self, stdscr, fretboard, loop=None):
+        super().__init__(stdscr, loop)
         self.fretboard = fretboard
         self.height, self.width = self.stdscr.getmaxyx()
-        self.top_y = (self.height - FRETBOARD_CHAR_HEIGHT) // 2
-        self.left_x = (self.width - FRETBOARD_CHAR_WIDTH) // 2
+        self.board_height, self.board_width = get_fretboard_size(fretboard)
+        self.top_y = (self.height - self.board_height) // 2
+        self.left_x = (self.width - self.board_width) // 2
+        self.widget = FretboardWidget(self.stdscr, fretboard, self.top_y, self.left_x)
 
 
     def load(self):
         self.stdscr.clear()
         self.stdscr.addstr(1, 5, "<-- Backspace / Esc", curses.A_BOLD)
 
-        strings = list(enumerate([s[:-1] for s in self.fretboard.tuning]))
-        if self.fretboard.view == "first_person":
-            strings.reverse()
-
-        frets = range(1, NUM_FRETS + 1)
-        if self.fretboard.view == "third_person":
-            frets.reverse()
-
-        line_y = self.top_y
-        for s, string in strings:
-            self.stdscr.addstr(line_y, self.left_x + 0, f" {string} ")
-            self.stdscr.addstr(line_y, self.left_x + 3, "║")
-
-            for f in frets:
-                if f in {3, 5, 7, 9} and string == "G":
-                    self.stdscr.addstr(line_y, self.left_x + 0 + f * 4, " ● ")
-                elif f == 12 and string in ["D", "B"]:
-                    self.stdscr.addstr(line_y, self.left_x + 0 + f * 4, " ● ")
-                else:
-                    self.stdscr.addstr(line_y, self.left_x + 0 + f * 4, "   ")
-
-                self.stdscr.addstr(line_y, self.left_x + 0 + f * 4 + 3, "│")
-            
-            line_y += 1
-
+        self.widget.draw()
         self.draw_progress()
+        self.draw_slowest()
 
         self.stdscr.refresh()
 
         while True:
-            key = self.stdscr.getch()
-            if key in [27, 127, curses.KEY_BACKSPACE, curses.KEY_DC]:
+            key = self.loop.wait_for_key()
+            if key in BACK_KEYS:
                 self.stdscr.clear()
                 break
     
     def draw_progress(self):
-        for string in self.fretboard.get_spots():
-            for spot in string:
-                if spot.status == "new":
-                    style = curses.color_pair(3)
-                elif spot.status == "learning":
-                    style = curses.color_pair(4)
-                elif spot.status == "review":
-                    style = curses.color_pair(14)
-                else:
-                    style = curses.A_NORMAL
-
-                screen_x, screen_y = self.get_spot_coords(spot)
-                marker = spot.get_pos() in {(3, 3), (3, 5), (3, 7), (3, 9), (2, 12), (4, 12)}
-                restyle_region(self.stdscr, screen_x, screen_y, 3, style, marker=marker)
+        # only the coloured statuses are looked up; every other cell stays A_NORMAL
+        status_styles = {"new": curses.color_pair(3), "learning": curses.color_pair(4), "review": curses.color_pair(14)}
+        status_cells = {}
+        for status, style in status_styles.items():
+            for spot in self.fretboard.get_spots(status=status):
+                status_cells[spot.get_pos()] = style
+        self.widget.set_overlay("status", status_cells)
 
         legend = ["NEW", "LEARNING", "REVIEW"]
         spacing = 5
@@ -81,12 +53,21 @@ class Progress(Page):
 
         self.stdscr.refresh()
     
-    def get_spot_coords(self, spot):
-        string, fret = spot.get_pos()
-        screen_x = self.left_x + (4 * fret)
-        if self.fretboard.view == "first_person":
-            screen_y = self.top_y + (NUM_STRINGS - string) - 1
-        else:
-            screen_y = self.top_y + string
+    def draw_slowest(self, n=10, per_line=5):
+        slowest = self.fretboard.get_slowest_spots(n)
+        if not slowest:
+            return
+
+        title = " SLOWEST "
+        self.stdscr.addstr(self.top_y + self.board_height + 1, (self.width - len(title)) // 2, title, curses.A_BOLD)
+        for i in range(0, len(slowest), per_line):
+            entries = []
+            for spot in slowest[i:i + per_line]:
+                string, fret = spot.get_pos()
+                entries.append(f"{spot.get_note()[:-1]:<2} {string + 1}/{fret:<2} {spot.stats.ewma:.1f}s")
+            line = "   ".join(entries)
+            line_y = self.top_y + self.board_height + 2 + i // per_line
+            self.stdscr.addstr(line_y, (self.width - len(line)) // 2, line)
 
-        return screen_x, screen_y
+    def get_spot_coords(self, spot):
+        return self.widget.get_spot_coords(spot)
@@ -0,0 +1,137 @@
+import curses
+import curses.panel
+import time
+from collections import deque
+
+
+class FrameBuffer:
+    """
+    Virtual screen that sits in front of a curses window.
+
+    Pages draw into the buffer with the usual addstr/addch/chgat calls, and
+    refresh() only sends the cells that differ from what is already on the
+    terminal, as one addstr per run of changed cells and a single update.
+    Anything else (getch, nodelay, getmaxyx, ...) is passed straight through
+    to the wrapped window.
+    """
+    def __init__(self, stdscr):
+        self.stdscr = stdscr
+        self.height, self.width = stdscr.getmaxyx()
+        self.attrs = curses.A_NORMAL
+        self.cells = [[(" ", curses.A_NORMAL)] * self.width for _ in range(self.height)]
+        self.shown = [row[:] for row in self.cells]
+        self.dirty = set()
+        self.needs_clear = False
+
+        # cost counters
+        self.frames = 0
+        self.write_calls = 0
+        self.cells_written = 0
+        self.flush_time = 0.0
+        self.frame_times = deque(maxlen=60)
+
+    def __getattr__(self, name):
+        return getattr(self.stdscr, name)
+
+    def getmaxyx(self):
+        return self.height, self.width
+
+    def attron(self, attrs):
+        self.attrs |= attrs
+
+    def attroff(self, attrs):
+        self.attrs &= ~attrs
+
+    def addstr(self, y, x, text, attr=None):
+        if attr is None:
+            attr = self.attrs
+        if not 0 <= y < self.height:
+            return
+        row = self.cells[y]
+        for i, char in enumerate(text):
+            if 0 <= x + i < self.width:
+                row[x + i] = (char, attr)
+        self.dirty.add(y)
+
+    def addch(self, y, x, char, attr=None):
+        if isinstance(char, int):
+            char = chr(char & curses.A_CHARTEXT)
+        self.addstr(y, x, char, attr)
+
+    def chgat(self, y, x, num, attr):
+        if not 0 <= y < self.height:
+            return
+        row = self.cells[y]
+        for i in range(x, min(x + num, self.width)):
+            row[i] = (row[i][0], attr)
+        self.dirty.add(y)
+
+    def inch(self, y, x):
+        char, attr = self.cells[y][x]
+        return ord(char) | attr
+
+    def clear(self):
+        self.erase()
+        self.needs_clear = True
+
+    def erase(self):
+        for y in range(self.height):
+            self.cells[y] = [(" ", curses.A_NORMAL)] * self.width
+        self.dirty.update(range(self.height))
+
+    def refresh(self):
+        if not self.dirty and not self.needs_clear:
+            return
+        start = time.perf_counter()
+
+        if self.needs_clear:
+            self.stdscr.clear()
+            self.shown = [[(" ", curses.A_NORMAL)] * self.width for _ in range(self.height)]
+            self.needs_clear = False
+
+        for y in sorted(self.dirty):
+            row = self.cells[y]
+            shown = self.shown[y]
+            x = 0
+            while x < self.width:
+                if row[x] == shown[x]:
+                    x += 1
+                    continue
+                # extend the run while cells keep changing with the same attributes
+                attr = row[x][1]
+                end = x + 1
+                while end < self.width and row[end] != shown[end] and row[end][1] == attr:
+                    end += 1
+                text = "".join(char for char, _ in row[x:end])
+                try:
+                    self.stdscr.addstr(y, x, text, attr)
+                except curses.error:
+                    pass  # writing the bottom-right cell moves the cursor off screen
+                self.write_calls += 1
+                self.cells_written += end - x
+                x = end
+            self.shown[y] = row[:]
+        self.dirty.clear()
+
+        # overlays (popups, debug readouts) sit above the page on the panel stack
+        self.stdscr.noutrefresh()
+        curses.panel.update_panels()
+        curses.doupdate()
+        self.frames += 1
+        self.flush_time += time.perf_counter() - start
+        self.frame_times.append(time.perf_counter())
+
+    def get_fps(self):
+        if len(self.frame_times) < 2:
+            return 0.0
+        span = self.frame_times[-1] - self.frame_times[0]
+        return (len(self.frame_times) - 1) / span if span > 0 else 0.0
+
+    def get_stats(self):
+        return {
+            "frames": self.frames,
+            "fps": self.get_fps(),
+            "write_calls": self.write_calls,
+            "cells_written": self.cells_written,
+            "ms_per_frame": 1000 * self.flush_time / self.frames if self.frames else 0.0,
+        }
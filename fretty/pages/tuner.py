@@ -0,0 +1,157 @@
+import curses
+
+from fretty.pages.page import Page, BACK_KEYS
+from fretty.pages.fretboard_widget import get_string_order
+from fretty.pitch import PitchTracker
+from fretty.stream import AudioStream
+from fretty.notes import note_to_frequency
+
+UPDATE_RATE = 30        # readings per second
+STRING_SEMITONES = 6    # each string listens this far either side of its tuned note
+IN_TUNE_CENTS = 5
+METER_HALF_WIDTH = 20   # cells either side of the centre, covering 50 cents
+
+
+def get_meter(cents):
+    """A needle on a +-50 cent scale."""
+    cells = ["-"] * (2 * METER_HALF_WIDTH + 1)
+    cells[METER_HALF_WIDTH] = "|"
+    if cents is not None:
+        cells[METER_HALF_WIDTH + round(cents / 50 * METER_HALF_WIDTH)] = "█"
+    return "[" + "".join(cells) + "]"
+
+
+class Tuner(Page):
+    """
+    Continuous tuner for the strings of fretboard.tuning.
+
+    Microphone audio streams into a ring buffer (see fretty.stream), and a
+    loop timer reads the newest window UPDATE_RATE times a second. It runs
+    the smoothed pitch tracker on it and redraws the selected string's row
+    only when its readout changes. Up and down select a string; the other
+    strings keep showing their last reading. Enter retunes the selected
+    string to the note it is reading, through Fretboard.adjust_tuning, and
+    saves.
+
+    `stream` is anything with latest(n) and sample_rate. A stream passed in
+    should already be started and is left running; by default the page
+    opens the microphone itself and closes it on exit.
+    """
+    def __init__(self, stdscr, fretboard, loop=None, stream=None):
+        super().__init__(stdscr, loop)
+        self.fretboard = fretboard
+        self.height, self.width = self.stdscr.getmaxyx()
+        self.stream = stream
+        self.owns_stream = stream is None
+        self.strings = get_string_order(fretboard.view, fretboard.num_strings)
+        self.selected = self.strings[-1]    # the lowest string
+        self.readings = {}  # string -> (note, cents) last heard on it
+        self.drawn = {}     # row -> text currently on screen, so unchanged rows are skipped
+        self.tracker = None
+        self.top_y = (self.height - 2 * len(self.strings)) // 2
+        self.left_x = max(0, (self.width - len(self.get_row_text(0, None))) // 2)
+        self.message = ""
+
+    def load(self):
+        if self.owns_stream:
+            self.stream = AudioStream()
+            self.stream.start()
+        self.select(self.selected)
+
+        self.stdscr.clear()
+        self.stdscr.addstr(1, 5, "<-- Backspace / Esc", curses.A_BOLD)
+        title = " TUNER "
+        self.stdscr.addstr(self.top_y - 3, (self.width - len(title)) // 2, title, curses.A_BOLD)
+        help_msg = "Up/Down: string   Enter: apply tuning"
+        self.stdscr.addstr(self.top_y + 2 * len(self.strings) + 1, (self.width - len(help_msg)) // 2, help_msg)
+        self.draw_rows()
+        self.stdscr.refresh()
+
+        timer = self.loop.call_every(1 / UPDATE_RATE, self.update)
+        try:
+            self.loop.run(self.on_key)
+        finally:
+            self.loop.cancel(timer)
+            if self.owns_stream:
+                self.stream.close()
+        self.stdscr.clear()
+
+    def select(self, string):
+        self.selected = string
+        target = note_to_frequency[self.fretboard.tuning[string]]
+        ratio = 2 ** (STRING_SEMITONES / 12)
+        self.tracker = PitchTracker(self.stream.sample_rate, target / ratio, target * ratio)
+
+    def update(self):
+        window = self.stream.latest(self.tracker.window_length)
+        reading = self.tracker.update(window, self.loop.clock())
+        if reading is not None:
+            self.readings[self.selected] = reading
+        self.draw_row(self.selected, reading)
+
+    def on_key(self, key):
+        index = self.strings.index(self.selected)
+        if key in BACK_KEYS:
+            self.loop.stop()
+            return
+        elif key == curses.KEY_UP and index > 0:
+            self.select(self.strings[index - 1])
+        elif key == curses.KEY_DOWN and index < len(self.strings) - 1:
+            self.select(self.strings[index + 1])
+        elif key in [10, 13]:
+            self.apply_tuning()
+        self.draw_rows()
+
+    def apply_tuning(self):
+        reading = self.tracker.get_reading()
+        if reading is None:
+            self.message = "Play the string to retune it"
+            return
+        notes = list(note_to_frequency)
+        adjustments = [0] * len(self.fretboard.tuning)
+        adjustments[self.selected] = notes.index(reading[0]) - notes.index(self.fretboard.tuning[self.selected])
+        if any(adjustments):
+            self.fretboard.adjust_tuning(adjustments)
+            self.fretboard.save()
+            self.select(self.selected)
+            self.message = "Tuning set to " + " ".join(self.fretboard.tuning)
+        else:
+            self.message = f"String {self.selected + 1} is already {reading[0]}"
+
+    def get_row_text(self, string, reading):
+        marker = ">" if string == self.selected else " "
+        tuned = self.fretboard.tuning[string]
+        if reading is None:
+            cents, readout = None, " " * 9
+        else:
+            note, cents = reading
+            readout = f"{note:<3} {cents:+4.0f}c"
+        return f"{marker} {string + 1}  {tuned:<3}  {readout}  {get_meter(cents)}"
+
+    def get_row_style(self, reading):
+        if reading is None:
+            return curses.A_NORMAL
+        if abs(reading[1]) <= IN_TUNE_CENTS:
+            return curses.color_pair(6)
+        return curses.color_pair(7)
+
+    def draw_row(self, string, reading):
+        row = self.strings.index(string)
+        text = self.get_row_text(string, reading)
+        if self.drawn.get(row, None) == text:
+            return
+        self.drawn[row] = text
+        style = self.get_row_style(reading)
+        if string == self.selected:
+            style |= curses.A_BOLD
+        self.stdscr.addstr(self.top_y + 2 * row, self.left_x, text, style)
+        self.loop.request_render()
+
+    def draw_rows(self):
+        for string in self.strings:
+            reading = self.tracker.get_reading() if string == self.selected else self.readings.get(string, None)
+            self.draw_row(string, reading)
+        message_y = self.top_y + 2 * len(self.strings) + 3
+        self.stdscr.addstr(message_y, 0, " " * (self.width - 1))
+        self.stdscr.addstr(message_y, (self.width - len(self.message)) // 2, self.message)
+        self.loop.request_render()
@@ -0,0 +1,137 @@
+"""
+Continuous pitch estimation, fine enough to tune by.
+
+estimate_pitch uses McLeod's normalised square difference function (NSDF)
+on a short window. The autocorrelation comes from one rfft round trip,
+and the energy terms from a cumulative sum. It takes the first peak
+within KEY_PEAK_RATIO of the highest, which avoids the octave-low errors
+of a plain argmax, and refines its lag by parabolic interpolation.
+PitchTracker smooths a stream of these readings for display.
+"""
+import math
+from collections import deque
+
+import numpy as np
+
+from fretty.notes import midi_to_note, LOWEST_MIDI, HIGHEST_MIDI
+
+WINDOW_PERIODS = 3      # windows hold this many periods of the lowest frequency,
+MIN_WINDOW_SECONDS = 0.04   # and are at least this long
+KEY_PEAK_RATIO = 0.9
+MIN_CLARITY = 0.8       # NSDF peak height below which a window is unpitched
+MIN_RMS = 1e-3
+
+SMOOTHING = 0.3         # weight of each new reading in the running average
+MEDIAN_READINGS = 3     # readings are median filtered first, dropping one-off glitches
+JUMP_SEMITONES = 0.5    # a reading this far from the average restarts it
+HOLD_SECONDS = 0.5      # unpitched for this long clears the reading
+
+# a string that has rung out leaves mains hum, which is as periodic as any
+# note, so readings this close to the mains frequencies are dropped
+MAINS_FREQS = (50.0, 60.0)
+MAINS_CENTS = 15
+
+
+def get_window_length(sample_rate, lowest_freq):
+    return int(sample_rate * max(WINDOW_PERIODS / lowest_freq, MIN_WINDOW_SECONDS))
+
+
+def estimate_pitch(window, sample_rate, lowest_freq, highest_freq):
+    """Returns (frequency, clarity) of one window; frequency is None if it is silent or unpitched."""
+    n = len(window)
+    x = np.asarray(window, dtype=np.float64)
+    x = x - x.mean()
+    if np.sqrt(np.mean(x ** 2)) < MIN_RMS:
+        return None, 0.0
+
+    size = 1 << (2 * n - 1).bit_length()
+    spectrum = np.fft.rfft(x, size)
+    acf = np.fft.irfft(spectrum.real ** 2 + spectrum.imag ** 2, size)[:n]
+    # m(tau) = sum of x[j]^2 + x[j + tau]^2 over the overlap, from one cumulative sum
+    energy = np.concatenate([[0.0], np.cumsum(x ** 2)])
+    lags = np.arange(n)
+    nsdf = 2 * acf / np.maximum(energy[n - lags] + energy[n] - energy[lags], 1e-12)
+
+    min_lag = max(1, int(sample_rate / highest_freq))
+    max_lag = min(int(sample_rate / lowest_freq) + 1, n - 2)
+    if max_lag <= min_lag:
+        return None, 0.0
+    curve = nsdf[min_lag - 1:max_lag + 2]
+    middle = curve[1:-1]
+    peaks = np.flatnonzero((middle > curve[:-2]) & (middle >= curve[2:]) & (middle > 0))
+    if len(peaks) == 0:
+        return None, 0.0
+    heights = middle[peaks]
+    key = peaks[np.argmax(heights >= KEY_PEAK_RATIO * heights.max())]
+    clarity = float(middle[key])
+    if clarity < MIN_CLARITY:
+        return None, clarity
+
+    a, b, c = curve[key], curve[key + 1], curve[key + 2]
+    denominator = a - 2 * b + c
+    shift = 0.5 * (a - c) / denominator if denominator != 0 else 0.0
+    return sample_rate / (min_lag + key + shift), clarity
+
+
+def frequency_to_midi(frequency):
+    return 69 + 12 * math.log2(frequency / 440)
+
+
+def is_mains(frequency):
+    return any(abs(1200 * math.log2(frequency / mains)) < MAINS_CENTS for mains in MAINS_FREQS)
+
+
+def get_note_and_cents(midi):
+    """The nearest note to a fractional MIDI number and the cents from it, or None outside the note table."""
+    nearest = round(midi)
+    if not LOWEST_MIDI <= nearest <= HIGHEST_MIDI:
+        return None
+    return midi_to_note(nearest), 100 * (midi - nearest)
+
+
+class PitchTracker:
+    """
+    Smoothed pitch of a stream of windows, for a steady tuner readout.
+
+    Each reading is median filtered over the last MEDIAN_READINGS, then
+    averaged into a running pitch. A jump of more than JUMP_SEMITONES
+    (a new string, or a new note) restarts the average rather than sliding
+    towards it. After HOLD_SECONDS of no pitch (or only mains hum), the
+    reading clears.
+    """
+    def __init__(self, sample_rate, lowest_freq, highest_freq, smoothing=SMOOTHING):
+        self.sample_rate = sample_rate
+        self.lowest_freq = lowest_freq
+        self.highest_freq = highest_freq
+        self.smoothing = smoothing
+        self.window_length = get_window_length(sample_rate, lowest_freq)
+        self.recent = deque(maxlen=MEDIAN_READINGS)
+        self.midi = None
+        self.last_heard = None
+
+    def reset(self):
+        self.recent.clear()
+        self.midi = None
+        self.last_heard = None
+
+    def update(self, window, now):
+        frequency, _ = estimate_pitch(window, self.sample_rate, self.lowest_freq, self.highest_freq)
+        if frequency is None or is_mains(frequency):
+            if self.last_heard is not None and now - self.last_heard > HOLD_SECONDS:
+                self.reset()
+            return self.get_reading()
+
+        self.last_heard = now
+        self.recent.append(frequency_to_midi(frequency))
+        midi = float(np.median(self.recent))
+        if self.midi is None or abs(midi - self.midi) > JUMP_SEMITONES:
+            self.midi = midi
+        else:
+            self.midi += self.smoothing * (midi - self.midi)
+        return self.get_reading()
+
+    def get_reading(self):
+        """(note, cents) of the smoothed pitch, or None."""
+        if self.midi is None:
+            return None
+        return get_note_and_cents(self.midi)
@@ -0,0 +1,108 @@
+import heapq
+import itertools
+from collections import deque
+
+from fretty.globals import *
+
+STATUS_PRIORITY = {
+    "review": 2.0,
+    "learning": 1.0,
+    "new": 0.5,
+}
+OVERDUE_WEIGHT = 0.5
+WEAKNESS_WEIGHT = 1.0
+FAIL_STREAK_WEIGHT = 0.5
+
+# a spot that was just drilled sits out this many prompts (fewer on tiny lessons)
+COOLDOWN = 2
+
+
+class LessonPlanner:
+    """
+    Orders a lesson's spots by a priority queue instead of board order.
+
+    Spots are scored by status, how overdue their review is and how weak
+    they are (reaction time EWMA and fail streak). A drilled spot waits in a
+    cooldown queue for a couple of prompts before rejoining the heap, and
+    pop() avoids giving the same string twice in a row when it can. Stale
+    heap entries are skipped lazily, so push/update/pop are O(log n).
+    """
+    def __init__(self, fretboard, spots=()):
+        self.fretboard = fretboard
+        self.heap = []
+        self.entries = {}           # spot -> live heap entry
+        self.cooldown = deque()     # (release_turn, spot)
+        self.counter = itertools.count()
+        self.turn = 0
+        self.last_string = None
+        for spot in spots:
+            self.update(spot)
+
+    def __len__(self):
+        return len(self.entries) + len(self.cooldown)
+
+    def __bool__(self):
+        return len(self) > 0
+
+    def get_score(self, spot):
+        score = STATUS_PRIORITY.get(spot.get_status(), 0)
+
+        review_date = self.fretboard.spot_to_review_date.get(spot, None)
+        if review_date is not None:
+            overdue = (self.fretboard.get_curr_date() - review_date).days
+            score += OVERDUE_WEIGHT * max(0, overdue)
+
+        stats = spot.stats
+        if stats.ewma is not None:
+            score += WEAKNESS_WEIGHT * stats.ewma / FAIL_TIME
+        else:
+            score += WEAKNESS_WEIGHT  # unseen spots count as weak
+        score += FAIL_STREAK_WEIGHT * min(stats.fail_streak, 3)
+        return score
+
+    def update(self, spot):
+        """Adds `spot` or re-scores it in place."""
+        self.remove(spot)
+        entry = [-self.get_score(spot), next(self.counter), spot]
+        self.entries[spot] = entry
+        heapq.heappush(self.heap, entry)
+
+    def remove(self, spot):
+        entry = self.entries.pop(spot, None)
+        if entry is not None:
+            entry[-1] = None
+
+    def push(self, spot):
+        """Returns a drilled spot to the lesson after its cooldown."""
+        gap = min(COOLDOWN, len(self))
+        self.cooldown.append((self.turn + gap, spot))
+
+    def release(self):
+        while self.cooldown and (self.cooldown[0][0] <= self.turn or not self.entries):
+            _, spot = self.cooldown.popleft()
+            self.update(spot)
+
+    def pop(self):
+        self.turn += 1
+        self.release()
+
+        skipped = []
+        spot = None
+        while self.heap:
+            entry = heapq.heappop(self.heap)
+            if entry[-1] is None:
+                continue
+            if entry[-1].string == self.last_string and len(self.entries) > len(skipped) + 1:
+                skipped.append(entry)
+                continue
+            spot = entry[-1]
+            del self.entries[spot]
+            break
+
+        for entry in skipped:
+            heapq.heappush(self.heap, entry)
+
+        if spot is None:
+            raise IndexError("pop from empty lesson")
+        self.last_string = spot.string
+        return spot
@@ -0,0 +1,165 @@
+import re
+import sys
+import time
+import pstats
+import cProfile
+import threading
+import tracemalloc
+from collections import Counter
+
+SAMPLE_INTERVAL = 0.005
+REPORT_LINES = 25
+
+_active = None
+
+
+def mark(label):
+    """Takes a tracemalloc snapshot labelled `label` if a session profiler wants one."""
+    if _active is not None:
+        _active.mark(label)
+
+
+def get_thread_group(name):
+    # listener threads are named "Thread-12 (threaded_listen)"; group them by target
+    return re.sub(r"^Thread-\d+ ", "", name)
+
+
+class SessionProfiler:
+    """
+    Profiles a whole practice session, including the audio analysis threads.
+
+    "cprofile" mode gives every thread its own cProfile.Profile (installed
+    through threading.setprofile) and merges them into one pstats file.
+    "sample" mode reads every thread's stack from a background thread and
+    writes collapsed stacks ("thread;module:func;... count") for flame graphs.
+    With trace_malloc, mark() snapshots the heap and the report lists what
+    grew between consecutive marks.
+    """
+    def __init__(self, filepath, mode="cprofile", trace_malloc=False, interval=SAMPLE_INTERVAL):
+        self.filepath = filepath
+        self.mode = mode
+        self.trace_malloc = trace_malloc
+        self.interval = interval
+
+        self.lock = threading.Lock()
+        self.profile = None
+        self.thread_profiles = []   # (thread name, Profile)
+        self.samples = Counter()    # (thread group, stack) -> count
+        self.sampler = None
+        self.sampling = False
+        self.snapshots = []         # (label, tracemalloc snapshot)
+        self.start_time = None
+        self.wall_time = None
+
+    def start(self):
+        global _active
+        _active = self
+        self.start_time = time.perf_counter()
+        if self.trace_malloc:
+            tracemalloc.start()
+            self.mark("session_start")
+
+        if self.mode == "cprofile":
+            threading.setprofile(self.start_thread_profile)
+            self.profile = cProfile.Profile()
+            self.profile.enable()
+        else:
+            self.sampling = True
+            self.sampler = threading.Thread(target=self.sample, daemon=True)
+            self.sampler.start()
+
+    def start_thread_profile(self, frame, event, arg):
+        sys.setprofile(None)
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            return  # the interpreter only allows one profiler, which already sees every thread
+        with self.lock:
+            self.thread_profiles.append((threading.current_thread().name, profile))
+
+    def sample(self):
+        me = threading.get_ident()
+        while self.sampling:
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(f"{frame.f_globals.get('__name__', '?')}:{frame.f_code.co_name}")
+                    frame = frame.f_back
+                group = get_thread_group(names.get(ident, str(ident)))
+                self.samples[(group, ";".join(reversed(stack)))] += 1
+            time.sleep(self.interval)
+
+    def mark(self, label):
+        if self.trace_malloc and tracemalloc.is_tracing():
+            self.snapshots.append((label, tracemalloc.take_snapshot()))
+
+    def stop(self):
+        global _active
+        if self.mode == "cprofile":
+            self.profile.disable()
+            threading.setprofile(None)
+        else:
+            self.sampling = False
+            self.sampler.join()
+
+        if self.trace_malloc:
+            self.mark("session_end")
+            tracemalloc.stop()
+        self.wall_time = time.perf_counter() - self.start_time
+        _active = None
+
+    def write(self):
+        """Writes the profile to `filepath` and a readable summary to `filepath`.txt."""
+        with open(f"{self.filepath}.txt", 'w') as report:
+            report.write(f"session wall time: {self.wall_time:.2f}s\n\n")
+            if self.mode == "cprofile":
+                self.write_cprofile(report)
+            else:
+                self.write_samples(report)
+            self.write_malloc(report)
+
+    def write_cprofile(self, report):
+        stats = pstats.Stats(self.profile)
+        groups = {}
+        with self.lock:
+            thread_profiles = list(self.thread_profiles)
+        for name, profile in thread_profiles:
+            stats.add(profile)
+            groups.setdefault(get_thread_group(name), []).append(profile)
+        stats.dump_stats(self.filepath)
+
+        report.write("== main thread ==\n")
+        pstats.Stats(self.profile, stream=report).sort_stats("cumulative").print_stats(REPORT_LINES)
+        for group, profiles in sorted(groups.items()):
+            report.write(f"== {group} ({len(profiles)} threads) ==\n")
+            group_stats = pstats.Stats(profiles[0], stream=report)
+            for profile in profiles[1:]:
+                group_stats.add(profile)
+            group_stats.sort_stats("cumulative").print_stats(REPORT_LINES)
+
+    def write_samples(self, report):
+        with open(self.filepath, 'w') as file:
+            for (group, stack), count in self.samples.most_common():
+                file.write(f"{group};{stack} {count}\n")
+
+        per_thread = Counter()
+        leaves = {}
+        for (group, stack), count in self.samples.items():
+            per_thread[group] += count
+            leaves.setdefault(group, Counter())[stack.rsplit(";", 1)[-1]] += count
+        for group, total in per_thread.most_common():
+            report.write(f"== {group}: {total} samples ({total * self.interval:.2f}s) ==\n")
+            for leaf, count in leaves[group].most_common(REPORT_LINES):
+                report.write(f"{100 * count / total:6.1f}%  {leaf}\n")
+            report.write("\n")
+
+    def write_malloc(self, report):
+        for (before_label, before), (after_label, after) in zip(self.snapshots, self.snapshots[1:]):
+            report.write(f"== memory: {before_label} -> {after_label} ==\n")
+            for stat in after.compare_to(before, "lineno")[:REPORT_LINES]:
+                report.write(f"{stat}\n")
+            report.write("\n")
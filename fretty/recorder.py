@@ -0,0 +1,329 @@
+"""
+Session recorder and replayer.
+
+With `fretty --record DIR` every lesson gets a session directory holding
+the raw microphone capture (audio.f32, float32 samples, memory-mapped),
+an event log of prompts, keys, detections and attempts (events.jsonl),
+and the fretboard state and date the lesson started from (session.json).
+
+Replaying re-drives NoteToFret headlessly from a session: the same state,
+the same keys at the same times and the recorded audio in place of the
+microphone. A faster clock gets through the session sooner:
+
+    python -m fretty.recorder sessions/2025-03-31T18-02-11 --speed 4
+
+or with another pitch detector, to see how it would have heard the session:
+
+    python -m fretty.recorder sessions/2025-03-31T18-02-11 --detector template
+"""
+import os
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import threading
+from datetime import date, datetime
+
+import numpy as np
+
+from fretty.utils import atomic_write_json
+
+AUDIO_FILENAME = "audio.f32"
+EVENTS_FILENAME = "events.jsonl"
+SESSION_FILENAME = "session.json"
+
+GROW_SECONDS = 60   # the audio file grows by this much at a time, half of it ahead of the capture
+
+
+def get_session_dirpath(record_dirpath):
+    return os.path.join(record_dirpath, datetime.now().strftime("%Y-%m-%dT%H-%M-%S"))
+
+
+class EventLog:
+    """
+    Timestamped events, kept in memory and appended to `filepath` as JSON
+    lines if one is given. Times are seconds on `clock` since start().
+    """
+    def __init__(self, filepath=None, clock=time.monotonic):
+        self.clock = clock
+        self.start_time = clock()
+        self.events = []
+        self.lock = threading.Lock()
+        self.file = open(filepath, 'a', buffering=1) if filepath is not None else None
+
+    def start(self):
+        self.start_time = self.clock()
+
+    def log(self, kind, **fields):
+        event = {"t": round(self.clock() - self.start_time, 4), "type": kind, **fields}
+        with self.lock:
+            self.events.append(event)
+            if self.file is not None:
+                self.file.write(json.dumps(event) + "\n")
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+
+
+def read_events(filepath):
+    with open(filepath, 'r') as file:
+        return [json.loads(line) for line in file if line.strip()]
+
+
+class SessionRecorder:
+    """
+    Records one lesson into a session directory.
+
+    The microphone is captured by a single input stream whose callback
+    copies each block into a memory-mapped file, so recording costs a
+    memcpy per block however long the lesson runs. The file is grown on
+    a thread of its own well before the capture reaches its end; a block
+    that still finds no room is dropped and counted in `overrun_frames`.
+    It doubles as the page's audio source: read(duration) waits
+    `duration` seconds and returns the last `duration` seconds captured,
+    which is exactly the audio a replay will hand the detector.
+    """
+    def __init__(self, dirpath, sample_rate=None):
+        self.dirpath = dirpath
+        self.sample_rate = sample_rate
+        self.audio_filepath = os.path.join(dirpath, AUDIO_FILENAME)
+        self.audio = None
+        self.capacity = 0
+        self.frames = 0
+        self.overrun_frames = 0
+        self.audio_offset = None    # seconds between start() and the first captured sample
+        self.lock = threading.Lock()
+        self.stream = None
+        self.source_stream = None   # an AudioStream already capturing, shared rather than opened again
+        self.grow_requested = threading.Event()
+        self.grower = None
+        self.closing = False
+        self.events = None
+        self.meta = None
+
+    def start(self, fretboard, page_kwargs=None, stream=None):
+        """
+        Snapshots the fretboard and starts capturing. Call before the page
+        is built; `page_kwargs` are the NoteToFret options a replay should use.
+        With `stream` (a started AudioStream) the recording takes its blocks
+        instead of opening the microphone itself.
+
+        If capturing can't start (no input device, say) the session
+        directory is removed again and the error raised.
+        """
+        os.makedirs(self.dirpath, exist_ok=True)
+        try:
+            if stream is not None:
+                self.sample_rate = stream.sample_rate
+            elif self.sample_rate is None:
+                import sounddevice as sd
+
+                self.sample_rate = int(sd.query_devices(kind='input')['default_samplerate'])
+            self.grow()
+            self.meta = {
+                "sample_rate": self.sample_rate,
+                "date": fretboard.get_curr_date().isoformat(),
+                "started": datetime.now().isoformat(timespec="seconds"),
+                "page": dict(page_kwargs or {}),
+                "state": fretboard.get_state(),
+            }
+            atomic_write_json(os.path.join(self.dirpath, SESSION_FILENAME), self.meta)
+
+            self.events = EventLog(os.path.join(self.dirpath, EVENTS_FILENAME))
+            self.events.start()
+            self.grower = threading.Thread(target=self.run_grower, name="recorder-grow", daemon=True)
+            self.grower.start()
+            if stream is not None:
+                self.source_stream = stream
+                stream.subscribe(self.on_audio)
+                return
+
+            import sounddevice as sd
+
+            self.stream = sd.InputStream(samplerate=self.sample_rate, channels=1, dtype="float32",
+                                         callback=self.on_audio)
+            self.stream.start()
+        except Exception:
+            self.abort()
+            raise
+
+    def grow(self):
+        """Extends the audio file and maps it again. Never runs on the audio thread."""
+        capacity = self.capacity + GROW_SECONDS * self.sample_rate
+        with open(self.audio_filepath, 'ab') as file:
+            file.truncate(capacity * 4)
+        audio = np.memmap(self.audio_filepath, dtype=np.float32, mode='r+', shape=(capacity,))
+        with self.lock:
+            # both maps share the file's pages, so nothing written so far is lost
+            self.audio = audio
+            self.capacity = capacity
+
+    def run_grower(self):
+        while True:
+            self.grow_requested.wait()
+            if self.closing:
+                return
+            self.grow_requested.clear()
+            self.grow()
+
+    def stop_grower(self):
+        self.closing = True
+        self.grow_requested.set()
+        if self.grower is not None:
+            self.grower.join()
+
+    def on_audio(self, block, n, time_info, status):
+        """Runs on the audio thread."""
+        with self.lock:
+            if self.audio is None:
+                return
+            if self.audio_offset is None:
+                self.audio_offset = max(0.0, self.events.clock() - self.events.start_time - n / self.sample_rate)
+            if self.frames + n > self.capacity:
+                self.overrun_frames += n
+                return
+            self.audio[self.frames:self.frames + n] = block[:, 0]
+            self.frames += n
+            if self.capacity - self.frames < GROW_SECONDS * self.sample_rate // 2:
+                self.grow_requested.set()
+
+    def read(self, duration):
+        time.sleep(duration)
+        n = int(duration * self.sample_rate)
+        with self.lock:
+            if self.audio is None:
+                return np.zeros(n, dtype=np.float32)  # a listener outlived the lesson
+            segment = np.array(self.audio[max(0, self.frames - n):self.frames])
+        if len(segment) < n:
+            segment = np.concatenate([np.zeros(n - len(segment), dtype=np.float32), segment])
+        return segment
+
+    def close(self):
+        if self.source_stream is not None:
+            self.source_stream.unsubscribe(self.on_audio)
+        if self.stream is not None:
+            self.stream.stop()
+            self.stream.close()
+        self.stop_grower()
+        with self.lock:
+            self.audio.flush()
+            self.audio = None
+        with open(self.audio_filepath, 'r+b') as file:
+            file.truncate(self.frames * 4)
+        self.events.close()
+        self.meta.update({"frames": self.frames, "audio_offset": self.audio_offset or 0.0,
+                          "overrun_frames": self.overrun_frames})
+        atomic_write_json(os.path.join(self.dirpath, SESSION_FILENAME), self.meta)
+
+    def abort(self):
+        """Undoes a start() that failed part way."""
+        if self.source_stream is not None:
+            self.source_stream.unsubscribe(self.on_audio)
+        if self.stream is not None:
+            self.stream.close()
+        self.stop_grower()
+        with self.lock:
+            self.audio = None
+        if self.events is not None:
+            self.events.close()
+        shutil.rmtree(self.dirpath, ignore_errors=True)
+
+
+def read_session(dirpath):
+    """Returns the session metadata, its audio (memory-mapped) and its events."""
+    with open(os.path.join(dirpath, SESSION_FILENAME), 'r') as file:
+        meta = json.load(file)
+    audio = np.memmap(os.path.join(dirpath, AUDIO_FILENAME), dtype=np.float32, mode='r')
+    return meta, audio, read_events(os.path.join(dirpath, EVENTS_FILENAME))
+
+
+def get_key_script(events, speed=1.0):
+    """(wall delay, key) pairs replaying the session's keys at `speed`."""
+    script = []
+    last_t = 0.0
+    for event in events:
+        if event["type"] == "key":
+            script.append(((event["t"] - last_t) / speed, event["key"]))
+            last_t = event["t"]
+    return script
+
+
+def replay_session(dirpath, speed=1.0, events_filepath=None, **page_kwargs):
+    """
+    Re-drives NoteToFret from a recorded session. Returns the run's report
+    (see run_headless_lesson) and the replay's EventLog.
+    """
+    from fretty.fretboard import Fretboard
+    from fretty.headless import ReplayAudioSource, run_headless_lesson
+    from fretty.pages.loop import Clock
+
+    meta, audio, events = read_session(dirpath)
+    offset = np.zeros(int(meta.get("audio_offset", 0.0) * meta["sample_rate"]), dtype=np.float32)
+
+    fretboard = Fretboard()
+    fretboard.set_state(meta["state"])
+    fretboard.curr_date = date.fromisoformat(meta["date"])
+    tmp_dirpath = tempfile.mkdtemp(prefix="fretty-replay-")
+    fretboard.state_filepath = os.path.join(tmp_dirpath, "state.json")
+
+    clock = Clock(speed)
+    replayed = EventLog(events_filepath, clock=clock)
+    source = ReplayAudioSource(np.concatenate([offset, audio]), meta["sample_rate"], clock=clock)
+    # the recording's clocks start just before its page is built, and so do these
+    replayed.start()
+    source.start()
+    try:
+        report = run_headless_lesson(fretboard, get_key_script(events, speed), audio_source=source,
+                                     clock=clock, events=replayed, **dict(meta.get("page", {}), **page_kwargs))
+    finally:
+        replayed.close()
+        shutil.rmtree(tmp_dirpath, ignore_errors=True)
+    report["session_time"] = events[-1]["t"] if events else 0.0
+    return report, replayed
+
+
+def compare_events(recorded, replayed):
+    """Counts of what matched between a recording and its replay."""
+    def select(events, kind, *fields):
+        return [tuple(event[field] for field in fields) for event in events if event["type"] == kind]
+
+    def heard(events):
+        return [event["note"] for event in events if event["type"] == "heard" and event["note"] is not None]
+
+    recorded_prompts = select(recorded, "prompt", "spot")
+    replayed_prompts = select(replayed, "prompt", "spot")
+    recorded_attempts = select(recorded, "attempt", "spot", "status")
+    replayed_attempts = select(replayed, "attempt", "spot", "status")
+    return {
+        "prompts": len(recorded_prompts),
+        "prompts_replayed": len(replayed_prompts),
+        "prompts_matching": sum(a == b for a, b in zip(recorded_prompts, replayed_prompts)),
+        "attempts_matching": sum(a == b for a, b in zip(recorded_attempts, replayed_attempts)),
+        "notes_heard": len(heard(recorded)),
+        "notes_heard_replayed": len(heard(replayed)),
+    }
+
+
+def main():
+    from fretty.audio import DETECTORS
+
+    parser = argparse.ArgumentParser(description="Replay a recorded practice session.")
+    parser.add_argument("session", help="session directory written by fretty --record")
+    parser.add_argument("--speed", type=float, default=1.0, help="replay this many times faster than real time")
+    parser.add_argument("--events", default=None, help="write the replay's events to this file")
+    parser.add_argument("--detector", choices=list(DETECTORS), default=None,
+                        help="pitch detector to replay with, instead of the recorded one")
+    args = parser.parse_args()
+
+    page_kwargs = {} if args.detector is None else {"detector": args.detector}
+    _, _, recorded = read_session(args.session)
+    report, replayed = replay_session(args.session, args.speed, args.events, **page_kwargs)
+    print(f"replayed {report['session_time']:.1f}s of session in {report['wall_time']:.1f}s")
+    for name, value in compare_events(recorded, replayed.events).items():
+        print(f"{name:<22} {value}")
+
+
+if __name__ == "__main__":
+    main()
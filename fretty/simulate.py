@@ -0,0 +1,353 @@
+"""
+Vectorised simulator for the spaced-repetition scheduler.
+
+Runs the FretboardSpot.add_attempt / Fretboard.add_review state machine and
+the NoteToFret lesson loop for many virtual learners at once, with every
+learner's board held as a row of (learners, spots) arrays. Used to tune the
+constants in fretty/globals.py:
+
+    python -m fretty.simulate --learners 2000 --days 90 --grid MAX_DAILY_REVIEWS=3,5,8
+"""
+import argparse
+import itertools
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from fretty.globals import *
+from fretty.history import STATUS_CODES
+from fretty.notes import spot_to_note
+from fretty.instruments import get_instrument
+
+UNLEARNABLE = STATUS_CODES["unlearnable"]
+UNSEEN = STATUS_CODES["unseen"]
+NEW = STATUS_CODES["new"]
+LEARNING = STATUS_CODES["learning"]
+REVIEW = STATUS_CODES["review"]
+
+FAIL, HARD, GOOD, EASY = range(4)
+
+DEFAULT_PARAMS = {
+    "EASY_TIME": EASY_TIME,
+    "GOOD_TIME": GOOD_TIME,
+    "FAIL_TIME": FAIL_TIME,
+    "MAX_DAILY_REVIEWS": MAX_DAILY_REVIEWS,
+    "NEW_GOOD_ATTEMPTS": NEW_GOOD_ATTEMPTS,
+    "LEARNING_GOOD_ATTEMPTS": LEARNING_GOOD_ATTEMPTS,
+    "BASE_EASE_FACTOR": BASE_EASE_FACTOR,
+    "MIN_EASE_FACTOR": MIN_EASE_FACTOR,
+    "MAX_EASE_FACTOR": MAX_EASE_FACTOR,
+    "EASE_FACTOR_DROP": EASE_FACTOR_DROP,
+    "EASE_FACTOR_BUMP": EASE_FACTOR_BUMP,
+    "RANDOM_POP_LEN": RANDOM_POP_LEN,
+}
+
+
+class PracticeModel:
+    """
+    Default reaction-time model.
+
+    Each learner has a personal speed. A spot starts slow, gets faster with
+    every rep and slows down again the longer it goes unseen. Any object with
+    the same reset/__call__ methods can be passed to simulate() instead;
+    __call__ returns one reaction time per (learner, spot) pair, NaN for a
+    missed note.
+    """
+    def __init__(self, base_time=4.5, floor_time=1.3, learn_rate=0.3, forget_rate=0.05,
+                 noise=0.25, miss_prob=0.03):
+        self.base_time = base_time
+        self.floor_time = floor_time
+        self.learn_rate = learn_rate
+        self.forget_rate = forget_rate
+        self.noise = noise
+        self.miss_prob = miss_prob
+
+    def reset(self, rng, n_learners, n_spots):
+        self.speed = rng.lognormal(0, 0.2, n_learners)
+        self.reps = np.zeros((n_learners, n_spots))
+        self.last_seen = np.zeros((n_learners, n_spots))
+
+    def __call__(self, rng, learners, spots, day):
+        reps = self.reps[learners, spots]
+        gap = day - self.last_seen[learners, spots]
+        mean = self.floor_time + (self.base_time - self.floor_time) * np.exp(-self.learn_rate * reps)
+        mean *= 1 + self.forget_rate * np.log1p(gap)
+        times = mean * self.speed[learners] * rng.lognormal(0, self.noise, len(learners))
+        times[rng.random(len(learners)) < self.miss_prob] = np.nan
+
+        self.reps[learners, spots] += 1
+        self.last_seen[learners, spots] = day
+        return times
+
+
+def get_learnable(tuning, learn_sharps=False, num_frets=NUM_FRETS):
+    learnable = []
+    for s in range(len(tuning)):
+        for f in range(1, num_frets + 1):
+            note = spot_to_note((s, f), tuning)
+            learnable.append(learn_sharps or ('#' not in note))
+    return np.array(learnable)
+
+
+def rate(times, p):
+    rating = np.full(len(times), FAIL)
+    answered = ~np.isnan(times)
+    rating[answered & (times < p["FAIL_TIME"])] = HARD
+    rating[answered & (times <= p["GOOD_TIME"])] = GOOD
+    rating[answered & (times <= p["EASY_TIME"])] = EASY
+    return rating
+
+
+class Simulation:
+    def __init__(self, n_learners, n_days, params=None, model=None, practice_prob=1.0,
+                 max_attempts=200, tuning=None, instrument=None, seed=0):
+        self.p = dict(DEFAULT_PARAMS, **(params or {}))
+        self.n_learners = n_learners
+        self.n_days = n_days
+        self.practice_prob = practice_prob
+        self.max_attempts = max_attempts
+        self.rng = np.random.default_rng(seed)
+        self.model = model if model is not None else PracticeModel()
+
+        instrument = get_instrument(instrument)
+        learnable = get_learnable(tuning or instrument.tuning, num_frets=instrument.num_frets)
+        self.n_spots = len(learnable)
+        self.n_learnable = learnable.sum()
+        self.model.reset(self.rng, n_learners, self.n_spots)
+
+        shape = (n_learners, self.n_spots)
+        self.status = np.tile(np.where(learnable, UNSEEN, UNLEARNABLE).astype(np.int8), (n_learners, 1))
+        self.interval = np.ones(shape)
+        self.ease_factor = np.full(shape, self.p["BASE_EASE_FACTOR"])
+        self.good_attempts = np.zeros(shape, dtype=np.int32)
+
+        # review calendar: due day per spot (-1 for none) and reviews booked per day.
+        # reviews past the end of the calendar are booked on day `calendar_len` and never come due
+        self.calendar_len = n_days + 1
+        self.due = np.full(shape, -1)
+        self.booked = np.zeros((n_learners, self.calendar_len + 1), dtype=np.int32)
+        self.booked_seq = np.zeros(shape)  # orders each day's reviews like the per-date lists
+        self.n_bookings = 0
+
+    def add_review(self, learners, spots, day):
+        target = day + np.floor(self.interval[learners, spots]).astype(int)
+        days = np.arange(self.calendar_len)
+        free = self.booked[learners, :-1] < self.p["MAX_DAILY_REVIEWS"]
+        candidates = free & (days >= target[:, None])
+        review_day = np.where(candidates.any(axis=1), candidates.argmax(axis=1), self.calendar_len)
+        # a learner can only book one slot per step, so these writes never collide
+        self.booked[learners, review_day] += 1
+        self.due[learners, spots] = review_day
+        self.booked_seq[learners, spots] = self.n_bookings
+        self.n_bookings += 1
+
+    def remove_review(self, learners, spots):
+        review_day = self.due[learners, spots]
+        booked = review_day >= 0
+        self.booked[learners[booked], review_day[booked]] -= 1
+        self.due[learners, spots] = -1
+
+    def push_back_reviews(self, learners, day):
+        due = np.where(self.due[learners] >= 0, self.due[learners], np.iinfo(int).max)
+        earliest = due.min(axis=1)
+        shift = np.where(earliest < day, day - earliest, 0)
+        shifted = learners[shift > 0]
+        if len(shifted) == 0:
+            return
+        shift = shift[shift > 0]
+
+        has_review = self.due[shifted] >= 0
+        new_due = np.minimum(self.due[shifted] + shift[:, None], self.calendar_len)
+        self.due[shifted] = np.where(has_review, new_due, -1)
+
+        booked = self.booked[shifted, :-1]
+        source = np.arange(self.calendar_len) - shift[:, None]
+        moved = np.take_along_axis(booked, np.clip(source, 0, None), axis=1)
+        moved[source < 0] = 0
+        self.booked[shifted, :-1] = moved
+        self.booked[shifted, -1] += booked.sum(axis=1) - moved.sum(axis=1)
+
+    def create_lessons(self, learners, day):
+        cap = self.p["MAX_DAILY_REVIEWS"]
+
+        # all of today's reviews in booking order
+        reviews = self.due[learners] == day
+        order = np.argsort(np.where(reviews, self.booked_seq[learners], np.inf), axis=1, kind="stable")
+        lesson_len = reviews.sum(axis=1)
+        lesson = np.where(np.arange(self.n_spots) < lesson_len[:, None], order, -1)
+
+        # then learning, new and unseen spots in board order
+        status = self.status[learners]
+        for mask in [status == LEARNING, status == NEW, status == UNSEEN]:
+            rank = np.cumsum(mask, axis=1)
+            mask = mask & (rank <= (cap - lesson_len)[:, None])
+            rows, spots = np.nonzero(mask)
+            lesson[rows, lesson_len[rows] + rank[rows, spots] - 1] = spots
+            lesson_len += mask.sum(axis=1)
+
+        in_lesson = np.zeros(status.shape, dtype=bool)
+        rows, cols = np.nonzero(lesson >= 0)
+        in_lesson[rows, lesson[rows, cols]] = True
+        self.status[learners] = np.where(in_lesson & (status == UNSEEN), NEW, status)
+        return lesson, lesson_len
+
+    def apply_attempts(self, learners, spots, rating, day):
+        p = self.p
+        status = self.status[learners, spots]
+        good = self.good_attempts[learners, spots]
+        ease = self.ease_factor[learners, spots]
+        interval = self.interval[learners, spots]
+
+        # new / learning: count good attempts until the spot moves on
+        new_status = status.copy()
+        graduated = {}
+        for code, target in [(NEW, p["NEW_GOOD_ATTEMPTS"]), (LEARNING, p["LEARNING_GOOD_ATTEMPTS"])]:
+            rows = status == code
+            good = np.where(rows & (rating == FAIL), 0, good)
+            good = np.where(rows & (rating == GOOD), good + 1, good)
+            good = np.where(rows & (rating == EASY), target, good)
+            graduated[code] = rows & (good >= target)
+            good = np.where(graduated[code], 0, good)
+        new_status[graduated[NEW]] = LEARNING
+        new_status[graduated[LEARNING]] = REVIEW
+
+        # review: re-schedule, dropping back to learning on a fail
+        rows = status == REVIEW
+        self.remove_review(learners[rows], spots[rows])
+        failed = rows & (rating == FAIL)
+        ease = np.where(failed, np.minimum(ease, p["BASE_EASE_FACTOR"]), ease)
+        ease = np.where(rows & (rating == HARD), np.maximum(p["MIN_EASE_FACTOR"], ease - p["EASE_FACTOR_DROP"]), ease)
+        ease = np.where(rows & (rating == EASY), np.minimum(p["MAX_EASE_FACTOR"], ease + p["EASE_FACTOR_BUMP"]), ease)
+        interval = np.where(failed, np.maximum(1, interval / ease), interval)
+        interval = np.where(rows & ~failed, interval * ease, interval)
+        good = np.where(failed, p["LEARNING_GOOD_ATTEMPTS"] - 1, good)
+        new_status = np.where(failed, LEARNING, new_status)
+
+        self.status[learners, spots] = new_status
+        self.good_attempts[learners, spots] = good
+        self.ease_factor[learners, spots] = ease
+        self.interval[learners, spots] = interval
+
+        booking = graduated[LEARNING] | (rows & ~failed)
+        self.add_review(learners[booking], spots[booking], day)
+        return new_status
+
+    def get_practising(self, day):
+        return np.nonzero(self.rng.random(self.n_learners) < self.practice_prob)[0]
+
+    def run_day(self, day):
+        learners = self.get_practising(day)
+        overdue = ((self.due >= 0) & (self.due < day)).sum(axis=1)
+        self.push_back_reviews(learners, day)
+        due = (self.due == day).sum(axis=1)
+        lesson, lesson_len = self.create_lessons(learners, day)
+
+        attempts = np.zeros(self.n_learners, dtype=int)
+        rows = np.arange(len(learners))
+        positions = np.arange(lesson.shape[1])
+        while True:
+            active = (lesson_len > 0) & (attempts[learners] < self.max_attempts)
+            if not active.any():
+                break
+            act_rows = rows[active]
+            act_learners = learners[active]
+            lens = lesson_len[active]
+
+            # pop from the first RANDOM_POP_LEN items. NoteToFret orders lessons with a
+            # LessonPlanner instead, but that only changes the order within a day
+            pop_i = (self.rng.random(len(act_rows)) * np.minimum(self.p["RANDOM_POP_LEN"], lens)).astype(int)
+            spots = lesson[act_rows, pop_i]
+            times = self.model(self.rng, act_learners, spots, day)
+            status = self.apply_attempts(act_learners, spots, rate(times, self.p), day)
+            attempts[act_learners] += 1
+
+            # drop the popped spot, re-append it at the back unless it reached review
+            order = positions + (positions >= pop_i[:, None])
+            order = np.minimum(order, lesson.shape[1] - 1)
+            reordered = np.take_along_axis(lesson[act_rows], order, axis=1)
+            keep = status != REVIEW
+            reordered[np.arange(len(act_rows)), lens - 1] = np.where(keep, spots, -1)
+            lesson[act_rows] = reordered
+            lesson_len[active] = np.where(keep, lens, lens - 1)
+
+        return attempts, due, overdue
+
+    def run(self):
+        shape = (self.n_learners, self.n_days)
+        results = {
+            "attempts": np.zeros(shape, dtype=int),
+            "due": np.zeros(shape, dtype=int),
+            "overdue": np.zeros(shape, dtype=int),
+            "mastered": np.zeros(shape, dtype=int),
+            "mastery_day": np.full(self.n_learners, -1),
+        }
+        for day in range(self.n_days):
+            attempts, due, overdue = self.run_day(day)
+            mastered = (self.status == REVIEW).sum(axis=1)
+            results["attempts"][:, day] = attempts
+            results["due"][:, day] = due
+            results["overdue"][:, day] = overdue
+            results["mastered"][:, day] = mastered
+            newly = (results["mastery_day"] < 0) & (mastered == self.n_learnable)
+            results["mastery_day"][newly] = day
+        return results
+
+
+def simulate(n_learners=1000, n_days=90, params=None, model=None, **kwargs):
+    """Returns per-learner, per-day workload, backlog and mastery curves."""
+    return Simulation(n_learners, n_days, params=params, model=model, **kwargs).run()
+
+
+def summarise(results):
+    mastery_day = results["mastery_day"]
+    mastered = mastery_day >= 0
+    return {
+        "mean_daily_attempts": float(results["attempts"].mean()),
+        "peak_daily_attempts": float(results["attempts"].mean(axis=0).max()),
+        "mean_overdue": float(results["overdue"].mean()),
+        "mastered_frac": float(mastered.mean()),
+        "median_mastery_day": float(np.median(mastery_day[mastered])) if mastered.any() else None,
+    }
+
+
+def run_grid_point(args):
+    params, kwargs = args
+    return params, summarise(simulate(params=params, **kwargs))
+
+
+def sweep(grid, processes=None, **kwargs):
+    """Runs simulate() for every combination in `grid` ({name: [values]}) across processes."""
+    names = list(grid)
+    points = [dict(zip(names, values)) for values in itertools.product(*grid.values())]
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        return list(pool.map(run_grid_point, [(params, kwargs) for params in points]))
+
+
+def parse_grid(specs):
+    grid = {}
+    for spec in specs:
+        name, values = spec.split("=")
+        grid[name] = [type(DEFAULT_PARAMS[name])(float(v)) for v in values.split(",")]
+    return grid
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate the spaced-repetition scheduler.")
+    parser.add_argument("--learners", type=int, default=1000)
+    parser.add_argument("--days", type=int, default=90)
+    parser.add_argument("--practice-prob", type=float, default=0.9)
+    parser.add_argument("--processes", type=int, default=None)
+    parser.add_argument("--grid", nargs="*", default=[], help="NAME=v1,v2,... parameter ranges")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    results = sweep(parse_grid(args.grid), processes=args.processes, n_learners=args.learners,
+                    n_days=args.days, practice_prob=args.practice_prob)
+    for params, summary in results:
+        print(params, {k: round(v, 2) if v is not None else None for k, v in summary.items()})
+    print(f"{len(results)} runs in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
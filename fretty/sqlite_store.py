@@ -0,0 +1,316 @@
+import json
+import sqlite3
+import threading
+from array import array
+
+from fretty.history import COLUMNS, RATING_CODES, STATUS_CODES
+from fretty.instruments import DEFAULT_INSTRUMENT
+from fretty.migrations import STATE_VERSION
+
+SQLITE_SUFFIXES = (".db", ".sqlite", ".sqlite3")
+
+PROFILES_TABLE = """(
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    instrument TEXT NOT NULL DEFAULT 'guitar',
+    tuning TEXT NOT NULL,
+    view TEXT NOT NULL DEFAULT 'first_person',
+    new INTEGER NOT NULL DEFAULT 1,
+    last_review_date TEXT,
+    UNIQUE (name, instrument)
+)"""
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS profiles {PROFILES_TABLE};
+CREATE TABLE IF NOT EXISTS spots (
+    profile_id INTEGER NOT NULL REFERENCES profiles(id),
+    spot INTEGER NOT NULL,
+    status TEXT NOT NULL,
+    interval REAL NOT NULL,
+    ease_factor REAL NOT NULL,
+    good_attempts INTEGER NOT NULL,
+    stats TEXT,
+    PRIMARY KEY (profile_id, spot)
+);
+CREATE INDEX IF NOT EXISTS spots_by_status ON spots (profile_id, status, spot);
+CREATE TABLE IF NOT EXISTS reviews (
+    profile_id INTEGER NOT NULL REFERENCES profiles(id),
+    spot INTEGER NOT NULL,
+    review_date TEXT NOT NULL,
+    PRIMARY KEY (profile_id, spot)
+);
+CREATE INDEX IF NOT EXISTS reviews_by_date ON reviews (profile_id, review_date);
+CREATE TABLE IF NOT EXISTS attempts (
+    id INTEGER PRIMARY KEY,
+    profile_id INTEGER NOT NULL REFERENCES profiles(id),
+    spot INTEGER NOT NULL,
+    timestamp REAL,
+    reaction_time REAL,
+    rating INTEGER NOT NULL,
+    status INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS attempts_by_spot ON attempts (profile_id, spot);
+"""
+
+
+def is_sqlite_filepath(state_filepath):
+    return str(state_filepath).endswith(SQLITE_SUFFIXES)
+
+
+def read_attempts(db_filepath, profile, instrument):
+    """A profile's attempt columns, read on a connection that is closed again afterwards."""
+    store = SQLiteStore(db_filepath, profile=profile, instrument=instrument)
+    try:
+        return store.read_attempts()
+    finally:
+        store.close()
+
+
+class SQLiteStore:
+    """
+    Multi-profile state store backed by a single SQLite database.
+
+    Each profile (one learner on one instrument) has its own rows in the
+    spots, reviews and attempts tables. A learner can have a profile per
+    instrument; with no `instrument` the store picks the one the learner
+    practised last, or the default instrument for a new learner. Attached to a fretboard it takes
+    the place of the journal: every recorded spot change is committed as
+    it happens, so there is never anything to replay. The day's reviews
+    and the spots in each status are indexed lookups (get_reviews_due,
+    get_spots_by_status), which the fretboard uses instead of scanning
+    its spots.
+    """
+    def __init__(self, db_filepath, profile="default", instrument=None):
+        self.db_filepath = db_filepath
+        self.profile = profile
+        self.seq = 0  # changes are committed immediately, so nothing is ever left to replay
+        self.lock = threading.RLock()   # the history loader reads through it while a snapshot is written
+        self.conn = sqlite3.connect(db_filepath, check_same_thread=False)
+        self.conn.executescript(SCHEMA)
+        spot_columns = [row[1] for row in self.conn.execute("PRAGMA table_info(spots)")]
+        if "stats" not in spot_columns:
+            self.conn.execute("ALTER TABLE spots ADD COLUMN stats TEXT")
+        self.migrate_profiles()
+        self.conn.execute(f"PRAGMA user_version = {STATE_VERSION}")
+        self.conn.commit()
+        self.instrument = instrument if instrument is not None else self.get_last_instrument()
+
+    def migrate_profiles(self):
+        """Rebuilds a profiles table that allowed one instrument per learner, keeping its ids."""
+        sql = self.conn.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'profiles'").fetchone()[0]
+        if "name TEXT NOT NULL UNIQUE" not in sql:
+            return
+        self.conn.executescript(f"""
+            BEGIN;
+            CREATE TABLE profiles_new {PROFILES_TABLE};
+            INSERT INTO profiles_new SELECT id, name, instrument, tuning, view, new, last_review_date FROM profiles;
+            DROP TABLE profiles;
+            ALTER TABLE profiles_new RENAME TO profiles;
+            COMMIT;
+        """)
+
+    def get_profiles(self):
+        """(learner, instrument) for every profile."""
+        return self.conn.execute("SELECT name, instrument FROM profiles ORDER BY name, instrument").fetchall()
+
+    def get_last_instrument(self, profile=None):
+        """The instrument the learner practised most recently, or the default one."""
+        row = self.conn.execute(
+            "SELECT instrument FROM profiles WHERE name = ? ORDER BY last_review_date DESC LIMIT 1",
+            (profile or self.profile,),
+        ).fetchone()
+        return row[0] if row is not None else DEFAULT_INSTRUMENT
+
+    def has_profile(self, profile=None, instrument=None):
+        try:
+            self.get_profile_id(profile, instrument)
+        except KeyError:
+            return False
+        return True
+
+    def get_profile_id(self, profile=None, instrument=None):
+        profile = profile or self.profile
+        instrument = instrument or self.instrument
+        row = self.conn.execute(
+            "SELECT id FROM profiles WHERE name = ? AND instrument = ?", (profile, instrument)
+        ).fetchone()
+        if row is None:
+            raise KeyError(f"No profile named {profile!r} on {instrument}")
+        return row[0]
+
+    def get_reviews_due(self, day, profile=None):
+        """Returns the spot indices due for review on or before `day`."""
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT spot FROM reviews WHERE profile_id = ? AND review_date <= ? ORDER BY review_date",
+                (self.get_profile_id(profile), day.isoformat()),
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def get_spots_by_status(self, status, profile=None):
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT spot FROM spots WHERE profile_id = ? AND status = ? ORDER BY spot",
+                (self.get_profile_id(profile), status),
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def read_state(self, profile=None):
+        profile_id = self.get_profile_id(profile)
+        instrument, tuning, view, new, last_review_date = self.conn.execute(
+            "SELECT instrument, tuning, view, new, last_review_date FROM profiles WHERE id = ?", (profile_id,)
+        ).fetchone()
+
+        spots = []
+        for status, interval, ease_factor, good_attempts, stats in self.conn.execute(
+            "SELECT status, interval, ease_factor, good_attempts, stats FROM spots WHERE profile_id = ? ORDER BY spot",
+            (profile_id,),
+        ):
+            spot_state = {"status": status, "interval": interval, "ease_factor": ease_factor, "good_attempts": good_attempts}
+            if stats is not None:
+                spot_state["stats"] = json.loads(stats)
+            spots.append(spot_state)
+
+        reviews = {}
+        for spot, review_date in self.conn.execute(
+            "SELECT spot, review_date FROM reviews WHERE profile_id = ?", (profile_id,)
+        ):
+            reviews.setdefault(review_date, []).append(spot)
+
+        return {
+            "version": STATE_VERSION,
+            "new": bool(new),
+            "view": view,
+            "instrument": instrument,
+            "tuning": json.loads(tuning),
+            "last_review_date": last_review_date,
+            "reviews": reviews,
+            "spots": spots,
+        }
+
+    def count_attempts(self, profile=None):
+        with self.lock:
+            return self.conn.execute(
+                "SELECT COUNT(*) FROM attempts WHERE profile_id = ?", (self.get_profile_id(profile),)
+            ).fetchone()[0]
+
+    def read_attempts(self, profile=None):
+        columns = {name: array(code) for name, code in COLUMNS.items()}
+        with self.lock:
+            for row in self.conn.execute(
+                "SELECT spot, timestamp, reaction_time, rating, status FROM attempts WHERE profile_id = ? ORDER BY id",
+                (self.get_profile_id(profile),),
+            ):
+                for name, value in zip(COLUMNS, row):
+                    columns[name].append(float("nan") if value is None else value)
+        return columns
+
+    def write_state(self, fretboard, profile=None):
+        self.write_snapshot(fretboard.get_state(), fretboard.history, profile)
+
+    def write_snapshot(self, state, history, profile=None):
+        profile = profile or self.profile
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT INTO profiles (name, instrument, tuning, view, new, last_review_date) VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(name, instrument) DO UPDATE SET tuning = excluded.tuning, "
+                "view = excluded.view, new = excluded.new, last_review_date = excluded.last_review_date",
+                (profile, state["instrument"], json.dumps(state["tuning"]), state["view"], int(state["new"]),
+                 state["last_review_date"]),
+            )
+            profile_id = self.get_profile_id(profile, state["instrument"])
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO spots VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (profile_id, idx, s["status"], s["interval"], s["ease_factor"], s["good_attempts"], json.dumps(s["stats"]))
+                    for idx, s in enumerate(state["spots"])
+                ],
+            )
+            self.conn.execute("DELETE FROM reviews WHERE profile_id = ?", (profile_id,))
+            self.conn.executemany(
+                "INSERT INTO reviews VALUES (?, ?, ?)",
+                [
+                    (profile_id, idx, review_date)
+                    for review_date, idxs in state["reviews"].items() for idx in idxs
+                ],
+            )
+
+            saved = self.conn.execute(
+                "SELECT COUNT(*) FROM attempts WHERE profile_id = ?", (profile_id,)
+            ).fetchone()[0]
+            length = len(history)
+            if saved < length:
+                if saved < history.base:
+                    history.load()
+                columns = history.columns
+                self.conn.executemany(
+                    "INSERT INTO attempts (profile_id, spot, timestamp, reaction_time, rating, status) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    [
+                        (profile_id, *(column[i - history.base] for column in columns.values()))
+                        for i in range(saved, length)
+                    ],
+                )
+
+    def replay(self, fretboard):
+        """Attaches the store to the fretboard, creating its profile on first use."""
+        if fretboard.profile is not None:
+            self.profile = fretboard.profile
+        fretboard.profile = self.profile
+        self.instrument = fretboard.instrument.name
+        try:
+            self.get_profile_id()
+        except KeyError:
+            self.write_state(fretboard)
+        fretboard.journal = self
+
+    def append(self, record):
+        with self.lock, self.conn:
+            profile_id = self.get_profile_id()
+            if record["type"] == "shift":
+                self.conn.execute(
+                    "UPDATE reviews SET review_date = date(review_date, ?) WHERE profile_id = ?",
+                    (f"+{record['days']} days", profile_id),
+                )
+                return
+
+            spot_state = record["state"]
+            self.conn.execute(
+                "UPDATE profiles SET new = 0, last_review_date = ? WHERE id = ?",
+                (record["date"], profile_id),
+            )
+            self.conn.execute(
+                "INSERT OR REPLACE INTO spots VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    profile_id, record["spot"], spot_state["status"], spot_state["interval"],
+                    spot_state["ease_factor"], spot_state["good_attempts"], json.dumps(spot_state["stats"]),
+                ),
+            )
+            if record["review_date"] is None:
+                self.conn.execute(
+                    "DELETE FROM reviews WHERE profile_id = ? AND spot = ?", (profile_id, record["spot"])
+                )
+            else:
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO reviews VALUES (?, ?, ?)",
+                    (profile_id, record["spot"], record["review_date"]),
+                )
+            if "attempt" in record:
+                timestamp, attempt_time, rating, status = record["attempt"]
+                self.conn.execute(
+                    "INSERT INTO attempts (profile_id, spot, timestamp, reaction_time, rating, status) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (profile_id, record["spot"], timestamp, attempt_time, RATING_CODES[rating], STATUS_CODES[status]),
+                )
+
+    def compact(self, fretboard):
+        self.write_state(fretboard)
+
+    def wait(self):
+        pass  # every change is committed before append returns
+
+    def checkpoint(self, state, history, live_history):
+        self.write_snapshot(state, history)
+
+    def close(self):
+        self.conn.close()
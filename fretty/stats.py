@@ -0,0 +1,102 @@
+import math
+
+from fretty.globals import *
+
+EWMA_ALPHA = 0.3
+
+# log-spaced reaction time buckets for the quantile sketch, in seconds
+SKETCH_MIN_TIME = 0.5
+SKETCH_MAX_TIME = 2 * FAIL_TIME
+SKETCH_BINS = 24
+SKETCH_LOG_RATIO = math.log(SKETCH_MAX_TIME / SKETCH_MIN_TIME)
+
+
+def get_bin(attempt_time):
+    if attempt_time <= SKETCH_MIN_TIME:
+        return 0
+    if attempt_time >= SKETCH_MAX_TIME:
+        return SKETCH_BINS - 1
+    return int(SKETCH_BINS * math.log(attempt_time / SKETCH_MIN_TIME) / SKETCH_LOG_RATIO)
+
+
+def get_bin_edge(i):
+    return SKETCH_MIN_TIME * math.exp(SKETCH_LOG_RATIO * i / SKETCH_BINS)
+
+
+def get_sketch_quantile(sketch, q):
+    """Approximate reaction time quantile, interpolated within a sketch bucket."""
+    total = sum(sketch)
+    if total == 0:
+        return None
+    target = q * total
+    seen = 0
+    for i, n in enumerate(sketch):
+        if n and seen + n >= target:
+            frac = (target - seen) / n
+            return get_bin_edge(i) + frac * (get_bin_edge(i + 1) - get_bin_edge(i))
+        seen += n
+    return get_bin_edge(SKETCH_BINS)
+
+
+class SpotStats:
+    """
+    Streaming performance aggregates for one spot, updated in O(1) per attempt.
+
+    Missed notes count as FAIL_TIME in the reaction time EWMA and sketch so
+    that they pull a spot towards the slow end.
+    """
+    __slots__ = ("count", "fails", "ewma", "sketch", "fail_streak", "last_seen")
+
+    def __init__(self, stats_state=None):
+        if stats_state is None:
+            self.count = 0
+            self.fails = 0
+            self.ewma = None
+            self.sketch = [0] * SKETCH_BINS
+            self.fail_streak = 0
+            self.last_seen = None
+        else:
+            self.set_state(stats_state)
+
+    def update(self, attempt_time, rating, day):
+        self.count += 1
+        self.last_seen = day
+        if rating == "fail":
+            self.fails += 1
+            self.fail_streak += 1
+        else:
+            self.fail_streak = 0
+
+        if attempt_time is None:
+            attempt_time = FAIL_TIME
+        if self.ewma is None:
+            self.ewma = attempt_time
+        else:
+            self.ewma += EWMA_ALPHA * (attempt_time - self.ewma)
+        self.sketch[get_bin(attempt_time)] += 1
+
+    def get_quantile(self, q):
+        return get_sketch_quantile(self.sketch, q)
+
+    def get_fail_rate(self):
+        if self.count == 0:
+            return None
+        return self.fails / self.count
+
+    def set_state(self, stats_state):
+        self.count = stats_state["count"]
+        self.fails = stats_state["fails"]
+        self.ewma = stats_state["ewma"]
+        self.sketch = list(stats_state["sketch"])
+        self.fail_streak = stats_state["fail_streak"]
+        self.last_seen = stats_state["last_seen"]
+
+    def get_state(self):
+        return {
+            "count": self.count,
+            "fails": self.fails,
+            "ewma": self.ewma,
+            "sketch": list(self.sketch),
+            "fail_streak": self.fail_streak,
+            "last_seen": self.last_seen,
+        }
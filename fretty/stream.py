@@ -0,0 +1,83 @@
+import time
+import threading
+
+import numpy as np
+
+RING_SECONDS = 2.0
+
+
+class AudioStream:
+    """
+    Continuous microphone capture into a ring buffer.
+
+    One input stream stays open for as long as it is needed, and its
+    callback copies each block into a fixed array. latest(n) hands out the
+    newest n samples at whatever rate the reader wants, so continuous
+    analysis never waits on a recording. read(duration) behaves like the
+    other audio sources, for listen(). subscribe() hands every block to
+    another consumer as well, such as a SessionRecorder, so they can share
+    one open device.
+    """
+    def __init__(self, sample_rate=None, seconds=RING_SECONDS):
+        self.sample_rate = sample_rate
+        self.seconds = seconds
+        self.buffer = None
+        self.frames = 0     # samples written since start()
+        self.lock = threading.Lock()
+        self.stream = None
+        self.subscribers = []   # replaced, never mutated, so the audio thread can iterate it unlocked
+
+    def start(self):
+        import sounddevice as sd
+
+        if self.sample_rate is None:
+            self.sample_rate = int(sd.query_devices(kind='input')['default_samplerate'])
+        self.buffer = np.zeros(int(self.seconds * self.sample_rate), dtype=np.float32)
+        self.frames = 0
+        self.stream = sd.InputStream(samplerate=self.sample_rate, channels=1, dtype="float32",
+                                     callback=self.on_audio)
+        self.stream.start()
+
+    def on_audio(self, block, n, time_info, status):
+        """Runs on the audio thread."""
+        self.write(block[:, 0])
+        for callback in self.subscribers:
+            callback(block, n, time_info, status)
+
+    def subscribe(self, callback):
+        """Calls callback(block, frames, time_info, status) on the audio thread for every block."""
+        self.subscribers = self.subscribers + [callback]
+
+    def unsubscribe(self, callback):
+        self.subscribers = [c for c in self.subscribers if c != callback]
+
+    def write(self, samples):
+        size = len(self.buffer)
+        with self.lock:
+            if len(samples) > size:
+                self.frames += len(samples) - size
+                samples = samples[-size:]
+            start = self.frames % size
+            end = start + len(samples)
+            if end <= size:
+                self.buffer[start:end] = samples
+            else:
+                self.buffer[start:] = samples[:size - start]
+                self.buffer[:end - size] = samples[size - start:]
+            self.frames += len(samples)
+
+    def latest(self, n):
+        """The newest n samples (at most the ring's length), zero-padded before the first block."""
+        with self.lock:
+            n = min(n, len(self.buffer))
+            return np.take(self.buffer, np.arange(self.frames - n, self.frames), mode='wrap')
+
+    def read(self, duration):
+        time.sleep(duration)
+        return self.latest(int(duration * self.sample_rate))
+
+    def close(self):
+        if self.stream is not None:
+            self.stream.stop()
+            self.stream.close()
+            self.stream = None
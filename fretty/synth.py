@@ -0,0 +1,229 @@
+"""
+Synthetic plucked-string corpus for testing the pitch detector.
+
+Renders every (string, fret) of an instrument, open string included, at
+many random variations of the string and the recording: inharmonicity,
+decay, detuning, pluck position, gain, mains hum and background noise.
+Each clip is a sum of damped partials plus a short noise burst for the
+pick attack. All the clips of a batch are rendered at once as rows of one
+array, and batches are spread across processes:
+
+    python -m fretty.synth --instrument bass --variations 50 --evaluate
+    python -m fretty.synth --instrument bass --variations 50 --evaluate --detector template
+    python -m fretty.synth --variations 5 --output corpus/
+"""
+import os
+import csv
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from fretty.notes import note_to_frequency, spot_to_note
+from fretty.instruments import INSTRUMENTS, get_instrument
+
+SAMPLE_RATE = 44100
+ATTACK_OFFSET = 0.1     # analysis windows start this far into a clip, past the attack
+MAX_PARTIALS = 24
+MAX_PARTIAL_FREQ = 8000
+ATTACK_DURATION = 0.005
+BATCH_SPOTS = 8         # spots rendered together by one worker
+
+# name -> (low, high) of the uniform range each variation is drawn from
+DEFAULT_RANGES = {
+    "detune_cents": (-20.0, 20.0),
+    "inharmonicity": (0.0, 2e-4),   # B in f_k = k f0 sqrt(1 + B k^2)
+    "decay": (0.8, 4.0),            # seconds for the fundamental to fall 60 dB
+    "brightness": (0.5, 2.0),       # how much faster high partials decay
+    "pluck_position": (0.08, 0.3),  # fraction of the string length from the bridge
+    "gain": (0.1, 0.9),
+    "attack": (0.0, 0.3),           # pick noise level relative to the gain
+    "hum": (0.0, 0.05),             # mains hum amplitude
+    "snr_db": (20.0, 50.0),
+}
+HUM_FREQS = (50.0, 60.0)
+
+LABEL_FIELDS = ["string", "fret", "note", "frequency"]
+
+
+def get_neck_spots(instrument, tuning=None):
+    """(string, fret, note) for every spot of the instrument, open strings included."""
+    tuning = tuning or instrument.tuning
+    return [
+        (s, f, spot_to_note((s, f), tuning))
+        for s in range(len(tuning)) for f in range(instrument.num_frets + 1)
+    ]
+
+
+def sample_variations(rng, n, ranges=None):
+    ranges = dict(DEFAULT_RANGES, **(ranges or {}))
+    params = {name: rng.uniform(low, high, n) for name, (low, high) in ranges.items()}
+    params["hum_freq"] = rng.choice(HUM_FREQS, n)
+    return params
+
+
+def render_plucks(f0, params, rng, duration, sample_rate=SAMPLE_RATE):
+    """
+    Renders one clip per row of `f0` (Hz) and `params` (arrays from
+    sample_variations) as a (clips, samples) float32 array.
+    """
+    n = len(f0)
+    t = np.arange(int(duration * sample_rate), dtype=np.float32) / sample_rate
+    col = lambda values: np.asarray(values, dtype=np.float32)[:, None]
+
+    f0 = col(f0 * 2 ** (params["detune_cents"] / 1200))
+    inharmonicity = col(params["inharmonicity"])
+    tau = col(params["decay"] / np.log(1000))
+    brightness = col(params["brightness"])
+    pluck_position = col(params["pluck_position"])
+
+    clips = np.zeros((n, len(t)), dtype=np.float32)
+    phases = rng.uniform(0, 2 * np.pi, (n, MAX_PARTIALS)).astype(np.float32)
+    for k in range(1, MAX_PARTIALS + 1):
+        fk = k * f0 * np.sqrt(1 + inharmonicity * k ** 2)
+        # an ideal pluck excites partial k in proportion to sin(k pi p) / k^2
+        amp = np.abs(np.sin(k * np.pi * pluck_position)) / k ** 2
+        amp = np.where(fk < min(MAX_PARTIAL_FREQ, sample_rate / 2), amp, 0)
+        tau_k = tau / (1 + brightness * (k - 1) / 4)
+        clips += amp * np.exp(-t / tau_k) * np.sin(2 * np.pi * fk * t + phases[:, k - 1:k])
+
+    clips /= np.abs(clips).max(axis=1, keepdims=True)
+    attack = rng.standard_normal(clips.shape).astype(np.float32) * np.exp(-t / ATTACK_DURATION)
+    clips += col(params["attack"]) * attack
+    clips *= col(params["gain"])
+
+    hum_freq = col(params["hum_freq"])
+    clips += col(params["hum"]) * (np.sin(2 * np.pi * hum_freq * t) + 0.3 * np.sin(6 * np.pi * hum_freq * t))
+
+    rms = np.sqrt(np.mean(clips ** 2, axis=1, keepdims=True))
+    noise_rms = rms / col(10 ** (params["snr_db"] / 20))
+    clips += noise_rms * rng.standard_normal(clips.shape).astype(np.float32)
+    return np.clip(clips, -1, 1)
+
+
+def render_batch(args):
+    """Worker: renders `variations` clips of each spot in `spots`. Returns (clips, labels)."""
+    spots, variations, duration, ranges, seed, sample_rate = args
+    rng = np.random.default_rng(seed)
+    labels = [
+        {"string": s, "fret": f, "note": note, "frequency": note_to_frequency[note]}
+        for s, f, note in spots for _ in range(variations)
+    ]
+    f0 = np.array([label["frequency"] for label in labels])
+    params = sample_variations(rng, len(labels), ranges)
+    clips = render_plucks(f0, params, rng, duration, sample_rate)
+    for i, label in enumerate(labels):
+        label.update({name: float(values[i]) for name, values in params.items()})
+    return clips, labels
+
+
+def get_clip_duration(instrument, tuning=None):
+    """Long enough for one listen window after the attack."""
+    return ATTACK_OFFSET + instrument.get_segment_duration(tuning) + 0.05
+
+
+def iter_corpus(instrument=None, variations=20, duration=None, ranges=None, processes=None, seed=0,
+                sample_rate=SAMPLE_RATE, tuning=None):
+    """Yields (clips, labels) batches covering the whole neck, rendered across processes."""
+    instrument = get_instrument(instrument)
+    duration = duration or get_clip_duration(instrument, tuning)
+    spots = get_neck_spots(instrument, tuning)
+    batches = [spots[i:i + BATCH_SPOTS] for i in range(0, len(spots), BATCH_SPOTS)]
+    seeds = np.random.SeedSequence(seed).generate_state(len(batches))
+    jobs = [(batch, variations, duration, ranges, int(s), sample_rate) for batch, s in zip(batches, seeds)]
+    if processes == 1:
+        yield from map(render_batch, jobs)
+        return
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        yield from pool.map(render_batch, jobs)
+
+
+def generate_corpus(instrument=None, variations=20, **kwargs):
+    """Returns every clip as one (clips, samples) array, with a label dict per row."""
+    all_clips, all_labels = [], []
+    for clips, labels in iter_corpus(instrument, variations, **kwargs):
+        all_clips.append(clips)
+        all_labels += labels
+    return np.concatenate(all_clips), all_labels
+
+
+def write_corpus(dirpath, clips, labels, sample_rate=SAMPLE_RATE):
+    """Writes each clip as 16-bit wav and the labels (and variation params) to labels.csv."""
+    from scipy.io import wavfile
+
+    os.makedirs(dirpath, exist_ok=True)
+    fieldnames = ["filename"] + LABEL_FIELDS + [name for name in labels[0] if name not in LABEL_FIELDS]
+    with open(os.path.join(dirpath, "labels.csv"), 'w', newline='') as file:
+        writer = csv.DictWriter(file, fieldnames=fieldnames)
+        writer.writeheader()
+        for i, (clip, label) in enumerate(zip(clips, labels)):
+            filename = f"{label['note']}_{label['string']}_{label['fret']}_{i:05d}.wav"
+            wavfile.write(os.path.join(dirpath, filename), sample_rate, (clip * 32767).astype(np.int16))
+            writer.writerow(dict(label, filename=filename))
+
+
+def evaluate(clips, labels, instrument=None, sample_rate=SAMPLE_RATE, tuning=None, detector=None, batch_size=128):
+    """
+    Runs `detector` (a name from fretty.audio.DETECTORS, by default the
+    instrument's) on one listen window of every clip, `batch_size` windows
+    at a time. Returns the detected note per clip and the time spent
+    detecting.
+    """
+    from fretty.audio import analyse_batch
+
+    instrument = get_instrument(instrument)
+    detector = detector or instrument.detector
+    start = int(ATTACK_OFFSET * sample_rate)
+    window = int(instrument.get_segment_duration(tuning) * sample_rate)
+    detected = []
+    detect_start = time.perf_counter()
+    for i in range(0, len(clips), batch_size):
+        detected += analyse_batch(clips[i:i + batch_size, start:start + window], sample_rate, instrument, detector)
+    return detected, time.perf_counter() - detect_start
+
+
+def summarise(labels, detected, key="fret"):
+    """Accuracy overall, and per value of label[key]."""
+    hits = {}
+    for label, note in zip(labels, detected):
+        hits.setdefault(label[key], []).append(note == label["note"])
+    overall = sum(sum(h) for h in hits.values()) / len(labels)
+    return overall, {value: sum(h) / len(h) for value, h in sorted(hits.items())}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Render a synthetic plucked-string corpus.")
+    parser.add_argument("--instrument", choices=list(INSTRUMENTS), default=None)
+    parser.add_argument("--variations", type=int, default=20, help="clips per (string, fret)")
+    parser.add_argument("--duration", type=float, default=None, help="clip length in seconds")
+    parser.add_argument("--processes", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=None, help="write wav files and labels.csv to this directory")
+    parser.add_argument("--evaluate", action="store_true", help="run the detector on every clip")
+    parser.add_argument("--detector", choices=["gcd", "template"], default=None,
+                        help="detector to evaluate, by default the instrument's")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    clips, labels = generate_corpus(args.instrument, args.variations, duration=args.duration,
+                                    processes=args.processes, seed=args.seed)
+    elapsed = time.perf_counter() - start
+    audio_seconds = clips.shape[0] * clips.shape[1] / SAMPLE_RATE
+    print(f"{len(labels)} clips ({audio_seconds:.0f}s of audio) in {elapsed:.1f}s")
+
+    if args.output is not None:
+        write_corpus(args.output, clips, labels)
+        print(f"written to {args.output}")
+
+    if args.evaluate:
+        detected, detect_time = evaluate(clips, labels, args.instrument, detector=args.detector)
+        overall, by_fret = summarise(labels, detected)
+        _, by_string = summarise(labels, detected, key="string")
+        print(f"accuracy {100 * overall:.1f}%, {1000 * detect_time / len(labels):.2f}ms per window")
+        print("by fret:   " + "  ".join(f"{f}:{100 * a:.0f}%" for f, a in by_fret.items()))
+        print("by string: " + "  ".join(f"{s}:{100 * a:.0f}%" for s, a in by_string.items()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""
+Spectral template matching: scores every candidate note against a window at once.
+
+Each note gets a harmonic comb over the rfft bins of the detector band,
+with a Gaussian tooth at every harmonic, weighted down for higher ones,
+and negative teeth halfway between harmonics so the octave above a note
+(whose comb covers only every other harmonic) scores below it. The
+comb rows, normalised, form a (notes, bins) matrix. The magnitude
+spectrum of one window is then scored against every note with a single
+matrix-vector product, and a stack of windows with a single
+matrix-matrix product. Mains hum (50/60 Hz and its harmonics) is
+projected out of the templates, so a hum peak scores nothing for the
+notes it lands near.
+"""
+import numpy as np
+
+from fretty.notes import note_to_frequency
+
+HARMONICS = 12
+HARMONIC_DECAY = 0.8        # weight of harmonic h is h ** -HARMONIC_DECAY
+HALF_HARMONIC_WEIGHT = 0.5  # weight of the negative teeth between harmonics
+TOOTH_CENTS = 25            # tooth width (standard deviation), widened to at least one bin
+MIN_CONFIDENCE = 0.05       # (best - runner-up) / best below this is no note
+MIN_RMS = 1e-3              # quieter windows are silence
+HUM_FREQS = (50.0, 60.0)
+HUM_HARMONICS = 5
+
+_classifiers = {}
+
+
+def get_candidate_notes(lowest_freq, highest_freq):
+    return [note for note, freq in note_to_frequency.items() if lowest_freq <= freq <= highest_freq]
+
+
+def get_comb(freqs, centres, weights, bin_width):
+    """Sum of Gaussian teeth at `centres` over `freqs`."""
+    sigma = np.maximum(centres * (2 ** (TOOTH_CENTS / 1200) - 1), bin_width)
+    teeth = np.exp(-0.5 * ((freqs[None, :] - centres[:, None]) / sigma[:, None]) ** 2)
+    return weights @ teeth
+
+
+def get_hum_basis(freqs, bin_width):
+    """Orthonormal columns spanning single-bin teeth at the hum frequencies inside the band, or None."""
+    centres = np.array([f * h for f in HUM_FREQS for h in range(1, HUM_HARMONICS + 1)])
+    centres = centres[(centres >= freqs[0]) & (centres <= freqs[-1])]
+    if len(centres) == 0:
+        return None
+    teeth = np.exp(-0.5 * ((freqs[:, None] - centres[None, :]) / bin_width) ** 2)
+    return np.linalg.qr(teeth)[0]
+
+
+class TemplateClassifier:
+    """
+    Note classifier for windows of `window_length` samples at `sample_rate`.
+
+    classify(segment) returns (note, confidence) for one window and
+    classify_batch(segments) does the same for a (windows, samples) stack;
+    note is None when the window is silent or no note wins by MIN_CONFIDENCE.
+    """
+    def __init__(self, sample_rate, window_length, lowest_freq, highest_freq, notes=None):
+        self.sample_rate = sample_rate
+        self.window_length = window_length
+        self.notes = notes or get_candidate_notes(lowest_freq, highest_freq)
+
+        freqs = np.fft.rfftfreq(window_length, 1 / sample_rate)
+        self.band = np.flatnonzero((freqs >= lowest_freq) & (freqs <= highest_freq))
+        band_freqs = freqs[self.band]
+        bin_width = sample_rate / window_length
+
+        templates = np.zeros((len(self.notes), len(self.band)))
+        for i, note in enumerate(self.notes):
+            f0 = note_to_frequency[note]
+            h = np.arange(1, HARMONICS + 1)
+            h = h[h * f0 <= highest_freq]
+            weights = h ** -HARMONIC_DECAY
+            half = h[(h + 0.5) * f0 <= highest_freq]
+            templates[i] = get_comb(band_freqs, h * f0, weights, bin_width)
+            templates[i] -= HALF_HARMONIC_WEIGHT * get_comb(band_freqs, (half + 0.5) * f0,
+                                                            half ** -HARMONIC_DECAY, bin_width)
+        hum = get_hum_basis(band_freqs, bin_width)
+        if hum is not None:
+            templates -= (templates @ hum) @ hum.T
+        templates /= np.linalg.norm(templates, axis=1, keepdims=True)
+        self.templates = templates.astype(np.float32)
+        self.window = np.hanning(window_length).astype(np.float32)
+
+    def get_spectra(self, segments):
+        """Band-limited, unit-norm magnitude spectra of a (windows, samples) stack."""
+        spectra = np.abs(np.fft.rfft(segments * self.window, axis=-1))[..., self.band].astype(np.float32)
+        norms = np.linalg.norm(spectra, axis=-1, keepdims=True)
+        return spectra / np.maximum(norms, 1e-12)
+
+    def score(self, segments):
+        """Scores of every note for every window: (windows, notes)."""
+        return self.get_spectra(segments) @ self.templates.T
+
+    def classify_batch(self, segments):
+        segments = np.asarray(segments, dtype=np.float32)
+        scores = self.score(segments)
+        top2 = np.partition(scores, -2, axis=1)[:, -2:]
+        best = np.argmax(scores, axis=1)
+        best_score = top2[:, 1]
+        confidence = np.where(best_score > 0, (best_score - top2[:, 0]) / np.maximum(best_score, 1e-12), 0)
+
+        loud = np.sqrt(np.mean(segments ** 2, axis=1)) >= MIN_RMS
+        notes = [
+            self.notes[i] if ok and c >= MIN_CONFIDENCE else None
+            for i, ok, c in zip(best, loud, confidence)
+        ]
+        return notes, confidence
+
+    def classify(self, segment):
+        notes, confidence = self.classify_batch(np.asarray(segment)[None, :])
+        return notes[0], float(confidence[0])
+
+
+def get_classifier(sample_rate, window_length, lowest_freq, highest_freq):
+    """Classifiers are cached, since building the template matrix costs far more than using it."""
+    key = (sample_rate, window_length, lowest_freq, highest_freq)
+    classifier = _classifiers.get(key, None)
+    if classifier is None:
+        classifier = TemplateClassifier(sample_rate, window_length, lowest_freq, highest_freq)
+        _classifiers[key] = classifier
+    return classifier
+
+
+def classify_segment(segment, sample_rate, lowest_freq, highest_freq):
+    """The detected note in one window, or None."""
+    return get_classifier(sample_rate, len(segment), lowest_freq, highest_freq).classify(segment)[0]
@@ -1,11 +1,20 @@
 import curses
+import json
+import os
 
 def restyle_region(stdscr, x, y, width, style, marker=False):
     if marker:
         stdscr.addstr(y, x, " ● ", style)
     else:
-        for i in range(width):
-            ch = stdscr.inch(y, x + i)
-            char = chr(ch & curses.A_CHARTEXT)
-            stdscr.addch(y, x + i, char, style)
+        stdscr.chgat(y, x, width, style)
 
+
+
+def atomic_write_json(filepath, obj):
+    """Writes json to a temp file next to `filepath` and renames it into place."""
+    tmp_filepath = f"{filepath}.tmp"
+    with open(tmp_filepath, 'w') as file:
+        json.dump(obj, file)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(tmp_filepath, filepath)
@@ -0,0 +1,138 @@
+import time
+import threading
+
+import numpy as np
+
+STREAM_TIMEOUT = 5.0    # longest a page waits for the warm-up to open the capture stream
+
+_timeline = None
+
+
+def log_startup(label):
+    """Adds `label` to the startup timeline, if one is being kept."""
+    if _timeline is not None:
+        _timeline.log(label)
+
+
+class StartupTimeline:
+    """
+    When each startup step finished, in seconds since the timeline was
+    created, and on which thread. write() saves it as text, one step a line.
+    """
+    def __init__(self, filepath):
+        global _timeline
+        _timeline = self
+        self.filepath = filepath
+        self.start_time = time.perf_counter()
+        self.entries = []
+        self.lock = threading.Lock()
+
+    def log(self, label):
+        with self.lock:
+            self.entries.append((time.perf_counter() - self.start_time, threading.current_thread().name, label))
+
+    def write(self):
+        with self.lock:
+            lines = [f"{t:8.3f}s  {thread:<12} {label}\n" for t, thread, label in self.entries]
+        with open(self.filepath, 'w') as file:
+            file.writelines(lines)
+
+
+class Warmup:
+    """
+    Gets the audio path ready on a background thread while the main menu
+    is up, so that the first attempt of a lesson runs as fast as the rest.
+
+    It opens the capture stream and holds it for the pages (see
+    get_stream), so no listen pays for opening the device. It runs the
+    detector on a listen window of silence, which sets up the FFT for that
+    window length and builds the template matrix. It also loads the note
+    glyphs. Each step goes on the startup timeline.
+    """
+    def __init__(self, fretboard, detector=None):
+        self.fretboard = fretboard
+        self.detector = detector
+        self.stream = None
+        self.stream_ready = threading.Event()
+        self.done = threading.Event()
+        self.thread = None
+        self.lock = threading.Lock()
+        self.closed = False
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name="warmup", daemon=True)
+        self.thread.start()
+
+    def run(self):
+        log_startup("warmup started")
+        try:
+            if self.open_stream():
+                self.warm_detector()
+                self.load_glyphs()
+        finally:
+            # every step logs its own failure; the pages fall back to doing the work themselves
+            self.stream_ready.set()
+            self.done.set()
+
+    def open_stream(self):
+        """Returns False if the user quit while the device was opening."""
+        try:
+            from fretty.stream import AudioStream
+
+            stream = AudioStream()
+            stream.start()
+            with self.lock:
+                closed = self.closed
+                if not closed:
+                    self.stream = stream
+            if closed:
+                stream.close()
+                log_startup("capture stream closed, quit before it opened")
+                return False
+            log_startup(f"capture stream open at {stream.sample_rate} Hz")
+        except Exception as e:
+            log_startup(f"capture stream failed, pages will open their own: {e}")
+        finally:
+            self.stream_ready.set()
+        return True
+
+    def warm_detector(self):
+        try:
+            from fretty.audio import analyse_batch, get_input_device
+
+            stream = self.stream
+            sample_rate = stream.sample_rate if stream is not None else get_input_device()[1]
+            instrument = self.fretboard.instrument
+            window = int(instrument.get_segment_duration(self.fretboard.tuning) * sample_rate)
+            silence = np.zeros((1, window), dtype=np.float32)
+            analyse_batch(silence, sample_rate, instrument, self.detector or instrument.detector)
+            log_startup("detector warm")
+        except Exception as e:
+            log_startup(f"detector not warmed: {e}")
+
+    def load_glyphs(self):
+        try:
+            from fretty.glyphs import load_glyphs
+
+            load_glyphs()
+            log_startup("glyphs loaded")
+        except Exception as e:
+            log_startup(f"glyphs not loaded: {e}")
+
+    def get_stream(self):
+        """The held capture stream, or None if it could not be opened."""
+        self.stream_ready.wait(STREAM_TIMEOUT)
+        return self.stream
+
+    def close(self):
+        """
+        Closes the held stream. If the device is still opening after
+        STREAM_TIMEOUT, the warm-up thread closes the stream once it opens.
+        """
+        if self.thread is not None:
+            self.stream_ready.wait(STREAM_TIMEOUT)
+        with self.lock:
+            self.closed = True
+            stream, self.stream = self.stream, None
+        if stream is not None:
+            stream.close()